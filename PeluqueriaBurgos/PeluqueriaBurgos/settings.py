@@ -86,6 +86,49 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# Las plantillas y agendas compiladas se cachean en cada proceso y se
+# invalidan con versiones guardadas aquí. Con varios procesos (gunicorn,
+# uWSGI...) usar una caché compartida (Redis, Memcached) para que la
+# invalidación llegue a todos; con LocMemCache y DEBUG desactivado
+# `manage.py check` avisa (Principal.W001). Aun así, lo compilado en cada
+# proceso no dura más de DISPONIBILIDAD_MAX_DESFASE segundos.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+
+DISPONIBILIDAD_MAX_DESFASE = 5 * 60
+
+
+# Límite de peticiones por usuario (o IP) y grupo: (peticiones, segundos).
+# Ver Principal.limites.
+
+LIMITES_PETICIONES = {
+    "api": (120, 60),
+    "api_publica": (300, 60),
+    "login": (10, 300),
+}
+
+# Motor de búsqueda de clientes (ruta de la clase). None = FTS5 con SQLite,
+# búsqueda por prefijo con el ORM con otra base de datos. Ver Principal.busqueda.
+
+BUSQUEDA_BACKEND = None
+
+
+# Correo (recordatorios de citas, enviados por `manage.py procesar_tareas`).
+# En desarrollo se escriben en la consola; en producción usar
+# django.core.mail.backends.smtp.EmailBackend con EMAIL_HOST, EMAIL_PORT...
+
+EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+DEFAULT_FROM_EMAIL = "Peluquería Burgos <no-responder@localhost>"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
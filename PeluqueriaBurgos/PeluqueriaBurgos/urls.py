@@ -19,43 +19,25 @@ from django.contrib.auth import views as auth_views
 from django.urls import path
 
 from Principal import views
+from Principal.limites import limitar
+
+# Una sola vista de login para todas sus rutas, con límite de intentos
+# (cada POST pasa por el hasher de contraseñas, que es caro a propósito).
+login_view = limitar("login", metodos=("POST",), json=False)(
+    auth_views.LoginView.as_view(
+        template_name="registration/login.html",
+        redirect_authenticated_user=True,
+    )
+)
 
 urlpatterns = [
     # Landing: login en la raíz
-    path(
-        "",
-        auth_views.LoginView.as_view(
-            template_name="registration/login.html",
-            redirect_authenticated_user=True,
-        ),
-        name="login",
-    ),
+    path("", login_view, name="login"),
     # Alias de login (por si lo necesitas explícito)
-    path(
-        "login/",
-        auth_views.LoginView.as_view(
-            template_name="registration/login.html",
-            redirect_authenticated_user=True,
-        ),
-        name="login_alt",
-    ),
-    path(
-        "accounts/login/",
-        auth_views.LoginView.as_view(
-            template_name="registration/login.html",
-            redirect_authenticated_user=True,
-        ),
-        name="login_accounts",
-    ),
+    path("login/", login_view, name="login_alt"),
+    path("accounts/login/", login_view, name="login_accounts"),
     # Por compatibilidad con tu URL escrita: /LoginView/
-    path(
-        "LoginView/",
-        auth_views.LoginView.as_view(
-            template_name="registration/login.html",
-            redirect_authenticated_user=True,
-        ),
-        name="login_view",
-    ),
+    path("LoginView/", login_view, name="login_view"),
 
     # Página principal (requiere login)
     path("inicio/", views.principal, name="home"),
@@ -79,6 +61,58 @@ urlpatterns = [
         views.api_horas_disponibles,
         name="api_horas_disponibles",
     ),
+    path(
+        "api/horas-disponibles/lote/",
+        views.api_horas_disponibles_lote,
+        name="api_horas_disponibles_lote",
+    ),
+    path(
+        "api/reserva-inicial/",
+        views.api_reserva_inicial,
+        name="api_reserva_inicial",
+    ),
+    path(
+        "api/proxima-cita/",
+        views.api_proxima_cita,
+        name="api_proxima_cita",
+    ),
+    path(
+        "api/retener-hora/",
+        views.api_retener_hora,
+        name="api_retener_hora",
+    ),
+    path(
+        "api/liberar-hora/",
+        views.api_liberar_hora,
+        name="api_liberar_hora",
+    ),
+    path(
+        "api/recepcion/buscar/",
+        views.api_recepcion_buscar,
+        name="api_recepcion_buscar",
+    ),
+    path(
+        "api/cambios/",
+        views.api_cambios,
+        name="api_cambios",
+    ),
+
+    # API pública de disponibilidad (sin sesión, cacheable por un proxy)
+    path(
+        "api/publica/peluqueros/",
+        views.api_publica_peluqueros,
+        name="api_publica_peluqueros",
+    ),
+    path(
+        "api/publica/horas/",
+        views.api_publica_horas,
+        name="api_publica_horas",
+    ),
+    path(
+        "api/publica/densidad/",
+        views.api_publica_densidad,
+        name="api_publica_densidad",
+    ),
 
     # Logout (volver siempre al login)
     path(
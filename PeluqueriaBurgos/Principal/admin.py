@@ -1,22 +1,38 @@
-from datetime import date
+import csv
+from datetime import date, timedelta
 
 from django import forms
 from django.contrib import admin, messages
-from django.contrib.admin.widgets import FilteredSelectMultiple
-from django.db.models import Q
+from django.contrib.admin import helpers
+from django.contrib.admin.widgets import AutocompleteSelectMultiple
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import IntegrityError
+from django.db.models import Q, Value
+from django.http import HttpResponse
 from django.shortcuts import redirect, render
-from django.urls import path
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
 
+from Principal import archivo, busqueda, cambios, disponibilidad
+from Principal.informes import calcular_ocupacion
+from Principal.reubicacion import confirmar_reubicaciones, marcar_ausencia, proponer_reubicaciones
 from Principal.models import (
     APERTURA,
     CIERRE,
     COMIDA_FIN,
     COMIDA_INICIO,
+    Cambio,
     Cita,
+    CitaHistorica,
     Cliente,
+    DiaEspecial,
     HorarioPeluquero,
     Peluqueros,
+    ResumenDiario,
     Servicio,
+    Tarea,
     TurnoPeluquero,
 )
 
@@ -36,9 +52,11 @@ class BulkTurnosPorFechasForm(forms.Form):
     Guarda 1 fila por peluquero (no crea slots), así no carga la BD.
     """
 
+    # Los peluqueros se buscan al escribir (autocompletado del admin), sin
+    # volcarlos todos en el HTML
     peluqueros = forms.ModelMultipleChoiceField(
         queryset=Peluqueros.objects.all().order_by("nombre", "apellido"),
-        widget=FilteredSelectMultiple("Peluqueros", is_stacked=False),
+        widget=AutocompleteSelectMultiple(TurnoPeluquero._meta.get_field("peluquero"), admin.site),
     )
 
     fecha_inicio = forms.DateField(
@@ -74,11 +92,44 @@ class BulkTurnosPorFechasForm(forms.Form):
         return cleaned
 
 
+class InformeOcupacionForm(forms.Form):
+    desde = forms.DateField(label="Desde", widget=forms.DateInput(attrs={"type": "date"}))
+    hasta = forms.DateField(label="Hasta", widget=forms.DateInput(attrs={"type": "date"}))
+
+    MAX_DIAS = 731
+
+    def clean(self):
+        cleaned = super().clean()
+        desde: date | None = cleaned.get("desde")
+        hasta: date | None = cleaned.get("hasta")
+        if desde and hasta:
+            if hasta < desde:
+                raise forms.ValidationError("La fecha hasta no puede ser anterior a la fecha desde.")
+            if (hasta - desde).days >= self.MAX_DIAS:
+                raise forms.ValidationError("El rango no puede superar los dos años.")
+        return cleaned
+
+
+class AusenciaForm(forms.Form):
+    fecha_inicio = forms.DateField(label="Fecha inicio", widget=forms.DateInput(attrs={"type": "date"}))
+    fecha_fin = forms.DateField(label="Fecha fin", widget=forms.DateInput(attrs={"type": "date"}))
+
+    def clean(self):
+        cleaned = super().clean()
+        fi: date | None = cleaned.get("fecha_inicio")
+        ff: date | None = cleaned.get("fecha_fin")
+        if fi and ff and ff < fi:
+            raise forms.ValidationError("La fecha fin no puede ser anterior a la fecha inicio.")
+        return cleaned
+
+
 @admin.register(Peluqueros)
 class PeluquerosAdmin(admin.ModelAdmin):
     list_display = ("nombre", "apellido")
     search_fields = ("nombre", "apellido")
+    ordering = ("nombre", "apellido")
     change_list_template = "admin/principal/peluqueros/change_list.html"
+    actions = ["marcar_ausencia"]
 
     def get_urls(self):
         urls = super().get_urls()
@@ -87,10 +138,102 @@ class PeluquerosAdmin(admin.ModelAdmin):
                 "bulk-horarios/",
                 self.admin_site.admin_view(self.bulk_horarios_view),
                 name="principal_peluqueros_bulk_horarios",
-            )
+            ),
+            path(
+                "informe-ocupacion/",
+                self.admin_site.admin_view(self.informe_ocupacion_view),
+                name="principal_peluqueros_informe_ocupacion",
+            ),
+            path(
+                "reubicar-citas/",
+                self.admin_site.admin_view(self.reubicar_citas_view),
+                name="principal_peluqueros_reubicar_citas",
+            ),
         ]
         return custom + urls
 
+    @admin.action(description="Marcar ausencia y reubicar sus citas")
+    def marcar_ausencia(self, request, queryset):
+        """Primero pide las fechas; al aplicarlas cancela y propone huecos nuevos."""
+        peluqueros = list(queryset.order_by("nombre", "apellido"))
+        form = AusenciaForm(request.POST if "aplicar" in request.POST else None)
+
+        if form.is_valid():
+            fi = form.cleaned_data["fecha_inicio"]
+            ff = form.cleaned_data["fecha_fin"]
+            citas = marcar_ausencia(peluqueros, fi, ff)
+            propuestas = proponer_reubicaciones(citas, excluidos={p.pk for p in peluqueros})
+
+            nombres = {p.pk: str(p) for p in Peluqueros.objects.filter(pk__in={v[0] for v in propuestas.values() if v})}
+            filas = []
+            for cita in citas:
+                propuesta = propuestas.get(cita.pk)
+                fila = {"cita": cita, "propuesta": None}
+                if propuesta:
+                    pid, fecha, hora = propuesta
+                    fila["propuesta"] = {
+                        "peluquero": nombres[pid],
+                        "fecha": fecha,
+                        "hora": hora,
+                        "valor": f"{cita.pk}|{pid}|{fecha.isoformat()}|{hora:%H:%M}",
+                    }
+                filas.append(fila)
+
+            messages.success(
+                request,
+                f"Ausencia registrada del {fi:%d/%m/%Y} al {ff:%d/%m/%Y}. Citas canceladas: {len(citas)}.",
+            )
+            context = {
+                **self.admin_site.each_context(request),
+                "title": "Reubicar citas canceladas",
+                "filas": filas,
+                "con_propuesta": sum(1 for f in filas if f["propuesta"]),
+                "opts": self.model._meta,
+            }
+            return render(request, "admin/principal/peluqueros/reubicaciones.html", context)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Marcar ausencia",
+            "form": form,
+            "peluqueros": peluqueros,
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+            "opts": self.model._meta,
+        }
+        return render(request, "admin/principal/peluqueros/ausencia.html", context)
+
+    def reubicar_citas_view(self, request):
+        if request.method != "POST":
+            return redirect("..")
+
+        elegidas = []
+        for valor in request.POST.getlist("reubicar"):
+            try:
+                pk, pid, fecha, hora = valor.split("|")
+                elegidas.append((int(pk), int(pid), parse_date(fecha), parse_time(hora)))
+            except (TypeError, ValueError):
+                continue
+        citas = Cita.objects.select_related("servicio").in_bulk([e[0] for e in elegidas])
+        propuestas = [
+            (citas[pk], pid, fecha, hora)
+            for pk, pid, fecha, hora in elegidas
+            if pk in citas and fecha and hora
+        ]
+
+        if not propuestas:
+            messages.warning(request, "No se ha elegido ninguna reubicación.")
+        else:
+            try:
+                nuevas = confirmar_reubicaciones(propuestas)
+            except ValueError as e:
+                messages.error(request, f"No se ha reubicado ninguna cita: {e}")
+            except IntegrityError:
+                # Otra cita ha ocupado uno de los huecos entre la comprobación y el alta
+                messages.error(request, "No se ha reubicado ninguna cita: alguno de los huecos ya no está libre.")
+            else:
+                messages.success(request, f"Citas reubicadas: {len(nuevas)}.")
+        return redirect("admin:Principal_cita_changelist")
+
     def bulk_horarios_view(self, request):
         # Mantengo la URL /bulk-horarios/ por compatibilidad, pero ahora es por fechas.
         if request.method == "POST":
@@ -121,6 +264,9 @@ class PeluquerosAdmin(admin.ModelAdmin):
                         for p in peluqueros
                     ]
                     TurnoPeluquero.objects.bulk_create(to_create)
+                    # bulk_create no lanza señales
+                    disponibilidad.invalidar("turnos", *(p.id for p in peluqueros))
+                    cambios.registrar(Cambio.Accion.ALTA, to_create)
                     messages.success(
                         request,
                         f"Turnos asignados por fechas. Borrados (solape): {borrados}. Creados: {len(to_create)}.",
@@ -133,6 +279,7 @@ class PeluquerosAdmin(admin.ModelAdmin):
                     fecha_fin=ff,
                     turno=turno,
                 )
+                actualizados_ids = list(exactos_qs.exclude(activo=activo).values_list("pk", flat=True))
                 updated = exactos_qs.update(activo=activo)
 
                 existentes_ids = set(exactos_qs.values_list("peluquero_id", flat=True))
@@ -149,6 +296,10 @@ class PeluquerosAdmin(admin.ModelAdmin):
                 ]
                 if to_create:
                     TurnoPeluquero.objects.bulk_create(to_create)
+                # update() y bulk_create no lanzan señales
+                disponibilidad.invalidar("turnos", *(p.id for p in peluqueros))
+                cambios.registrar_ids(TurnoPeluquero, Cambio.Accion.MODIFICACION, actualizados_ids)
+                cambios.registrar(Cambio.Accion.ALTA, to_create)
 
                 messages.success(
                     request,
@@ -162,22 +313,56 @@ class PeluquerosAdmin(admin.ModelAdmin):
             **self.admin_site.each_context(request),
             "title": "Asignar turnos por fechas",
             "form": form,
+            "media": self.media + form.media,
             "opts": self.model._meta,
         }
         return render(request, "admin/principal/peluqueros/bulk_horarios.html", context)
 
+    def informe_ocupacion_view(self, request):
+        hoy = timezone.localdate()
+        if request.GET:
+            form = InformeOcupacionForm(request.GET)
+        else:
+            form = InformeOcupacionForm({"desde": hoy - timedelta(days=30), "hasta": hoy})
+
+        informe = None
+        if form.is_valid():
+            informe = calcular_ocupacion(form.cleaned_data["desde"], form.cleaned_data["hasta"])
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Informe de ocupación",
+            "form": form,
+            "informe": informe,
+            "opts": self.model._meta,
+        }
+        return render(request, "admin/principal/peluqueros/informe_ocupacion.html", context)
+
 
 @admin.register(Servicio)
 class ServicioAdmin(admin.ModelAdmin):
     list_display = ("nombre", "duracion_minutos", "precio", "activo")
     list_filter = ("activo",)
     search_fields = ("nombre",)
+    ordering = ("nombre",)
 
 
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
     list_display = ("nombre", "apellido", "email", "telefono")
-    search_fields = ("nombre", "apellido", "email", "telefono")
+    # Búsqueda por prefijo: usa los índices NOCASE de Cliente. También la usa
+    # el autocompletado de cliente en las citas.
+    search_fields = ("^nombre", "^apellido", "^telefono", "^email")
+    ordering = ("apellido", "nombre", "pk")
+    autocomplete_fields = ("user",)
+    # Con muchos clientes el COUNT(*) de la tabla entera en cada búsqueda sobra
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # search_fields solo activa la caja de búsqueda: se busca en el índice
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(busqueda.backend().filtro(search_term)), False
 
 
 class HorarioPeluqueroBulkAddForm(forms.ModelForm):
@@ -230,6 +415,8 @@ class HorarioPeluqueroAdmin(admin.ModelAdmin):
     list_display = ("peluquero", "dia_semana", "hora_inicio", "hora_fin", "activo")
     list_filter = ("peluquero", "dia_semana", "activo")
     ordering = ("peluquero", "dia_semana", "hora_inicio")
+    autocomplete_fields = ("peluquero",)
+    list_select_related = ("peluquero",)
 
     def get_form(self, request, obj=None, **kwargs):
         # En 'add' usamos el formulario con multiselección.
@@ -290,12 +477,111 @@ class TurnoPeluqueroAdmin(admin.ModelAdmin):
     list_filter = ("turno", "activo")
     search_fields = ("peluquero__nombre", "peluquero__apellido")
     ordering = ("-fecha_inicio", "peluquero")
+    autocomplete_fields = ("peluquero",)
+    list_select_related = ("peluquero",)
+
+
+@admin.register(DiaEspecial)
+class DiaEspecialAdmin(admin.ModelAdmin):
+    list_display = ("fecha_inicio", "fecha_fin", "tipo", "hora_apertura", "hora_cierre", "descripcion", "activo")
+    list_filter = ("tipo", "activo")
+    search_fields = ("descripcion",)
+    ordering = ("-fecha_inicio",)
 
 
 @admin.register(Cita)
 class CitaAdmin(admin.ModelAdmin):
-    list_display = ("fecha", "hora", "cliente", "peluquero", "servicio", "estado")
+    list_display = ("fecha", "hora", "hora_fin", "cliente", "peluquero", "servicio", "estado")
+    readonly_fields = ("duracion_minutos", "hora_fin")
     list_filter = ("estado", "fecha", "peluquero", "servicio")
+    autocomplete_fields = ("cliente", "peluquero", "servicio")
+    list_select_related = ("cliente", "peluquero", "servicio")
+    search_fields = (
+        "cliente__nombre",
+        "cliente__apellido",
+        "peluquero__nombre",
+        "peluquero__apellido",
+        "servicio__nombre",
+    )
+    change_list_template = "admin/principal/cita/change_list.html"
+
+    def get_search_results(self, request, queryset, search_term):
+        # El cliente se busca en el índice; peluquero y servicio, por nombre
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(busqueda.filtro_citas(search_term)), False
+
+    def get_urls(self):
+        return [
+            path(
+                "historial/",
+                self.admin_site.admin_view(self.historial_view),
+                name="principal_cita_historial",
+            ),
+            *super().get_urls(),
+        ]
+
+    def historial_view(self, request):
+        """Citas actuales y archivadas en una sola lista (solo consulta).
+
+        Es una UNION de las dos tablas paginada en la BD, con la misma
+        búsqueda que la lista de citas y filtro por peluquero y estado.
+        """
+        if not (self.has_view_permission(request) and request.user.has_perm("Principal.view_citahistorica")):
+            raise PermissionDenied
+
+        campos = ("id", "fecha", "hora", "estado", "cliente_id", "peluquero_id", "servicio_id")
+        filtro = Q()
+        texto = request.GET.get("q", "").strip()
+        if texto:
+            filtro &= busqueda.filtro_citas(texto)
+        if request.GET.get("peluquero", "").isdigit():
+            filtro &= Q(peluquero_id=int(request.GET["peluquero"]))
+        if request.GET.get("estado") in Cita.Estado.values:
+            filtro &= Q(estado=request.GET["estado"])
+
+        # Sin el orden por defecto de cada modelo: SQLite no lo admite dentro de la UNION
+        actuales = Cita.objects.filter(filtro).order_by().values(*campos).annotate(archivada=Value(False))
+        archivadas = (
+            CitaHistorica.objects.filter(filtro).order_by().values(*campos).annotate(archivada=Value(True))
+        )
+        todas = actuales.union(archivadas, all=True).order_by("-fecha", "-hora", "-id")
+        pagina = Paginator(todas, self.list_per_page).get_page(request.GET.get("p"))
+
+        filas = list(pagina)
+        clientes = Cliente.objects.in_bulk({f["cliente_id"] for f in filas})
+        peluqueros = Peluqueros.objects.in_bulk({f["peluquero_id"] for f in filas})
+        servicios = Servicio.objects.in_bulk({f["servicio_id"] for f in filas if f["servicio_id"]})
+        estados = dict(Cita.Estado.choices)
+        for fila in filas:
+            fila["cliente"] = clientes.get(fila["cliente_id"])
+            fila["peluquero"] = peluqueros.get(fila["peluquero_id"])
+            fila["servicio"] = servicios.get(fila["servicio_id"])
+            fila["estado"] = estados.get(fila["estado"], fila["estado"])
+            modelo = "citahistorica" if fila["archivada"] else "cita"
+            fila["url"] = reverse(f"admin:Principal_{modelo}_change", args=[fila["id"]])
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Historial de citas (actuales y archivadas)",
+            "filas": filas,
+            "pagina": pagina,
+            "q": texto,
+            "peluquero": request.GET.get("peluquero", ""),
+            "estado": request.GET.get("estado", ""),
+            "peluqueros": Peluqueros.objects.order_by("nombre", "apellido"),
+            "estados": Cita.Estado.choices,
+            "opts": self.model._meta,
+        }
+        return render(request, "admin/principal/cita/historial.html", context)
+
+
+@admin.register(CitaHistorica)
+class CitaHistoricaAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "hora", "cliente", "peluquero", "servicio", "estado", "archivado_en")
+    list_filter = ("estado", "peluquero", "servicio")
+    date_hierarchy = "fecha"
+    list_select_related = ("cliente", "peluquero", "servicio")
     search_fields = (
         "cliente__nombre",
         "cliente__apellido",
@@ -303,3 +589,90 @@ class CitaAdmin(admin.ModelAdmin):
         "peluquero__apellido",
         "servicio__nombre",
     )
+    actions = ["restaurar"]
+
+    # Solo consulta: se llena con `manage.py archivar_citas`
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Devolver a las citas actuales", permissions=["view"])
+    def restaurar(self, request, queryset):
+        if not request.user.has_perm("Principal.add_cita"):
+            raise PermissionDenied
+        restauradas, saltadas = archivo.restaurar(queryset.values_list("pk", flat=True))
+        messages.success(request, f"Citas devueltas a la tabla de citas: {len(restauradas)}.")
+        if saltadas:
+            messages.warning(
+                request,
+                f"No se han devuelto {len(saltadas)} porque ya hay otra cita del peluquero a esa hora.",
+            )
+
+
+@admin.register(Cambio)
+class CambioAdmin(admin.ModelAdmin):
+    list_display = ("id", "creado_en", "modelo", "objeto_id", "accion")
+    list_filter = ("modelo", "accion")
+    search_fields = ("=objeto_id",)
+    show_full_result_count = False
+
+    # Solo consulta: se llena desde Principal.cambios y se vacía con compactar
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ("id", "tipo", "estado", "intentos", "disponible_en", "terminada_en", "ultimo_error")
+    list_filter = ("estado", "tipo")
+    search_fields = ("=clave",)
+    show_full_result_count = False
+    actions = ["reintentar"]
+
+    # Solo consulta: las crea y actualiza Principal.tareas
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Reintentar ahora")
+    def reintentar(self, request, queryset):
+        n = queryset.exclude(estado=Tarea.Estado.EN_CURSO).update(
+            estado=Tarea.Estado.PENDIENTE, intentos=0, disponible_en=timezone.now(), terminada_en=None
+        )
+        messages.success(request, f"Tareas devueltas a la cola: {n}.")
+
+
+@admin.register(ResumenDiario)
+class ResumenDiarioAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "peluquero", "servicio", "realizadas", "canceladas", "minutos", "ingresos")
+    list_filter = ("peluquero", "servicio")
+    date_hierarchy = "fecha"
+    list_select_related = ("peluquero", "servicio")
+    actions = ["exportar_csv"]
+
+    # Se mantiene solo desde las citas
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Exportar a CSV")
+    def exportar_csv(self, request, queryset):
+        response = HttpResponse(content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = 'attachment; filename="resumen_citas.csv"'
+        writer = csv.writer(response, delimiter=";")
+        writer.writerow(["fecha", "peluquero", "servicio", "realizadas", "canceladas", "minutos", "ingresos"])
+        for r in queryset.select_related("peluquero", "servicio"):
+            writer.writerow([r.fecha, r.peluquero, r.servicio or "", r.realizadas, r.canceladas, r.minutos, r.ingresos])
+        return response
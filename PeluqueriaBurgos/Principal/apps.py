@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PrincipalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Principal'
+
+    def ready(self):
+        from . import checks, recordatorios, signals  # noqa: F401
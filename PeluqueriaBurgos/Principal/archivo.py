@@ -0,0 +1,111 @@
+"""Archivo de citas antiguas (CitaHistorica).
+
+Las citas cerradas (realizadas, canceladas o no presentado) anteriores a una fecha de corte se
+copian a CitaHistorica y se borran de Cita, por lotes y cada lote en su
+transacción. Como cada lote borra lo que copia, volver a lanzar el proceso
+sigue por donde se quedó. `restaurar` hace el camino inverso para las que
+se quieran volver a tener entre las citas (desde el admin).
+
+El resumen diario no cambia al archivar: las citas siguen contando,
+solo cambian de tabla (`recalcular` también lee las archivadas).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from . import disponibilidad
+from .cambios import registrar_ids
+from .models import Cambio, Cita, CitaHistorica
+
+ESTADOS_ARCHIVABLES = (Cita.Estado.REALIZADA, Cita.Estado.CANCELADA, Cita.Estado.NO_PRESENTADO)
+
+_archivando = ContextVar("archivando", default=False)
+
+
+def archivando():
+    """True mientras se borran citas para archivarlas (ver signals)."""
+    return _archivando.get()
+
+
+@contextmanager
+def _modo_archivo():
+    token = _archivando.set(True)
+    try:
+        yield
+    finally:
+        _archivando.reset(token)
+
+
+def archivables(corte):
+    return Cita.objects.filter(fecha__lt=corte, estado__in=ESTADOS_ARCHIVABLES)
+
+
+def archivar_lote(corte, tamano):
+    """Mueve hasta `tamano` citas anteriores a `corte`. Devuelve cuántas."""
+    with transaction.atomic(), _modo_archivo():
+        filas = list(
+            archivables(corte).order_by("pk").values(*CitaHistorica.CAMPOS_CITA)[:tamano]
+        )
+        if not filas:
+            return 0
+        CitaHistorica.objects.bulk_create(
+            [CitaHistorica(**fila) for fila in filas],
+            ignore_conflicts=True,
+        )
+        pks = [f["id"] for f in filas]
+        Cita.objects.filter(pk__in=pks).delete()
+        registrar_ids(Cita, Cambio.Accion.ARCHIVADA, pks)
+    return len(filas)
+
+
+def restaurar(ids):
+    """Devuelve a Cita las citas archivadas indicadas, en una transacción.
+
+    Se saltan las que chocarían con una cita actual del mismo peluquero a
+    la misma hora (o con otra de las restauradas). Devuelve dos listas de
+    ids: restauradas y saltadas.
+    """
+    with transaction.atomic():
+        filas = list(
+            CitaHistorica.objects.select_for_update()
+            .filter(pk__in=ids)
+            .order_by("pk")
+            .values(*CitaHistorica.CAMPOS_CITA)
+        )
+        ocupadas = set(
+            Cita.objects.filter(
+                peluquero_id__in={f["peluquero_id"] for f in filas},
+                fecha__in={f["fecha"] for f in filas},
+            ).values_list("peluquero_id", "fecha", "hora")
+        )
+        existentes = set(Cita.objects.filter(pk__in=[f["id"] for f in filas]).values_list("pk", flat=True))
+
+        nuevas, saltadas = [], []
+        for fila in filas:
+            hueco = (fila["peluquero_id"], fila["fecha"], fila["hora"])
+            if hueco in ocupadas or fila["id"] in existentes:
+                saltadas.append(fila["id"])
+            else:
+                ocupadas.add(hueco)
+                nuevas.append(Cita(**fila))
+        if not nuevas:
+            return [], saltadas
+
+        creadas = {c.pk: c.creado_en for c in nuevas}
+        Cita.objects.bulk_create(nuevas)
+        # bulk_create pone la fecha de ahora en creado_en (auto_now_add)
+        for cita in nuevas:
+            cita.creado_en = creadas[cita.pk]
+        Cita.objects.bulk_update(nuevas, ["creado_en"])
+
+        restauradas = list(creadas)
+        CitaHistorica.objects.filter(pk__in=restauradas).delete()
+        registrar_ids(Cita, Cambio.Accion.ALTA, restauradas)
+    disponibilidad.invalidar_dias([(c.peluquero_id, c.fecha) for c in nuevas])
+    return restauradas, saltadas
+
+
+def historial_de_cliente(cliente_id):
+    return CitaHistorica.objects.filter(cliente_id=cliente_id).select_related("servicio", "peluquero")
@@ -0,0 +1,190 @@
+"""Búsqueda de clientes (admin y búsqueda rápida de recepción).
+
+Con SQLite los clientes se indexan en una tabla FTS5 (`busqueda_cliente`,
+rowid = id del cliente) que mantienen las señales de Cliente: sin acentos ni
+mayúsculas ("garcia" encuentra "García") y con el teléfono guardado solo en
+dígitos, con y sin prefijo +34. Cada término se busca como prefijo.
+
+El motor se elige con `BUSQUEDA_BACKEND` (ruta de la clase); por defecto
+FTS5 en SQLite y, con otra base de datos, `BusquedaORM`, que busca por
+prefijo con los índices NOCASE de Cliente. `manage.py reindexar_busqueda`
+rehace el índice.
+"""
+
+import re
+import unicodedata
+from functools import cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Cliente, Peluqueros, Servicio
+
+TABLA_FTS = "busqueda_cliente"
+# Con términos muy comunes solo se puntúan los primeros resultados
+MAX_CANDIDATOS = 2000
+
+# Un teléfono puede escribirse con espacios, guiones o paréntesis
+_TELEFONO = re.compile(r"\+?\d[\d\s().-]{4,}\d")
+_PALABRA = re.compile(r"\w+")
+
+
+def sin_acentos(texto):
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def normalizar_telefono(telefono):
+    """Solo los dígitos, sin el prefijo de España (+34 / 0034) si lo lleva."""
+    digitos = re.sub(r"\D", "", telefono or "")
+    for prefijo in ("0034", "34"):
+        if digitos.startswith(prefijo) and len(digitos) - len(prefijo) == 9:
+            return digitos[len(prefijo):]
+    return digitos
+
+
+def terminos(texto):
+    """Términos de la búsqueda; un teléfono con separadores cuenta como uno."""
+    telefonos = [normalizar_telefono(t) for t in _TELEFONO.findall(texto)]
+    resto = _TELEFONO.sub(" ", texto)
+    return [t for t in telefonos if t] + _PALABRA.findall(resto)
+
+
+def fila_indice(nombre, apellido, email, telefono):
+    """Columnas del índice FTS5 para un cliente."""
+    digitos = re.sub(r"\D", "", telefono or "")
+    nacional = normalizar_telefono(telefono)
+    telefonos = nacional if nacional == digitos else f"{nacional} {digitos}"
+    return (nombre or "", apellido or "", email or "", telefonos)
+
+
+class BusquedaFTS5:
+    def _consulta(self, texto):
+        return " ".join('"{}"*'.format(t.replace('"', '""')) for t in terminos(texto))
+
+    def filtro(self, texto, prefijo=""):
+        """Q que deja los clientes que contienen todos los términos.
+
+        `prefijo` es el camino hasta el cliente ("cliente__" desde Cita). La
+        consulta al índice va como subconsulta, sin traer los ids a Python.
+        """
+        consulta = self._consulta(texto)
+        if not consulta:
+            return Q()
+        ids = RawSQL(f"SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s", (consulta,))
+        return Q(**{f"{prefijo}pk__in": ids})
+
+    def buscar(self, texto, limite):
+        """Ids de clientes por relevancia (bm25) entre los primeros MAX_CANDIDATOS."""
+        consulta = self._consulta(texto)
+        if not consulta:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM (SELECT rowid, rank FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s LIMIT %s) "
+                "ORDER BY rank LIMIT %s",
+                (consulta, MAX_CANDIDATOS, limite),
+            )
+            return [fila[0] for fila in cursor.fetchall()]
+
+    def _insertar(self, cursor, filas):
+        cursor.executemany(
+            f"INSERT INTO {TABLA_FTS} (rowid, nombre, apellido, email, telefono) VALUES (%s, %s, %s, %s, %s)",
+            [(pk, *fila_indice(*campos)) for pk, *campos in filas],
+        )
+
+    def indexar(self, clientes):
+        filas = [(c.pk, c.nombre, c.apellido, c.email, c.telefono) for c in clientes]
+        if not filas:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {TABLA_FTS} WHERE rowid = %s", [(f[0],) for f in filas])
+            self._insertar(cursor, filas)
+        return len(filas)
+
+    def quitar(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {TABLA_FTS} WHERE rowid = %s", [(pk,) for pk in ids])
+
+    def reconstruir(self, lote=2000):
+        """Vacía el índice y lo llena de nuevo desde Cliente. Devuelve los indexados."""
+        filas = Cliente.objects.order_by("pk").values_list("pk", "nombre", "apellido", "email", "telefono")
+        total = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLA_FTS}")
+            ultimo = 0
+            while trozo := list(filas.filter(pk__gt=ultimo)[:lote]):
+                self._insertar(cursor, trozo)
+                total += len(trozo)
+                ultimo = trozo[-1][0]
+            cursor.execute(f"INSERT INTO {TABLA_FTS} ({TABLA_FTS}) VALUES ('optimize')")
+        return total
+
+
+class BusquedaORM:
+    """Sin índice propio: prefijos con LIKE sobre los campos de Cliente."""
+
+    CAMPOS = ("nombre", "apellido", "telefono", "email")
+
+    def filtro(self, texto, prefijo=""):
+        q = Q()
+        for termino in terminos(texto):
+            q &= Q(*[Q(**{f"{prefijo}{campo}__istartswith": termino}) for campo in self.CAMPOS], _connector=Q.OR)
+        return q
+
+    def buscar(self, texto, limite):
+        if not terminos(texto):
+            return []
+        clientes = Cliente.objects.filter(self.filtro(texto)).order_by("apellido", "nombre", "pk")
+        return list(clientes.values_list("pk", flat=True)[:limite])
+
+    def indexar(self, clientes):
+        return 0
+
+    def quitar(self, ids):
+        pass
+
+    def reconstruir(self, lote=2000):
+        # None: no hay índice que rehacer
+        return None
+
+
+@cache
+def _clase(ruta):
+    return import_string(ruta)
+
+
+def backend():
+    ruta = getattr(settings, "BUSQUEDA_BACKEND", None)
+    if ruta is None:
+        ruta = "Principal.busqueda.BusquedaFTS5" if connection.vendor == "sqlite" else "Principal.busqueda.BusquedaORM"
+    return _clase(ruta)()
+
+
+def _ids_con_palabra(filas, termino):
+    """Ids cuyo nombre tiene alguna palabra que empieza por el término."""
+    clave = sin_acentos(termino)
+    return [pk for pk, nombre in filas if any(p.startswith(clave) for p in sin_acentos(nombre).split())]
+
+
+def filtro_citas(texto):
+    """Q para buscar citas: cada término debe estar en su cliente, peluquero o servicio.
+
+    Peluqueros y servicios son pocos: se comparan en Python (sin acentos) y
+    pasan a la consulta como ids; el cliente sale del índice.
+    """
+    motor = backend()
+    peluqueros = [(pk, f"{n} {a}") for pk, n, a in Peluqueros.objects.values_list("pk", "nombre", "apellido")]
+    servicios = list(Servicio.objects.values_list("pk", "nombre"))
+
+    q = Q()
+    for termino in terminos(texto):
+        q &= (
+            motor.filtro(termino, prefijo="cliente__")
+            | Q(peluquero_id__in=_ids_con_palabra(peluqueros, termino))
+            | Q(servicio_id__in=_ids_con_palabra(servicios, termino))
+        )
+    return q
@@ -0,0 +1,121 @@
+"""Registro de cambios (Cambio) de citas, turnos y horarios.
+
+Los sistemas externos (caja, SMS, BI) leen `/api/cambios/?after=<cursor>`
+y solo reciben lo que ha cambiado desde su último cursor, con el estado
+del objeto tras el cambio. Cada alta, modificación, cancelación o borrado
+añade una fila: desde las señales (ver signals) y, donde no se lanzan
+(update, bulk_create, archivo), llamando aquí a mano.
+
+El cursor es el id del cambio. En SQLite las escrituras van de una en una
+y los ids se confirman en orden; con otras bases de datos una transacción
+lenta puede confirmar un id menor que otro ya leído y el lector se lo
+saltaría. Por eso allí solo se sirven los cambios con más de
+MARGEN_VISIBILIDAD de antigüedad: basta mientras ninguna transacción que
+registre cambios tarde más que eso.
+
+`compactar` borra los cambios antiguos de un objeto que ya tienen otro
+posterior: quien sincroniza tarde se salta pasos intermedios pero llega
+al mismo estado final.
+"""
+
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Cambio, Cita, HorarioPeluquero, TurnoPeluquero
+
+MODELOS = {
+    Cita: Cambio.Modelo.CITA,
+    TurnoPeluquero: Cambio.Modelo.TURNO,
+    HorarioPeluquero: Cambio.Modelo.HORARIO,
+}
+
+CAMPOS = {
+    Cita: (
+        "cliente_id",
+        "peluquero_id",
+        "servicio_id",
+        "fecha",
+        "hora",
+        "hora_fin",
+        "duracion_minutos",
+        "estado",
+        "motivo",
+        "actualizado_en",
+    ),
+    TurnoPeluquero: ("peluquero_id", "fecha_inicio", "fecha_fin", "turno", "activo"),
+    HorarioPeluquero: ("peluquero_id", "dia_semana", "hora_inicio", "hora_fin", "activo"),
+}
+
+SIN_DATOS = (Cambio.Accion.BORRADO, Cambio.Accion.ARCHIVADA)
+
+MARGEN_VISIBILIDAD = timedelta(seconds=5)
+
+
+def registrar(accion, objetos):
+    """Añade un cambio por objeto (instancias de Cita, TurnoPeluquero u HorarioPeluquero)."""
+    cambios = []
+    for objeto in objetos:
+        modelo = type(objeto)
+        datos = None
+        if accion not in SIN_DATOS:
+            datos = {"id": objeto.pk, **{campo: getattr(objeto, campo) for campo in CAMPOS[modelo]}}
+        cambios.append(Cambio(modelo=MODELOS[modelo], objeto_id=objeto.pk, accion=accion, datos=datos))
+    Cambio.objects.bulk_create(cambios)
+    return len(cambios)
+
+
+def registrar_ids(modelo, accion, ids):
+    """Como `registrar`, para filas cambiadas con update() o borradas en bloque.
+
+    Si el objeto sigue existiendo sus datos se leen de nuevo, en una consulta.
+    """
+    ids = list(ids)
+    if accion in SIN_DATOS:
+        objetos = [modelo(pk=pk) for pk in ids]
+    else:
+        objetos = modelo.objects.filter(pk__in=ids).order_by("pk")
+    return registrar(accion, objetos)
+
+
+def accion_cita(cita, creada):
+    if creada:
+        return Cambio.Accion.ALTA
+    antes = getattr(cita, "_guardado", None) or {}
+    if cita.estado == Cita.Estado.CANCELADA and antes.get("estado") != Cita.Estado.CANCELADA:
+        return Cambio.Accion.CANCELACION
+    return Cambio.Accion.MODIFICACION
+
+
+def cambios_desde(cursor, limite, modelos=None):
+    """Cambios con id mayor que `cursor`, como mucho `limite`, en orden."""
+    cambios = Cambio.objects.filter(id__gt=cursor).order_by("id")
+    if connection.vendor != "sqlite":
+        cambios = cambios.filter(creado_en__lte=timezone.now() - MARGEN_VISIBILIDAD)
+    if modelos:
+        cambios = cambios.filter(modelo__in=modelos)
+    return list(cambios[:limite])
+
+
+def compactar(corte, lote=5000):
+    """Borra los cambios anteriores a `corte` que ya tienen otro posterior del mismo objeto.
+
+    Va por tramos de id, cada uno en su transacción. Devuelve cuántos borra.
+    """
+    hasta = Cambio.objects.filter(creado_en__lt=corte).order_by("-id").values_list("id", flat=True).first()
+    if hasta is None:
+        return 0
+
+    posterior = Cambio.objects.filter(modelo=OuterRef("modelo"), objeto_id=OuterRef("objeto_id"), id__gt=OuterRef("id"))
+    total = 0
+    desde = Cambio.objects.order_by("id").values_list("id", flat=True).first() - 1
+    while desde < hasta:
+        with transaction.atomic():
+            borrados, _ = Cambio.objects.filter(
+                Exists(posterior), id__gt=desde, id__lte=min(desde + lote, hasta)
+            ).delete()
+        total += borrados
+        desde += lote
+    return total
@@ -0,0 +1,115 @@
+"""Datos de arranque del formulario de reserva.
+
+Servicios activos y qué peluqueros hacen cada uno cambian poco: se guardan
+en caché hasta que se edita un servicio, un peluquero o sus servicios. Los
+próximos días con hueco dependen de las citas y se cachean poco tiempo.
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .disponibilidad import DIAS_POR_BLOQUE, HORIZONTE_DIAS, BloqueAgenda
+from .models import Peluqueros, Servicio
+
+CLAVE_CATALOGO = "reserva:catalogo"
+CLAVE_DIAS = "reserva:dias"
+DURACION_DIAS = 60
+N_DIAS = 5
+
+
+def catalogo_reserva():
+    """Servicios activos, peluqueros y mapa servicio -> peluqueros (cacheado)."""
+    datos = cache.get(CLAVE_CATALOGO)
+    if datos is not None:
+        return datos
+
+    servicios = [
+        {
+            "id": s["id"],
+            "nombre": s["nombre"],
+            "duracion_minutos": s["duracion_minutos"],
+            "precio": str(s["precio"]),
+        }
+        for s in Servicio.objects.filter(activo=True)
+        .order_by("nombre")
+        .values("id", "nombre", "duracion_minutos", "precio")
+    ]
+    peluqueros = list(
+        Peluqueros.objects.order_by("nombre", "apellido").values_list("id", "nombre", "apellido")
+    )
+    orden = {pid: i for i, (pid, _, _) in enumerate(peluqueros)}
+
+    por_servicio = {str(s["id"]): [] for s in servicios}
+    relaciones = Peluqueros.servicios.through.objects.filter(servicio__activo=True).values_list(
+        "servicio_id", "peluqueros_id"
+    )
+    for servicio_id, peluquero_id in relaciones:
+        por_servicio[str(servicio_id)].append(peluquero_id)
+    for ids in por_servicio.values():
+        ids.sort(key=orden.__getitem__)
+
+    datos = {
+        "servicios": servicios,
+        "peluqueros": {str(pid): f"{nombre} {apellido}".strip() for pid, nombre, apellido in peluqueros},
+        "peluqueros_por_servicio": por_servicio,
+    }
+    cache.set(CLAVE_CATALOGO, datos, timeout=None)
+    return datos
+
+
+def invalidar_catalogo():
+    cache.delete_many([CLAVE_CATALOGO, CLAVE_DIAS])
+
+
+def proximos_dias(n=N_DIAS):
+    """Primeros `n` días con hueco de cada servicio activo (ISO, cacheado).
+
+    `{servicio_id: {peluquero_id: [días], "": [días con cualquiera]}}`, con
+    claves de texto como en el catálogo. Una sola pasada por la agenda para
+    todos los servicios: el formulario lo recibe entero y filtra en el
+    navegador al cambiar de servicio o de peluquero.
+    """
+    dias = cache.get(CLAVE_DIAS)
+    if dias is not None:
+        return dias
+
+    catalogo = catalogo_reserva()
+    duraciones = {str(s["id"]): s["duracion_minutos"] or 30 for s in catalogo["servicios"]}
+    por_servicio = catalogo["peluqueros_por_servicio"]
+    dias = {sid: {"": [], **{str(pid): [] for pid in ids}} for sid, ids in por_servicio.items()}
+    pendientes = {(sid, clave) for sid, listas in dias.items() for clave in listas}
+    ids = sorted({pid for ids in por_servicio.values() for pid in ids})
+
+    hoy = timezone.localdate()
+    ahora = timezone.localtime().time()
+    fin = hoy + timedelta(days=HORIZONTE_DIAS - 1)
+    inicio_bloque = hoy
+    while pendientes and inicio_bloque <= fin:
+        fin_bloque = min(inicio_bloque + timedelta(days=DIAS_POR_BLOQUE - 1), fin)
+        bloque = BloqueAgenda(ids, inicio_bloque, fin_bloque)
+        fecha = inicio_bloque
+        while pendientes and fecha <= fin_bloque:
+            for sid, peluqueros in por_servicio.items():
+                for pid in peluqueros:
+                    horas = bloque.horas_disponibles(pid, fecha, duraciones[sid])
+                    # Hoy solo cuentan las horas que aún no han pasado
+                    if not any(fecha != hoy or hora > ahora for hora in horas):
+                        continue
+                    for clave in (str(pid), ""):
+                        lista = dias[sid][clave]
+                        if (sid, clave) in pendientes and fecha.isoformat() not in lista:
+                            lista.append(fecha.isoformat())
+                            if len(lista) == n:
+                                pendientes.discard((sid, clave))
+            fecha += timedelta(days=1)
+        inicio_bloque = fin_bloque + timedelta(days=1)
+
+    cache.set(CLAVE_DIAS, dias, DURACION_DIAS)
+    return dias
+
+
+def datos_reserva():
+    """Catálogo más los próximos días libres de todos los servicios."""
+    return {**catalogo_reserva(), "proximos_dias": proximos_dias()}
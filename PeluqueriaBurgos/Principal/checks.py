@@ -0,0 +1,30 @@
+"""Comprobaciones de la configuración (`manage.py check`)."""
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .disponibilidad import cache_por_proceso
+
+
+@register(Tags.caches)
+def cache_compartida(app_configs, **kwargs):
+    """Avisa si en producción la caché no es compartida entre procesos.
+
+    La invalidación de la disponibilidad, las retenciones de horas, los
+    límites de peticiones y el cliente de cada usuario viven en la caché:
+    con LocMemCache cada proceso tiene los suyos.
+    """
+    if settings.DEBUG or not cache_por_proceso():
+        return []
+    return [
+        Warning(
+            "La caché por defecto es LocMemCache y DEBUG está desactivado.",
+            hint=(
+                "Con varios procesos cada uno tiene su caché: los cambios de horarios, turnos y "
+                "citas tardan hasta DISPONIBILIDAD_MAX_DESFASE segundos en llegar a los demás, y "
+                "retenciones y límites de peticiones se cuentan por proceso. Configura Redis o "
+                "Memcached en CACHES."
+            ),
+            id="Principal.W001",
+        )
+    ]
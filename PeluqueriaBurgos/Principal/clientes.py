@@ -0,0 +1,51 @@
+"""Cliente asociado a cada usuario.
+
+El Cliente se crea al iniciar sesión (señal `user_logged_in`) y el id se
+guarda en la caché por usuario, así las vistas privadas no consultan (ni
+crean) el Cliente en cada petición. Las señales de Cliente borran la
+entrada cuando cambia o se borra.
+"""
+
+from django.core.cache import cache
+
+from .models import Cliente
+
+
+def _clave(user_id):
+    return f"cliente:usuario:{user_id}"
+
+
+def get_or_create_cliente(user):
+    """Obtiene (o crea) el Cliente asociado al usuario.
+
+    Así el proyecto funciona sin tener que dar de alta el Cliente manualmente
+    en el admin cada vez.
+    """
+    cliente, _ = Cliente.objects.get_or_create(
+        user=user,
+        defaults={
+            "nombre": user.first_name or user.username,
+            "apellido": user.last_name or "",
+            "email": user.email or "",
+        },
+    )
+    cache.set(_clave(user.pk), cliente.pk, timeout=None)
+    return cliente
+
+
+def cliente_id_de(request):
+    """Id del Cliente del usuario autenticado, resuelto una vez por petición.
+
+    Sale de la caché; solo si no está (caché vacía o usuarios con sesión
+    anterior a la señal de login) se busca o crea en la BD.
+    """
+    if not hasattr(request, "_cliente_id"):
+        cliente_id = cache.get(_clave(request.user.pk))
+        if cliente_id is None:
+            cliente_id = get_or_create_cliente(request.user).pk
+        request._cliente_id = cliente_id
+    return request._cliente_id
+
+
+def olvidar(*user_ids):
+    cache.delete_many([_clave(user_id) for user_id in user_ids if user_id])
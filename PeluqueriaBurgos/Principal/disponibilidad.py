@@ -0,0 +1,689 @@
+"""Cálculo de disponibilidad de los peluqueros.
+
+`get_horas_disponibles` (en models) responde para un peluquero y un día.
+Aquí están las piezas que comparte con las búsquedas de varios días, que
+cargan turnos, horarios y citas por bloques en vez de consultar día a día.
+"""
+
+import calendar
+import secrets
+from array import array
+from bisect import bisect_right
+from datetime import date, time, timedelta
+from itertools import islice
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+from .models import (
+    APERTURA,
+    CIERRE,
+    COMIDA_FIN,
+    COMIDA_INICIO,
+    Cita,
+    DiaEspecial,
+    HorarioPeluquero,
+    Peluqueros,
+    TurnoPeluquero,
+    _servicio_duracion_minutos,
+)
+
+PASO = 30
+DIAS_POR_BLOQUE = 7
+HORIZONTE_DIAS = 60
+
+
+def _minutos(t):
+    return t.hour * 60 + t.minute
+
+
+def _hora(minutos):
+    return time(minutos // 60, minutos % 60)
+
+
+def _tramo_cita(hora, hora_fin):
+    """Tramo en minutos de una cita (30 minutos si aún no tiene hora_fin)."""
+    inicio = _minutos(hora)
+    if hora_fin is None:
+        return inicio, inicio + 30
+    return inicio, _minutos(hora_fin)
+
+
+# Rejilla de bloques de 30 minutos desde la apertura: el bit i es el bloque
+# que empieza en APERTURA + 30*i (08:00 -> bit 0, 20:30 -> bit 25).
+INICIO_REJILLA = _minutos(APERTURA)
+N_BLOQUES = (_minutos(CIERRE) - INICIO_REJILLA) // PASO
+
+
+def _bloques(primero, ultimo):
+    primero = max(primero, 0)
+    ultimo = min(ultimo, N_BLOQUES)
+    if ultimo <= primero:
+        return 0
+    return ((1 << (ultimo - primero)) - 1) << primero
+
+
+def mascara_tramo(inicio, fin):
+    """Bloques cubiertos por completo por el tramo de trabajo [inicio, fin).
+
+    Los tramos no alineados a 30 minutos se redondean hacia dentro.
+    """
+    return _bloques(
+        -(-(inicio - INICIO_REJILLA) // PASO),
+        (fin - INICIO_REJILLA) // PASO,
+    )
+
+
+def mascara_ocupada(inicio, fin):
+    """Bloques que toca (aunque sea en parte) una cita [inicio, fin)."""
+    return _bloques(
+        (inicio - INICIO_REJILLA) // PASO,
+        -(-(fin - INICIO_REJILLA) // PASO),
+    )
+
+
+MASCARA_COMIDA = mascara_ocupada(_minutos(COMIDA_INICIO), _minutos(COMIDA_FIN))
+MASCARA_MANANA = mascara_tramo(_minutos(APERTURA), _minutos(COMIDA_INICIO))
+MASCARA_TARDE = mascara_tramo(_minutos(COMIDA_FIN), _minutos(CIERRE))
+
+
+# Horario general de la peluquería por día de la semana (lunes = 0):
+# de apertura a cierre salvo la comida, y cerrado los domingos.
+MASCARA_JORNADA = _bloques(0, N_BLOQUES) & ~MASCARA_COMIDA
+MASCARAS_SEMANA_SALON = (MASCARA_JORNADA,) * 6 + (0,)
+
+
+def mascara_turno(turno):
+    """Bloques de trabajo de un TurnoPeluquero."""
+    if turno == TurnoPeluquero.Turno.AUSENCIA:
+        return 0
+    if turno == TurnoPeluquero.Turno.MANANA:
+        return MASCARA_MANANA
+    if turno == TurnoPeluquero.Turno.TARDE:
+        return MASCARA_TARDE
+    return MASCARA_MANANA | MASCARA_TARDE
+
+
+def inicios_libres(libre, duracion):
+    """Bloques en los que puede empezar una cita de `duracion` minutos.
+
+    Un bloque vale si él y los siguientes que ocupa la cita están libres.
+    """
+    inicios = libre
+    for desplazamiento in range(1, -(-duracion // PASO)):
+        inicios &= libre >> desplazamiento
+    return inicios
+
+
+def horas_de_mascara(mascara):
+    horas = []
+    i = 0
+    while mascara:
+        if mascara & 1:
+            horas.append(_hora(INICIO_REJILLA + i * PASO))
+        mascara >>= 1
+        i += 1
+    return horas
+
+
+def inicios_disponibles(trabajo, ocupado, duracion):
+    """Máscara de horas de inicio libres dado lo que trabaja el peluquero y lo ocupado.
+
+    `trabajo` debe venir ya recortado con el horario de la peluquería.
+    """
+    return inicios_libres(trabajo & ~ocupado, duracion)
+
+
+# Cachés por proceso con invalidación por versión: cada entrada guarda la
+# versión con la que se compiló y se descarta si la de la caché compartida
+# ha cambiado (las señales la renuevan al guardar o borrar).
+#
+# Si la caché no es compartida (LocMemCache con varios procesos), un cambio
+# hecho en un proceso no llega a los demás. Para acotar cuánto puede servir
+# uno de ellos datos viejos, lo compilado se recompila pasados MAX_DESFASE
+# segundos y las versiones caducan como mucho a los MAX_DESFASE (las de
+# cada día, solo con caché por proceso: en una compartida ya llegan a todos).
+MAX_DESFASE = getattr(settings, "DISPONIBILIDAD_MAX_DESFASE", 5 * 60)
+
+
+def _clave_version(tipo, peluquero_id):
+    return f"disponibilidad:{tipo}:{peluquero_id}"
+
+
+# Las versiones de cada día ("dia") son muchas y dejan de servir: caducan.
+# Si caduca antes que el resultado guardado, este se descarta sin más.
+CADUCIDAD_VERSIONES = {"dia": 2 * 24 * 60 * 60}
+
+
+def cache_por_proceso():
+    """True si la caché por defecto es local a cada proceso (no compartida)."""
+    return isinstance(caches["default"], LocMemCache)
+
+
+def _caducidad_version(tipo):
+    caducidad = CADUCIDAD_VERSIONES.get(tipo, MAX_DESFASE)
+    return min(caducidad, MAX_DESFASE) if cache_por_proceso() else caducidad
+
+
+def _leer_versiones(pedidas):
+    """{(tipo, id): versión} con una sola lectura; crea las que no existan."""
+    claves = {pedida: _clave_version(*pedida) for pedida in pedidas}
+    encontradas = cache.get_many(claves.values())
+    versiones = {}
+    nuevas = {}
+    for (tipo, id_), clave in claves.items():
+        if clave in encontradas:
+            versiones[(tipo, id_)] = encontradas[clave]
+        else:
+            versiones[(tipo, id_)] = secrets.token_hex(8)
+            nuevas.setdefault(_caducidad_version(tipo), {})[clave] = versiones[(tipo, id_)]
+    for caducidad, valores in nuevas.items():
+        cache.set_many(valores, timeout=caducidad)
+    return versiones
+
+
+def _versiones(tipo, peluquero_ids):
+    versiones = _leer_versiones([(tipo, pid) for pid in peluquero_ids])
+    return {pid: versiones[(tipo, pid)] for pid in peluquero_ids}
+
+
+def invalidar(tipo, *peluquero_ids):
+    cache.set_many(
+        {_clave_version(tipo, pid): secrets.token_hex(8) for pid in peluquero_ids},
+        timeout=_caducidad_version(tipo),
+    )
+
+
+def _compilados(almacen, versiones, cargar):
+    """Objetos compilados por clave, recompilando solo los caducados.
+
+    `versiones` es {clave: versión vigente} y `cargar(pendientes)` devuelve
+    {clave: objeto} para las que falten, hayan cambiado de versión o tengan
+    más de MAX_DESFASE segundos.
+    """
+    ahora = monotonic()
+    resultado = {}
+    pendientes = []
+    for clave, version in versiones.items():
+        guardado = almacen.get(clave)
+        if guardado and guardado[0] == version and ahora - guardado[2] < MAX_DESFASE:
+            resultado[clave] = guardado[1]
+        else:
+            pendientes.append(clave)
+
+    if pendientes:
+        for clave, objeto in cargar(pendientes).items():
+            almacen[clave] = (versiones[clave], objeto, ahora)
+            resultado[clave] = objeto
+
+    return resultado
+
+
+class PlantillaSemanal:
+    """Plantilla semanal compilada: una máscara de bloques por día de la semana."""
+
+    __slots__ = ("mascaras",)
+
+    def __init__(self, mascaras):
+        self.mascaras = tuple(mascaras)
+
+    @classmethod
+    def compilar(cls, horarios):
+        """`horarios`: iterable de (dia_semana, hora_inicio, hora_fin).
+
+        Los tramos de un día que se tocan o se pisan se unen antes de
+        redondear: 09:00-10:15 y 10:15-11:00 trabajan el bloque de las 10:00.
+        """
+        tramos = [[] for _ in range(7)]
+        for dia, inicio, fin in horarios:
+            if fin > inicio:
+                tramos[dia].append((_minutos(inicio), _minutos(fin)))
+
+        mascaras = [0] * 7
+        for dia, del_dia in enumerate(tramos):
+            unidos = []
+            for inicio, fin in sorted(del_dia):
+                if unidos and inicio <= unidos[-1][1]:
+                    unidos[-1][1] = max(unidos[-1][1], fin)
+                else:
+                    unidos.append([inicio, fin])
+            for inicio, fin in unidos:
+                mascaras[dia] |= mascara_tramo(inicio, fin)
+        return cls(mascaras)
+
+    def mascara(self, dia_semana):
+        return self.mascaras[dia_semana]
+
+
+_plantillas = {}
+
+
+def _cargar_plantillas(peluquero_ids):
+    horarios = {pid: [] for pid in peluquero_ids}
+    for pid, dia, inicio, fin in HorarioPeluquero.objects.filter(
+        peluquero_id__in=peluquero_ids,
+        activo=True,
+    ).values_list("peluquero_id", "dia_semana", "hora_inicio", "hora_fin"):
+        horarios[pid].append((dia, inicio, fin))
+    return {pid: PlantillaSemanal.compilar(h) for pid, h in horarios.items()}
+
+
+def plantillas_semanales(peluquero_ids):
+    """Plantilla semanal de cada peluquero, compilando solo las caducadas."""
+    return _compilados(_plantillas, _versiones("horarios", peluquero_ids), _cargar_plantillas)
+
+
+def plantilla_semanal(peluquero_id):
+    return plantillas_semanales([peluquero_id])[peluquero_id]
+
+
+class ResolutorTurnos:
+    """Turnos por fechas de un peluquero aplanados en una línea temporal.
+
+    Los tramos (ordinales de fecha, ambos incluidos) no se solapan y están
+    ordenados, así que el turno de un día se encuentra por búsqueda binaria.
+    Donde se pisan varios turnos manda el que empieza más tarde y, a
+    igualdad, el de id mayor (el mismo criterio que `-fecha_inicio, -id`).
+    Las ausencias mandan siempre sobre los demás turnos.
+    """
+
+    __slots__ = ("_inicios", "_tramos")
+
+    def __init__(self, tramos):
+        self._tramos = tuple(tramos)
+        self._inicios = tuple(t[0] for t in self._tramos)
+
+    @classmethod
+    def compilar(cls, turnos):
+        """`turnos`: iterable de (fecha_inicio, fecha_fin, id, turno)."""
+        tramos = []
+        # Se pintan de menor a mayor prioridad: cada turno tapa lo anterior
+        ausencia = TurnoPeluquero.Turno.AUSENCIA
+        for fi, ff, _pk, turno in sorted(turnos, key=lambda t: (t[3] == ausencia, t[0], t[2])):
+            a, b = fi.toordinal(), ff.toordinal()
+            if b < a:
+                continue
+            i = bisect_right([t[0] for t in tramos], a) - 1
+            if i < 0 or tramos[i][1] < a:
+                i += 1
+            j = i
+            nuevos = []
+            while j < len(tramos) and tramos[j][0] <= b:
+                ini, fin, t = tramos[j]
+                if ini < a:
+                    nuevos.append((ini, a - 1, t))
+                if fin > b:
+                    nuevos.append((b + 1, fin, t))
+                j += 1
+            nuevos.append((a, b, turno))
+            nuevos.sort()
+            tramos[i:j] = nuevos
+        return cls(tramos)
+
+    def turno(self, fecha):
+        """Turno que aplica en `fecha`, o None si manda la plantilla semanal."""
+        o = fecha.toordinal()
+        i = bisect_right(self._inicios, o) - 1
+        if i >= 0 and self._tramos[i][1] >= o:
+            return self._tramos[i][2]
+        return None
+
+    def rango(self, desde, hasta):
+        """Genera `(fecha, turno o None)` para cada día de [desde, hasta] en una pasada."""
+        o, fin = desde.toordinal(), hasta.toordinal()
+        i = max(bisect_right(self._inicios, o) - 1, 0)
+        while o <= fin:
+            while i < len(self._tramos) and self._tramos[i][1] < o:
+                i += 1
+            if i < len(self._tramos) and self._tramos[i][0] <= o:
+                ini, fin_tramo, turno = self._tramos[i]
+                for dia in range(o, min(fin_tramo, fin) + 1):
+                    yield date.fromordinal(dia), turno
+                o = min(fin_tramo, fin) + 1
+            else:
+                siguiente = self._tramos[i][0] if i < len(self._tramos) else fin + 1
+                for dia in range(o, min(siguiente - 1, fin) + 1):
+                    yield date.fromordinal(dia), None
+                o = min(siguiente - 1, fin) + 1
+
+
+_resolutores = {}
+
+
+def _cargar_resolutores(peluquero_ids):
+    turnos = {pid: [] for pid in peluquero_ids}
+    for pid, fi, ff, pk, turno in TurnoPeluquero.objects.filter(
+        peluquero_id__in=peluquero_ids,
+        activo=True,
+    ).values_list("peluquero_id", "fecha_inicio", "fecha_fin", "id", "turno"):
+        turnos[pid].append((fi, ff, pk, turno))
+    return {pid: ResolutorTurnos.compilar(t) for pid, t in turnos.items()}
+
+
+def resolutores_turnos(peluquero_ids):
+    """Resolutor de turnos de cada peluquero, compilando solo los caducados."""
+    return _compilados(_resolutores, _versiones("turnos", peluquero_ids), _cargar_resolutores)
+
+
+def resolutor_turnos(peluquero_id):
+    return resolutores_turnos([peluquero_id])[peluquero_id]
+
+
+def mascara_trabajo(plantilla, resolutor, fecha):
+    """Bloques que trabaja un peluquero un día: su turno o, si no hay, la plantilla."""
+    turno = resolutor.turno(fecha)
+    if turno is not None:
+        return mascara_turno(turno)
+    return plantilla.mascara(fecha.weekday())
+
+
+class CalendarioSalon:
+    """Máscara de bloques abiertos de la peluquería para cada día de un año.
+
+    Parte del horario general por día de la semana y aplica los DiaEspecial
+    activos: primero los horarios especiales (manda el que empieza más
+    tarde) y encima los festivos y cierres.
+    """
+
+    __slots__ = ("anio", "_primer_dia", "_mascaras", "_motivos")
+
+    def __init__(self, anio, mascaras, motivos):
+        self.anio = anio
+        self._primer_dia = date(anio, 1, 1).toordinal()
+        self._mascaras = array("L", mascaras)
+        self._motivos = motivos
+
+    @classmethod
+    def compilar(cls, anio, dias_especiales):
+        primer_dia = date(anio, 1, 1).toordinal()
+        n_dias = 366 if calendar.isleap(anio) else 365
+        # date(1, 1, 1) (ordinal 1) es lunes
+        mascaras = [MASCARAS_SEMANA_SALON[(primer_dia + i - 1) % 7] for i in range(n_dias)]
+        motivos = {}
+
+        prioridad = {DiaEspecial.Tipo.HORARIO: 0}
+        for especial in sorted(
+            dias_especiales,
+            key=lambda d: (prioridad.get(d.tipo, 1), d.fecha_inicio, d.pk),
+        ):
+            desde = max(especial.fecha_inicio.toordinal(), primer_dia) - primer_dia
+            hasta = min(especial.fecha_fin.toordinal(), primer_dia + n_dias - 1) - primer_dia
+            if especial.tipo == DiaEspecial.Tipo.HORARIO:
+                mascara = mascara_tramo(_minutos(especial.hora_apertura), _minutos(especial.hora_cierre))
+                if especial.cierre_comida:
+                    mascara &= ~MASCARA_COMIDA
+                for i in range(desde, hasta + 1):
+                    if especial.incluye_domingos or (primer_dia + i - 1) % 7 != 6:
+                        mascaras[i] = mascara
+            else:
+                for i in range(desde, hasta + 1):
+                    mascaras[i] = 0
+                    motivos[i] = especial.descripcion or especial.get_tipo_display()
+
+        return cls(anio, mascaras, motivos)
+
+    def mascara(self, fecha):
+        return self._mascaras[fecha.toordinal() - self._primer_dia]
+
+    def motivo_cierre(self, fecha):
+        motivo = self._motivos.get(fecha.toordinal() - self._primer_dia)
+        if motivo:
+            return f"La peluquería está cerrada ese día ({motivo})."
+        if fecha.weekday() == 6:
+            return "La peluquería cierra los domingos."
+        return "La peluquería está cerrada ese día."
+
+
+_calendarios = {}
+
+
+def _cargar_calendarios(anios):
+    especiales = list(
+        DiaEspecial.objects.filter(
+            activo=True,
+            fecha_inicio__lte=date(max(anios), 12, 31),
+            fecha_fin__gte=date(min(anios), 1, 1),
+        )
+    )
+    return {anio: CalendarioSalon.compilar(anio, especiales) for anio in anios}
+
+
+def calendarios_salon(anios):
+    """Calendario compilado de cada año, compilando solo los caducados.
+
+    Hay una sola versión para todos los años: un DiaEspecial puede cambiar
+    de año al editarse.
+    """
+    version = _versiones("calendario", ["salon"])["salon"]
+    return _compilados(_calendarios, {anio: version for anio in anios}, _cargar_calendarios)
+
+
+def calendario_salon(anio):
+    return calendarios_salon([anio])[anio]
+
+
+def mascara_salon(fecha):
+    """Bloques en los que la peluquería está abierta ese día (0 si cierra)."""
+    return calendario_salon(fecha.year).mascara(fecha)
+
+
+class BloqueAgenda:
+    """Agenda de varios peluqueros en un rango de fechas.
+
+    Carga las citas con una consulta (plantillas y turnos salen de la caché)
+    y después responde en memoria para cualquier peluquero/día del rango
+    (`hasta` incluido).
+    """
+
+    def __init__(self, peluquero_ids, desde, hasta):
+        self.desde = desde
+        self.hasta = hasta
+        peluquero_ids = list(peluquero_ids)
+
+        self._plantillas = plantillas_semanales(peluquero_ids)
+        self._resolutores = resolutores_turnos(peluquero_ids)
+        self._calendarios = calendarios_salon(range(desde.year, hasta.year + 1))
+
+        self._citas = {}
+        citas = Cita.objects.activas().filter(
+            peluquero_id__in=peluquero_ids,
+            fecha__gte=desde,
+            fecha__lte=hasta,
+        ).values_list("peluquero_id", "fecha", "hora", "hora_fin")
+        for peluquero_id, fecha, hora, hora_fin in citas:
+            clave = (peluquero_id, fecha)
+            self._citas[clave] = self._citas.get(clave, 0) | mascara_ocupada(*_tramo_cita(hora, hora_fin))
+
+    def mascara_trabajo(self, peluquero_id, fecha):
+        return mascara_trabajo(
+            self._plantillas[peluquero_id],
+            self._resolutores[peluquero_id],
+            fecha,
+        )
+
+    def mascaras_dia(self, peluquero_id, fecha):
+        """(bloques en que trabaja con la peluquería abierta, bloques ocupados por citas)."""
+        abierto = self._calendarios[fecha.year].mascara(fecha)
+        if not abierto:
+            return 0, 0
+        return self.mascara_trabajo(peluquero_id, fecha) & abierto, self._citas.get((peluquero_id, fecha), 0)
+
+    def mascara_disponible(self, peluquero_id, fecha, duracion, ocupado_extra=0):
+        libre, ocupado = self.mascaras_dia(peluquero_id, fecha)
+        if not libre:
+            return 0
+        return inicios_disponibles(libre, ocupado | ocupado_extra, duracion)
+
+    def horas_disponibles(self, peluquero_id, fecha, duracion):
+        return horas_de_mascara(self.mascara_disponible(peluquero_id, fecha, duracion))
+
+
+# Resultado por peluquero y día en la caché compartida: las máscaras de
+# `BloqueAgenda.mascaras_dia`, que no dependen de la duración del servicio.
+# Cada entrada lleva las versiones de horarios, turnos, calendario y citas
+# de ese día con las que se calculó; si alguna ha cambiado no se usa. Así
+# un cambio que llega mientras se calcula no deja un resultado viejo.
+DURACION_DIA = 24 * 60 * 60
+
+
+def _clave_dia(peluquero_id, fecha):
+    return f"disponibilidad:resultado:{peluquero_id}:{fecha.isoformat()}"
+
+
+def _id_dia(peluquero_id, fecha):
+    return f"{peluquero_id}:{fecha.isoformat()}"
+
+
+def versiones_dias(pares):
+    """Versiones vigentes de cada `(peluquero_id, fecha)`, con una lectura de la caché."""
+    pares = list(pares)
+    pids = {pid for pid, _ in pares}
+    versiones = _leer_versiones(
+        [("horarios", pid) for pid in pids]
+        + [("turnos", pid) for pid in pids]
+        + [("calendario", "salon")]
+        + [("dia", _id_dia(pid, fecha)) for pid, fecha in pares]
+    )
+    salon = versiones[("calendario", "salon")]
+    return {
+        (pid, fecha): (
+            versiones[("horarios", pid)],
+            versiones[("turnos", pid)],
+            salon,
+            versiones[("dia", _id_dia(pid, fecha))],
+        )
+        for pid, fecha in pares
+    }
+
+
+def guardar_dias(mascaras, versiones):
+    """Guarda `{(peluquero_id, fecha): (libre, ocupado)}` con sus versiones."""
+    cache.set_many(
+        {_clave_dia(*par): (versiones[par], *valor) for par, valor in mascaras.items()},
+        DURACION_DIA,
+    )
+
+
+def invalidar_dias(pares):
+    """Descarta los resultados guardados de esos `(peluquero_id, fecha)` (citas cambiadas)."""
+    invalidar("dia", *{_id_dia(pid, fecha) for pid, fecha in pares if pid and fecha})
+
+
+def mascaras_dias(pares):
+    """`{(peluquero_id, fecha): (libre, ocupado)}`: de la caché o, lo que falte, con un BloqueAgenda."""
+    pares = list(dict.fromkeys(pares))
+    if not pares:
+        return {}
+    versiones = versiones_dias(pares)
+    guardadas = cache.get_many([_clave_dia(*par) for par in pares])
+
+    resultado = {}
+    faltan = []
+    for par in pares:
+        entrada = guardadas.get(_clave_dia(*par))
+        if entrada and entrada[0] == versiones[par]:
+            resultado[par] = entrada[1:]
+        else:
+            faltan.append(par)
+
+    if faltan:
+        bloque = BloqueAgenda({p for p, _ in faltan}, min(f for _, f in faltan), max(f for _, f in faltan))
+        calculadas = {par: bloque.mascaras_dia(*par) for par in faltan}
+        guardar_dias(calculadas, versiones)
+        resultado.update(calculadas)
+    return resultado
+
+
+def mascaras_disponibles_lote(consultas, titular=None):
+    """Máscaras de horas libres para muchas consultas `(peluquero_id, fecha, duracion)`.
+
+    Los días que no están en la caché se calculan juntos en un único
+    BloqueAgenda, así que el número de consultas a la BD no depende de
+    cuántas se pidan. Devuelve una máscara por consulta, en el mismo orden.
+    Con `titular`, descuenta las horas retenidas por otros clientes.
+    """
+    consultas = list(consultas)
+    hoy = timezone.localdate()
+    futuras = [c for c in consultas if c[1] >= hoy]
+    if not futuras:
+        return [0 for _ in consultas]
+
+    dias = mascaras_dias((c[0], c[1]) for c in futuras)
+
+    retenidas = [0] * len(consultas)
+    if titular is not None:
+        from .retenciones import mascaras_retenidas
+
+        retenidas = mascaras_retenidas([(c[0], c[1]) for c in consultas], excepto=titular)
+
+    mascaras = []
+    for (peluquero_id, fecha, duracion), retenida in zip(consultas, retenidas):
+        libre, ocupado = dias[(peluquero_id, fecha)] if fecha >= hoy else (0, 0)
+        mascaras.append(inicios_disponibles(libre, ocupado | retenida, duracion) if libre else 0)
+    return mascaras
+
+
+def horas_disponibles_lote(consultas, titular=None):
+    """Como `mascaras_disponibles_lote`, pero con listas de horas."""
+    return [horas_de_mascara(m) for m in mascaras_disponibles_lote(consultas, titular)]
+
+
+def iter_huecos(*, servicio, peluquero=None, desde=None, horizonte_dias=HORIZONTE_DIAS):
+    """Genera huecos libres `(fecha, peluquero, hora)` en orden cronológico.
+
+    Recorre los días de forma perezosa desde `desde` (hoy por defecto) y
+    carga la agenda por semanas solo cuando el recorrido llega a ellas.
+    """
+    hoy = timezone.localdate()
+    desde = max(desde or hoy, hoy)
+    fin = desde + timedelta(days=horizonte_dias - 1)
+
+    peluqueros = Peluqueros.objects.filter(servicios=servicio).distinct().order_by("nombre", "apellido")
+    if peluquero is not None:
+        peluqueros = peluqueros.filter(pk=peluquero.pk)
+    peluqueros = list(peluqueros)
+    if not peluqueros:
+        return
+
+    duracion = _servicio_duracion_minutos(servicio)
+    ahora = timezone.localtime().time()
+    ids = [p.pk for p in peluqueros]
+
+    inicio_bloque = desde
+    while inicio_bloque <= fin:
+        fin_bloque = min(inicio_bloque + timedelta(days=DIAS_POR_BLOQUE - 1), fin)
+        bloque = BloqueAgenda(ids, inicio_bloque, fin_bloque)
+
+        fecha = inicio_bloque
+        while fecha <= fin_bloque:
+            huecos = []
+            for p in peluqueros:
+                for hora in bloque.horas_disponibles(p.pk, fecha, duracion):
+                    # Hoy solo interesan las horas que aún no han pasado
+                    if fecha == hoy and hora <= ahora:
+                        continue
+                    huecos.append((hora, p))
+            huecos.sort(key=lambda h: h[0])
+            for hora, p in huecos:
+                yield fecha, p, hora
+            fecha += timedelta(days=1)
+
+        inicio_bloque = fin_bloque + timedelta(days=1)
+
+
+def buscar_proximas_horas(*, servicio, peluquero=None, desde=None, horizonte_dias=HORIZONTE_DIAS, limite=5):
+    """Primeros `limite` huecos libres para un servicio (próxima cita disponible)."""
+    return list(
+        islice(
+            iter_huecos(
+                servicio=servicio,
+                peluquero=peluquero,
+                desde=desde,
+                horizonte_dias=horizonte_dias,
+            ),
+            limite,
+        )
+    )
@@ -1,6 +1,7 @@
 from django import forms
 from django.utils.dateparse import parse_date
 
+from .catalogo import catalogo_reserva
 from .models import Cita, Peluqueros, Servicio, get_horas_disponibles
 
 
@@ -23,7 +24,9 @@ class CitaForm(forms.ModelForm):
             "motivo": forms.TextInput(attrs={"class": "form-control"}),
         }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, titular=None, **kwargs):
+        # `titular` (ver `retenciones.titular_de`): sus retenciones no quitan
+        # horas, las de los demás sí
         super().__init__(*args, **kwargs)
 
         # Forzamos el flujo de reserva: servicio -> peluquero -> hora
@@ -56,22 +59,35 @@ class CitaForm(forms.ModelForm):
         # Por defecto no mostramos peluqueros hasta que se seleccione un servicio
         self.fields["peluquero"].queryset = Peluqueros.objects.none()
 
-        if servicio_id:
+        # Servicios activos y sus peluqueros salen del catálogo cacheado de
+        # la reserva; solo un servicio ya desactivado (al editar) va a la BD
+        catalogo = catalogo_reserva()
+        servicio = peluquero = None
+        if servicio_id and str(servicio_id) in catalogo["peluqueros_por_servicio"]:
+            ids = catalogo["peluqueros_por_servicio"][str(servicio_id)]
+            self.fields["peluquero"].queryset = Peluqueros.objects.filter(pk__in=ids)
+            if peluquero_id in ids:
+                # El cálculo de horas solo necesita el id y la duración
+                datos = next(s for s in catalogo["servicios"] if s["id"] == servicio_id)
+                servicio = Servicio(pk=servicio_id, duracion_minutos=datos["duracion_minutos"])
+                peluquero = Peluqueros(pk=peluquero_id)
+        elif servicio_id:
             self.fields["peluquero"].queryset = Peluqueros.objects.filter(
                 servicios__id=servicio_id
             ).distinct()
+            if peluquero_id:
+                servicio = Servicio.objects.filter(pk=servicio_id).first()
+                peluquero = self.fields["peluquero"].queryset.filter(pk=peluquero_id).first()
 
         # Si ya tenemos servicio + peluquero + fecha, precargamos horas disponibles (fallback sin JS)
-        if servicio_id and peluquero_id and fecha:
-            servicio = Servicio.objects.filter(pk=servicio_id).first()
-            peluquero = Peluqueros.objects.filter(pk=peluquero_id).first()
-            if servicio and peluquero:
-                horas = get_horas_disponibles(
-                    peluquero=peluquero,
-                    fecha=fecha,
-                    servicio=servicio,
-                    exclude_cita_pk=self.instance.pk if self.instance.pk else None,
-                )
-                self.fields["hora"].choices = [("", "Selecciona una hora")] + [
-                    (h.strftime("%H:%M"), h.strftime("%H:%M")) for h in horas
-                ]
+        if servicio and peluquero and fecha:
+            horas = get_horas_disponibles(
+                peluquero=peluquero,
+                fecha=fecha,
+                servicio=servicio,
+                exclude_cita_pk=self.instance.pk if self.instance.pk else None,
+                titular=titular,
+            )
+            self.fields["hora"].choices = [("", "Selecciona una hora")] + [
+                (h.strftime("%H:%M"), h.strftime("%H:%M")) for h in horas
+            ]
@@ -0,0 +1,164 @@
+"""Informes de ocupación de los peluqueros.
+
+Se cargan turnos, horarios (ya compilados en `disponibilidad`) y citas del
+rango con unas pocas consultas y se calcula todo con arrays de NumPy de
+forma peluqueros x días x bloques de 30 minutos.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+
+from .disponibilidad import (
+    INICIO_REJILLA,
+    N_BLOQUES,
+    PASO,
+    _tramo_cita,
+    calendarios_salon,
+    mascara_turno,
+    plantillas_semanales,
+    resolutores_turnos,
+)
+from .models import Cita, HorarioPeluquero, Peluqueros
+
+DURACION_CACHE = 300
+DIAS_SEMANA = [label for _, label in HorarioPeluquero.DiaSemana.choices]
+HORAS_BLOQUE = PASO / 60
+
+
+def _bits(mascaras):
+    """(...) uint32 -> (..., N_BLOQUES) bool, un valor por bloque."""
+    return ((mascaras[..., None] >> np.arange(N_BLOQUES, dtype=np.uint32)) & 1).astype(bool)
+
+
+def _porcentaje(parte, total):
+    return np.divide(
+        parte * 100.0,
+        total,
+        out=np.zeros(np.shape(parte), dtype=float),
+        where=np.asarray(total) > 0,
+    )
+
+
+def _mascaras_trabajo(ids, fechas, desde, hasta):
+    """Array (peluqueros, días) con los bloques que trabaja cada uno cada día."""
+    plantillas = plantillas_semanales(ids)
+    resolutores = resolutores_turnos(ids)
+    calendarios = calendarios_salon(range(desde.year, hasta.year + 1))
+
+    dias_semana = np.array([f.weekday() for f in fechas])
+    abierto = np.array([calendarios[f.year].mascara(f) for f in fechas], dtype=np.uint32)
+
+    trabajo = np.zeros((len(ids), len(fechas)), dtype=np.uint32)
+    for i, pid in enumerate(ids):
+        semanal = np.array(plantillas[pid].mascaras, dtype=np.uint32)[dias_semana]
+        turnos = [turno for _, turno in resolutores[pid].rango(desde, hasta)]
+        con_turno = np.array([t is not None for t in turnos])
+        por_turno = np.array([mascara_turno(t) if t is not None else 0 for t in turnos], dtype=np.uint32)
+        trabajo[i] = np.where(con_turno, por_turno, semanal)
+
+    return trabajo & abierto, dias_semana
+
+
+def _bloques_reservados(ids, desde, hasta, n_dias):
+    """Array bool (peluqueros, días, bloques) con lo ocupado por citas activas."""
+    reservado = np.zeros((len(ids), n_dias, N_BLOQUES), dtype=bool)
+    indice = {pid: i for i, pid in enumerate(ids)}
+
+    filas = [
+        (indice[pid], (fecha - desde).days, *_tramo_cita(hora, hora_fin))
+        for pid, fecha, hora, hora_fin in Cita.objects.activas()
+        .filter(peluquero_id__in=ids, fecha__gte=desde, fecha__lte=hasta)
+        .values_list("peluquero_id", "fecha", "hora", "hora_fin")
+        .iterator(chunk_size=5000)
+    ]
+    if not filas:
+        return reservado
+
+    p, d, inicio, fin = np.array(filas, dtype=np.int64).T
+    primero = np.clip((inicio - INICIO_REJILLA) // PASO, 0, N_BLOQUES)
+    ultimo = np.clip(-(-(fin - INICIO_REJILLA) // PASO), 0, N_BLOQUES)
+    # Se marca un bloque de cada cita por vuelta (tantas vueltas como la cita más larga)
+    for k in range(int((ultimo - primero).max(initial=0))):
+        sel = primero + k < ultimo
+        reservado[p[sel], d[sel], primero[sel] + k] = True
+    return reservado
+
+
+def calcular_ocupacion(desde, hasta):
+    """Ocupación, capacidad libre y mapa de calor de todos los peluqueros.
+
+    Devuelve un dict con datos ya listos para la plantilla (se cachea unos
+    minutos por rango de fechas).
+    """
+    clave = f"informes:ocupacion:{desde.isoformat()}:{hasta.isoformat()}"
+    informe = cache.get(clave)
+    if informe is not None:
+        return informe
+
+    peluqueros = list(Peluqueros.objects.order_by("nombre", "apellido").values_list("id", "nombre", "apellido"))
+    ids = [p[0] for p in peluqueros]
+    fechas = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+
+    trabajo, dias_semana = _mascaras_trabajo(ids, fechas, desde, hasta)
+    trabajando = _bits(trabajo)
+    reservado = _bloques_reservados(ids, desde, hasta, len(fechas))
+    en_turno = reservado & trabajando
+
+    # Totales por peluquero (bloques)
+    trabajo_p = trabajando.sum(axis=(1, 2))
+    reservado_p = en_turno.sum(axis=(1, 2))
+    fuera_p = (reservado & ~trabajando).sum(axis=(1, 2))
+
+    # Por día de la semana y bloque, sumando todos los peluqueros
+    trabajo_db = trabajando.sum(axis=0)
+    reservado_db = en_turno.sum(axis=0)
+    trabajo_sb = np.zeros((7, N_BLOQUES), dtype=np.int64)
+    reservado_sb = np.zeros((7, N_BLOQUES), dtype=np.int64)
+    np.add.at(trabajo_sb, dias_semana, trabajo_db)
+    np.add.at(reservado_sb, dias_semana, reservado_db)
+
+    trabajo_s = trabajo_sb.sum(axis=1)
+    reservado_s = reservado_sb.sum(axis=1)
+    mapa = _porcentaje(reservado_sb, trabajo_sb)
+
+    horas = [
+        f"{(INICIO_REJILLA + i * PASO) // 60:02d}:{(INICIO_REJILLA + i * PASO) % 60:02d}"
+        for i in range(N_BLOQUES)
+    ]
+
+    informe = {
+        "desde": desde,
+        "hasta": hasta,
+        "horas": horas,
+        "peluqueros": [
+            {
+                "nombre": f"{nombre} {apellido}".strip(),
+                "horas_trabajo": float(trabajo_p[i] * HORAS_BLOQUE),
+                "horas_reservadas": float(reservado_p[i] * HORAS_BLOQUE),
+                "horas_libres": float((trabajo_p[i] - reservado_p[i]) * HORAS_BLOQUE),
+                "horas_fuera_turno": float(fuera_p[i] * HORAS_BLOQUE),
+                "ocupacion": float(_porcentaje(reservado_p[i], trabajo_p[i])),
+            }
+            for i, (_, nombre, apellido) in enumerate(peluqueros)
+        ],
+        "dias_semana": [
+            {
+                "nombre": DIAS_SEMANA[d],
+                "horas_trabajo": float(trabajo_s[d] * HORAS_BLOQUE),
+                "horas_reservadas": float(reservado_s[d] * HORAS_BLOQUE),
+                "ocupacion": float(_porcentaje(reservado_s[d], trabajo_s[d])),
+                "mapa": [{"valor": round(float(v)), "alfa": float(v) / 100} for v in mapa[d]],
+            }
+            for d in range(7)
+        ],
+        "por_hora": [round(float(v)) for v in _porcentaje(reservado_sb.sum(axis=0), trabajo_sb.sum(axis=0))],
+        "total": {
+            "horas_trabajo": float(trabajo_p.sum() * HORAS_BLOQUE),
+            "horas_reservadas": float(reservado_p.sum() * HORAS_BLOQUE),
+            "ocupacion": float(_porcentaje(reservado_p.sum(), trabajo_p.sum())),
+        },
+    }
+    cache.set(clave, informe, DURACION_CACHE)
+    return informe
@@ -0,0 +1,107 @@
+"""Límite de peticiones por usuario/IP y grupo de vistas, sobre la caché.
+
+Cada grupo se configura en settings.LIMITES_PETICIONES como
+{"grupo": (peticiones, segundos)}. Se cuenta con una ventana deslizante
+aproximada: el contador de la ventana actual más el de la anterior,
+ponderado por la parte de esta que aún cae dentro de los últimos
+`segundos`. Así no se pueden juntar dos ráfagas completas a los lados del
+cambio de ventana.
+
+Cada ventana es una sola clave con las dos cuentas en un entero
+(anterior * BASE + actual), de modo que una comprobación normal es un
+único `incr`. Solo la primera petición de cada ventana lee la cuenta de la
+anterior y crea la clave (`add`), y las rechazadas deshacen su incremento
+(`decr`) para no contar.
+"""
+
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+# Las dos cuentas de una ventana van en un entero: anterior * BASE + actual
+BASE = 2**32
+
+
+def _identificador(request, por_ip):
+    if not por_ip and request.user.is_authenticated:
+        return f"u{request.user.pk}"
+    # Detrás de un proxy inverso REMOTE_ADDR es el del proxy: configurarlo
+    # para que lo sustituya por la IP real del cliente.
+    return f"ip{request.META.get('REMOTE_ADDR', '')}"
+
+
+def _espera(peticiones, segundos, anterior, actual, transcurrido):
+    """Segundos hasta que la cuenta ponderada baje del límite (si no llega nada más)."""
+    if actual < peticiones:
+        # Dentro de esta ventana, a medida que pesa menos la anterior
+        hasta = segundos * (1 - (peticiones - actual) / anterior)
+    else:
+        # En la siguiente, cuando la actual pase a ser la anterior
+        hasta = segundos + segundos * (1 - peticiones / actual)
+    return max(1, math.floor(hasta - transcurrido) + 1)
+
+
+def consumir(grupo, identificador):
+    """Cuenta una petición; devuelve los segundos de espera si se pasa (o 0)."""
+    limite = getattr(settings, "LIMITES_PETICIONES", {}).get(grupo)
+    if not limite:
+        return 0
+    peticiones, segundos = limite
+
+    ventana, transcurrido = divmod(time.time(), segundos)
+    ventana = int(ventana)
+    clave = f"limite:{grupo}:{identificador}:{ventana}"
+
+    try:
+        valor = cache.incr(clave)
+    except ValueError:
+        # Primera de la ventana: se guarda con ella la cuenta de la anterior.
+        # Tiene que durar hasta el final de la ventana siguiente.
+        anterior = cache.get(f"limite:{grupo}:{identificador}:{ventana - 1}", 0) % BASE
+        valor = anterior * BASE + 1
+        if not cache.add(clave, valor, math.ceil(2 * segundos - transcurrido)):
+            # Otra petición la ha creado entretanto
+            valor = cache.incr(clave)
+    anterior, actual = divmod(valor, BASE)
+
+    # `actual` ya incluye esta petición
+    peso = anterior * (segundos - transcurrido) / segundos
+    if actual - 1 + peso >= peticiones:
+        try:
+            cache.decr(clave)
+        except ValueError:
+            pass
+        return _espera(peticiones, segundos, anterior, actual - 1, transcurrido)
+    return 0
+
+
+def limitar(grupo, *, metodos=None, por_ip=False, json=True):
+    """Decorador: responde 429 (con Retry-After) al superar el límite del grupo.
+
+    `metodos` restringe el límite a esos métodos HTTP (p. ej. solo el POST
+    del login). Con `por_ip` se cuenta por IP aunque haya usuario, sin tocar
+    la sesión (API pública).
+    """
+
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if metodos is None or request.method in metodos:
+                espera = consumir(grupo, _identificador(request, por_ip))
+                if espera:
+                    mensaje = f"Demasiadas peticiones. Inténtalo de nuevo en {espera} segundos."
+                    if json:
+                        response = JsonResponse({"error": mensaje}, status=429)
+                    else:
+                        response = HttpResponse(mensaje, status=429, content_type="text/plain; charset=utf-8")
+                    response["Retry-After"] = str(espera)
+                    return response
+            return vista(request, *args, **kwargs)
+
+        return envoltura
+
+    return decorador
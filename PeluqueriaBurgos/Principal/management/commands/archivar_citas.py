@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from Principal.archivo import archivables, archivar_lote
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve a CitaHistorica las citas cerradas (realizadas, canceladas o no "
+        "presentado) anteriores a una fecha de corte, por lotes (una transacción "
+        "por lote). Se puede interrumpir y volver a lanzar: sigue por donde se quedó."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--antes", default=None, help="Fecha de corte (AAAA-MM-DD), no incluida.")
+        parser.add_argument(
+            "--anios",
+            type=int,
+            default=2,
+            help="Si no se indica --antes, archivar lo anterior al 1 de enero de hace N años.",
+        )
+        parser.add_argument("--lote", type=int, default=2000, help="Citas por lote.")
+        parser.add_argument("--pausa", type=float, default=0, help="Segundos de espera entre lotes.")
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote debe ser mayor que 0.")
+
+        if options["antes"]:
+            corte = parse_date(options["antes"])
+            if not corte:
+                raise CommandError("--antes debe tener formato AAAA-MM-DD.")
+        else:
+            corte = date(timezone.localdate().year - options["anios"], 1, 1)
+
+        pendientes = archivables(corte).count()
+        self.stdout.write(f"Citas a archivar anteriores a {corte}: {pendientes}")
+
+        total = 0
+        inicio = time.monotonic()
+        while movidas := archivar_lote(corte, options["lote"]):
+            total += movidas
+            segundos = time.monotonic() - inicio
+            self.stdout.write(f"{total}/{pendientes} archivadas ({total / segundos:.0f} citas/s)")
+            if options["pausa"]:
+                time.sleep(options["pausa"])
+
+        self.stdout.write(self.style.SUCCESS(f"Archivo terminado: {total} citas movidas a CitaHistorica."))
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from Principal.cambios import registrar_ids
+from Principal.models import Cambio, Cita
+from Principal.resumenes import sumar_citas
+
+ESTADOS_CIERRE = {
+    "realizada": Cita.Estado.REALIZADA,
+    "no-presentado": Cita.Estado.NO_PRESENTADO,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Cierra las citas pendientes de días pasados (como realizadas o no "
+        "presentado). Avanza por id en lotes cortos, cada uno en su transacción, "
+        "así que se puede lanzar desde cron, interrumpir y repetir sin efectos dobles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--como",
+            choices=sorted(ESTADOS_CIERRE),
+            default="realizada",
+            help="Estado con el que se cierran (por defecto, realizada).",
+        )
+        parser.add_argument(
+            "--antes",
+            default=None,
+            help="Cerrar las anteriores a esta fecha (por defecto y como mucho, hoy).",
+        )
+        parser.add_argument("--lote", type=int, default=500, help="Citas por lote.")
+        parser.add_argument("--pausa", type=float, default=0, help="Segundos de espera entre lotes.")
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote debe ser mayor que 0.")
+        hoy = timezone.localdate()
+        corte = hoy
+        if options["antes"]:
+            corte = parse_date(options["antes"])
+            if not corte:
+                raise CommandError("--antes debe tener formato AAAA-MM-DD.")
+            # Las citas de hoy en adelante aún no han pasado
+            if corte > hoy:
+                raise CommandError(f"--antes no puede ser posterior a hoy ({hoy}).")
+        estado = ESTADOS_CIERRE[options["como"]]
+
+        total = 0
+        ultimo_pk = 0
+        inicio = time.monotonic()
+        while True:
+            cerradas, ultimo_pk = self._cerrar_lote(corte, estado, ultimo_pk, options["lote"])
+            if ultimo_pk is None:
+                break
+            total += cerradas
+            if options["pausa"]:
+                time.sleep(options["pausa"])
+
+        segundos = time.monotonic() - inicio
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} citas anteriores a {corte} cerradas como {estado.label} en {segundos:.1f} s."
+            )
+        )
+
+    @transaction.atomic
+    def _cerrar_lote(self, corte, estado, despues_de, tamano):
+        """Cierra el siguiente lote por id. Devuelve (cerradas, último id o None si no quedan)."""
+        pendientes = Cita.objects.filter(estado=Cita.Estado.PENDIENTE, fecha__lt=corte)
+        # Bloqueo solo de las filas del lote, y solo hasta el final de esta transacción
+        pks = list(
+            pendientes.filter(pk__gt=despues_de)
+            .select_for_update()
+            .order_by("pk")
+            .values_list("pk", flat=True)[:tamano]
+        )
+        if not pks:
+            return 0, None
+
+        ahora = timezone.now()
+        if pendientes.filter(pk__in=pks).update(estado=estado, actualizado_en=ahora):
+            # Sin bloqueo (SQLite) alguna pudo cambiar entre la lectura y el
+            # update: solo cuentan las que llevan la marca de este update
+            cerradas = list(
+                Cita.objects.filter(pk__in=pks, estado=estado, actualizado_en=ahora).values_list("pk", flat=True)
+            )
+            # update() no lanza señales: se suma al resumen diario lo que
+            # aportan ahora y se registra el cambio
+            sumar_citas(Cita.objects.filter(pk__in=cerradas))
+            registrar_ids(Cita, Cambio.Accion.MODIFICACION, cerradas)
+        else:
+            cerradas = []
+        return len(cerradas), pks[-1]
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Principal.cambios import compactar
+from Principal.models import Cambio
+
+
+class Command(BaseCommand):
+    help = (
+        "Compacta el registro de cambios: de los cambios anteriores a N días deja "
+        "solo el último de cada objeto. Por tramos de id, cada uno en su transacción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=30, help="Conservar enteros los cambios de los últimos N días.")
+        parser.add_argument("--lote", type=int, default=5000, help="Ids revisados por transacción.")
+
+    def handle(self, *args, **options):
+        if options["dias"] < 0 or options["lote"] < 1:
+            raise CommandError("--dias no puede ser negativo y --lote debe ser mayor que 0.")
+
+        corte = timezone.now() - timedelta(days=options["dias"])
+        antes = Cambio.objects.count()
+        inicio = time.monotonic()
+        borrados = compactar(corte, options["lote"])
+        segundos = time.monotonic() - inicio
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Cambios compactados: {borrados} borrados de {antes}, anteriores a {corte:%Y-%m-%d %H:%M} "
+                f"({segundos:.1f} s)."
+            )
+        )
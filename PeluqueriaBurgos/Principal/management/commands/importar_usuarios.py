@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from Principal.busqueda import backend as busqueda
+from Principal.models import Cliente
+
+CAMPOS_USUARIO = ("username", "email", "first_name", "last_name")
+
+
+def _iniciar_proceso():
+    # Con "spawn" los procesos hijos arrancan sin Django configurado
+    if not django.apps.apps.ready:
+        django.setup()
+
+
+def _texto(fila, campo, errores, limpiar=True):
+    """Valor de un campo como texto; los enteros (un teléfono en JSON) se convierten.
+
+    Con cualquier otro tipo anota el error y devuelve None.
+    """
+    valor = fila.get(campo)
+    if valor is None:
+        return ""
+    if isinstance(valor, bool) or not isinstance(valor, (str, int)):
+        errores.append(f"{campo}: se esperaba texto")
+        return None
+    valor = str(valor)
+    return valor.strip() if limpiar else valor
+
+
+def _preparar(numero_y_fila):
+    """Valida una fila y calcula el hash de su contraseña (en un proceso hijo).
+
+    Devuelve (número, username, datos, errores): `datos` son los campos del
+    usuario con la contraseña ya cifrada, o None si la fila no es válida.
+    """
+    numero, fila = numero_y_fila
+    User = get_user_model()
+
+    if "_error" in fila:
+        return numero, "", None, [fila["_error"]]
+
+    errores = []
+    campos = {campo: _texto(fila, campo, errores) for campo in CAMPOS_USUARIO}
+    password = _texto(fila, "password", errores, limpiar=False)
+    telefono = _texto(fila, "telefono", errores)
+    username = campos["username"]
+    if username == "":
+        errores.append("falta username")
+    if password == "":
+        errores.append("falta password")
+    if errores:
+        return numero, username or "", None, errores
+
+    user = User(**campos)
+    try:
+        user.clean_fields(exclude=["password", "last_login", "date_joined"])
+    except ValidationError as e:
+        errores.extend(f"{campo}: {m}" for campo, mensajes in e.message_dict.items() for m in mensajes)
+    try:
+        validate_password(password, user=user)
+    except ValidationError as e:
+        errores.extend(e.messages)
+    if len(telefono) > Cliente._meta.get_field("telefono").max_length:
+        errores.append("telefono: demasiado largo")
+    if errores:
+        return numero, username, None, errores
+
+    datos = {campo: getattr(user, campo) for campo in CAMPOS_USUARIO}
+    datos["password"] = make_password(password)
+    datos["telefono"] = telefono
+    return numero, username, datos, []
+
+
+class Command(BaseCommand):
+    help = (
+        "Da de alta usuarios y sus clientes desde un CSV o JSONL (campos: username, "
+        "password, email, first_name, last_name, telefono). Las contraseñas se "
+        "validan y cifran en paralelo y las filas se insertan por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fichero", help="Ruta del CSV/JSONL, o '-' para leer de la entrada estándar.")
+        parser.add_argument(
+            "--formato",
+            choices=["csv", "jsonl"],
+            default=None,
+            help="Por defecto se deduce de la extensión (CSV si no se puede).",
+        )
+        parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="Procesos para cifrar.")
+        parser.add_argument("--lote", type=int, default=1000, help="Filas por lote (y por transacción).")
+
+    def handle(self, *args, **options):
+        if options["procesos"] < 1 or options["lote"] < 1:
+            raise CommandError("--procesos y --lote deben ser mayores que 0.")
+
+        fichero = options["fichero"]
+        formato = options["formato"] or ("jsonl" if fichero.endswith((".jsonl", ".ndjson")) else "csv")
+        try:
+            entrada = sys.stdin if fichero == "-" else open(fichero, newline="", encoding="utf-8")
+        except OSError as e:
+            raise CommandError(f"No se puede abrir {fichero}: {e}")
+
+        self.creados = self.errores = self.leidas = 0
+        inicio = time.monotonic()
+
+        # Los procesos hijos no usan la BD; no deben heredar sus conexiones
+        connections.close_all()
+        with entrada, ProcessPoolExecutor(max_workers=options["procesos"], initializer=_iniciar_proceso) as pool:
+            filas = self._leer(entrada, formato)
+            while lote := list(islice(filas, options["lote"])):
+                self.leidas += len(lote)
+                trozo = max(1, len(lote) // (options["procesos"] * 4))
+                preparadas = list(pool.map(_preparar, lote, chunksize=trozo))
+                self._insertar(preparadas)
+
+                segundos = time.monotonic() - inicio
+                self.stdout.write(
+                    f"{self.leidas} filas leídas, {self.creados} creadas, {self.errores} con error "
+                    f"({self.leidas / segundos:.0f} filas/s)"
+                )
+
+        segundos = time.monotonic() - inicio
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Importación terminada: {self.creados} usuarios creados, {self.errores} filas con error, "
+                f"{segundos:.1f} s ({self.leidas / segundos if segundos else 0:.0f} filas/s)."
+            )
+        )
+
+    def _leer(self, entrada, formato):
+        """Genera (número de línea, fila) sin cargar el fichero entero."""
+        if formato == "csv":
+            lector = csv.DictReader(entrada)
+            for fila in lector:
+                yield lector.line_num, fila
+            return
+
+        for numero, linea in enumerate(entrada, start=1):
+            if not linea.strip():
+                continue
+            try:
+                fila = json.loads(linea)
+                if not isinstance(fila, dict):
+                    raise ValueError("se esperaba un objeto")
+            except ValueError as e:
+                fila = {"_error": f"JSON inválido: {e}"}
+            yield numero, fila
+
+    def _error(self, numero, username, mensajes):
+        self.errores += 1
+        self.stderr.write(f"Línea {numero} ({username or '-'}): {'; '.join(mensajes)}")
+
+    def _insertar(self, preparadas):
+        User = get_user_model()
+
+        validas = {}
+        for numero, username, datos, errores in preparadas:
+            if datos is None:
+                self._error(numero, username, errores)
+            elif username in validas:
+                self._error(numero, username, ["username repetido en el fichero"])
+            else:
+                validas[username] = (numero, datos)
+
+        with transaction.atomic():
+            existentes = set(
+                User.objects.filter(username__in=list(validas)).values_list("username", flat=True)
+            )
+            for username in existentes:
+                self._error(validas.pop(username)[0], username, ["el usuario ya existe"])
+
+            usuarios = User.objects.bulk_create(
+                [
+                    User(**{campo: datos[campo] for campo in (*CAMPOS_USUARIO, "password")})
+                    for _, datos in validas.values()
+                ]
+            )
+            ids = {u.username: u.pk for u in usuarios}
+            if None in ids.values():
+                # Bases de datos que no devuelven los ids en bulk_create
+                ids = dict(User.objects.filter(username__in=list(validas)).values_list("username", "pk"))
+
+            creados = Cliente.objects.bulk_create(
+                [
+                    Cliente(
+                        user_id=ids[username],
+                        nombre=datos["first_name"] or username,
+                        apellido=datos["last_name"],
+                        email=datos["email"],
+                        telefono=datos["telefono"],
+                    )
+                    for username, (_, datos) in validas.items()
+                ]
+            )
+            # bulk_create no lanza señales
+            busqueda().indexar(creados)
+        self.creados += len(validas)
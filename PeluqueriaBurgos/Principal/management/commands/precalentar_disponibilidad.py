@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from Principal.disponibilidad import HORIZONTE_DIAS, cache_por_proceso, guardar_dias, versiones_dias
+from Principal.models import Peluqueros, Servicio, _servicio_duracion_minutos
+
+
+def _iniciar_proceso():
+    # Con "spawn" los procesos hijos arrancan sin Django configurado
+    if not django.apps.apps.ready:
+        django.setup()
+
+
+def _calcular(trabajo):
+    """Máscaras de cada día de un grupo de peluqueros (en un proceso hijo).
+
+    Una sola BloqueAgenda por grupo: plantillas, turnos y citas del rango se
+    cargan de una vez.
+    """
+    from Principal.disponibilidad import BloqueAgenda
+
+    peluquero_ids, desde, hasta = trabajo
+    bloque = BloqueAgenda(peluquero_ids, desde, hasta)
+    dias = [desde + timedelta(days=d) for d in range((hasta - desde).days + 1)]
+    mascaras = {(pid, fecha): bloque.mascaras_dia(pid, fecha) for pid in peluquero_ids for fecha in dias}
+    connections.close_all()
+    return mascaras
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula por adelantado la disponibilidad de los próximos días de cada "
+        "peluquero y la deja en la caché compartida. Cada entrada vale para "
+        "cualquier duración de servicio. Pensado para lanzarlo tras un despliegue "
+        "o de madrugada, antes de que lleguen las reservas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=HORIZONTE_DIAS, help="Días desde hoy (incluido).")
+        parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="Procesos de cálculo.")
+        parser.add_argument(
+            "--peluquero", type=int, action="append", default=[], help="Solo estos peluqueros (id; repetible)."
+        )
+
+    def handle(self, *args, **options):
+        if options["dias"] < 1 or options["procesos"] < 1:
+            raise CommandError("--dias y --procesos deben ser mayores que 0.")
+
+        if cache_por_proceso():
+            self.stderr.write(
+                "Aviso: la caché es local a este proceso (LocMemCache); lo calculado "
+                "no llegará al servidor web. Configura una caché compartida en CACHES."
+            )
+
+        peluqueros = Peluqueros.objects.filter(servicios__activo=True).distinct().order_by("pk")
+        if options["peluquero"]:
+            peluqueros = peluqueros.filter(pk__in=options["peluquero"])
+        ids = list(peluqueros.values_list("pk", flat=True))
+        if not ids:
+            self.stdout.write("No hay peluqueros con servicios activos: nada que calcular.")
+            return
+        duraciones = {
+            _servicio_duracion_minutos(s) for s in Servicio.objects.filter(activo=True, peluqueros__in=ids).distinct()
+        }
+
+        desde = timezone.localdate()
+        hasta = desde + timedelta(days=options["dias"] - 1)
+        pares = [(pid, desde + timedelta(days=d)) for pid in ids for d in range(options["dias"])]
+
+        # Las versiones se leen antes de calcular: si algo cambia mientras
+        # tanto, la entrada se guarda con la versión vieja y no se usará
+        inicio = time.monotonic()
+        versiones = versiones_dias(pares)
+        t_versiones = time.monotonic() - inicio
+
+        # Grupos de peluqueros, varios por proceso para repartir mejor
+        trozo = max(1, len(ids) // (options["procesos"] * 4))
+        grupos = [(ids[i:i + trozo], desde, hasta) for i in range(0, len(ids), trozo)]
+
+        inicio = time.monotonic()
+        mascaras = {}
+        if options["procesos"] == 1:
+            for grupo in grupos:
+                mascaras.update(_calcular(grupo))
+        else:
+            # Los procesos hijos abren su propia conexión; no deben heredar la nuestra
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options["procesos"], initializer=_iniciar_proceso) as pool:
+                for resultado in pool.map(_calcular, grupos):
+                    mascaras.update(resultado)
+        t_calculo = time.monotonic() - inicio
+
+        inicio = time.monotonic()
+        guardar_dias(mascaras, versiones)
+        t_escritura = time.monotonic() - inicio
+
+        total = t_versiones + t_calculo + t_escritura
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(mascaras)} días precalculados ({len(ids)} peluqueros × {options['dias']} días, "
+                f"{len(duraciones)} duraciones de servicio) con {options['procesos']} procesos en "
+                f"{total:.2f} s ({len(mascaras) / total if total else 0:.0f} días/s): versiones "
+                f"{t_versiones:.2f} s, cálculo {t_calculo:.2f} s, escritura {t_escritura:.2f} s."
+            )
+        )
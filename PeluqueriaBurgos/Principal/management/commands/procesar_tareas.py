@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from Principal.models import Tarea
+from Principal.tareas import MANEJADORES, procesar_lote
+
+
+class Command(BaseCommand):
+    help = (
+        "Trabajador de la cola de tareas: reserva lotes de tareas pendientes y los "
+        "ejecuta en varios hilos, con reintentos y espera exponencial. Muestra "
+        "cada cierto tiempo las hechas por segundo, los reintentos y los fallos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=4, help="Hilos trabajando a la vez.")
+        parser.add_argument("--tipos", default="", help="Tipos de tarea separados por comas (por defecto, todos).")
+        parser.add_argument("--espera", type=float, default=2.0, help="Segundos de espera cuando no hay tareas.")
+        parser.add_argument("--informe", type=float, default=30.0, help="Segundos entre informes de progreso.")
+        parser.add_argument(
+            "--una-vez",
+            action="store_true",
+            help="Procesar lo que esté listo y terminar (sin esperar a los reintentos).",
+        )
+
+    def handle(self, *args, **options):
+        if options["hilos"] < 1:
+            raise CommandError("--hilos debe ser mayor que 0.")
+        tipos = [t for t in options["tipos"].split(",") if t] or sorted(MANEJADORES)
+        desconocidos = set(tipos) - set(MANEJADORES)
+        if desconocidos:
+            raise CommandError(f"Tipos sin manejador: {', '.join(sorted(desconocidos))}.")
+
+        self.parar = threading.Event()
+        self.totales = Counter()
+        self.cerrojo = threading.Lock()
+        self.inicio = time.monotonic()
+
+        prefijo = f"{socket.gethostname()}-{os.getpid()}"
+        hilos = [
+            threading.Thread(
+                target=self._trabajar,
+                args=(f"{prefijo}-{i}", tipos, options["espera"], options["una_vez"]),
+                daemon=True,
+            )
+            for i in range(options["hilos"])
+        ]
+        self.stdout.write(f"{len(hilos)} hilos procesando: {', '.join(tipos)}")
+        for hilo in hilos:
+            hilo.start()
+
+        try:
+            while any(h.is_alive() for h in hilos):
+                for hilo in hilos:
+                    hilo.join(timeout=options["informe"] / len(hilos))
+                self._informe(tipos)
+        except KeyboardInterrupt:
+            self.stdout.write("Parando: se terminan los lotes en curso...")
+            self.parar.set()
+            for hilo in hilos:
+                hilo.join()
+        self._informe(tipos, final=True)
+
+    def _trabajar(self, nombre, tipos, espera, una_vez):
+        try:
+            while not self.parar.is_set():
+                trabajado = False
+                for tipo in tipos:
+                    try:
+                        resultado = procesar_lote(tipo, nombre)
+                    except OperationalError as e:
+                        # SQLite ocupado por otro hilo: se vuelve a intentar
+                        self.stderr.write(f"{nombre}: {e}")
+                        self.parar.wait(0.5)
+                        trabajado = True
+                        continue
+                    if resultado:
+                        hechas, reintentos, fallidas = resultado
+                        with self.cerrojo:
+                            self.totales.update(hechas=hechas, reintentos=reintentos, fallidas=fallidas, lotes=1)
+                        trabajado = True
+                if not trabajado:
+                    if una_vez:
+                        break
+                    self.parar.wait(espera)
+        finally:
+            connection.close()
+
+    def _informe(self, tipos, final=False):
+        segundos = time.monotonic() - self.inicio
+        with self.cerrojo:
+            t = dict(self.totales)
+        pendientes = Tarea.objects.filter(tipo__in=tipos, estado=Tarea.Estado.PENDIENTE).count()
+        linea = (
+            f"[{segundos:.0f} s] {t.get('hechas', 0)} hechas ({t.get('hechas', 0) / segundos if segundos else 0:.1f}/s) "
+            f"en {t.get('lotes', 0)} lotes, {t.get('reintentos', 0)} reintentos, {t.get('fallidas', 0)} fallidas, "
+            f"{pendientes} pendientes"
+        )
+        self.stdout.write(self.style.SUCCESS(linea) if final else linea)
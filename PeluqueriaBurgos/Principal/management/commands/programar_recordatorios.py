@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from Principal.recordatorios import programar_recordatorios
+
+
+class Command(BaseCommand):
+    help = (
+        "Encola los recordatorios por correo de las citas pendientes de un día "
+        "(por defecto, mañana). Pensado para cron; repetirlo no duplica avisos. "
+        "Los envía `manage.py procesar_tareas`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fecha", default=None, help="Día de las citas (AAAA-MM-DD). Por defecto, mañana.")
+
+    def handle(self, *args, **options):
+        fecha = timezone.localdate() + timedelta(days=1)
+        if options["fecha"]:
+            fecha = parse_date(options["fecha"])
+            if not fecha:
+                raise CommandError("--fecha debe tener formato AAAA-MM-DD.")
+
+        citas = programar_recordatorios(fecha)
+        self.stdout.write(self.style.SUCCESS(f"Recordatorios encolados para {citas} citas del {fecha:%d/%m/%Y}."))
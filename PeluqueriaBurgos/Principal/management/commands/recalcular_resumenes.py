@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_date
+
+from Principal.models import Cita, CitaHistorica
+from Principal.resumenes import recalcular
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye el resumen diario de citas (ResumenDiario) mes a mes. "
+        "Sirve para la carga inicial y para reparar desajustes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", default=None, help="Fecha inicial (AAAA-MM-DD). Por defecto, la primera cita.")
+        parser.add_argument("--hasta", default=None, help="Fecha final (AAAA-MM-DD). Por defecto, la última cita.")
+
+    def handle(self, *args, **options):
+        limites = [
+            modelo.objects.aggregate(primera=Min("fecha"), ultima=Max("fecha"))
+            for modelo in (Cita, CitaHistorica)
+        ]
+        primeras = [l["primera"] for l in limites if l["primera"]]
+        ultimas = [l["ultima"] for l in limites if l["ultima"]]
+        desde = self._fecha(options["desde"], "--desde") or min(primeras, default=None)
+        hasta = self._fecha(options["hasta"], "--hasta") or max(ultimas, default=None)
+
+        if not desde or not hasta:
+            self.stdout.write("No hay citas que resumir.")
+            return
+        if hasta < desde:
+            raise CommandError("--hasta no puede ser anterior a --desde.")
+
+        total = 0
+        inicio_mes = desde
+        while inicio_mes <= hasta:
+            siguiente = date(inicio_mes.year + inicio_mes.month // 12, inicio_mes.month % 12 + 1, 1)
+            fin_mes = min(siguiente - timedelta(days=1), hasta)
+            # Una transacción por mes para no bloquear la tabla mucho rato
+            filas = recalcular(inicio_mes, fin_mes)
+            total += filas
+            self.stdout.write(f"{inicio_mes:%Y-%m}: {filas} filas")
+            inicio_mes = siguiente
+
+        self.stdout.write(self.style.SUCCESS(f"Resumen recalculado ({total} filas) de {desde} a {hasta}."))
+
+    def _fecha(self, valor, opcion):
+        if not valor:
+            return None
+        fecha = parse_date(valor)
+        if not fecha:
+            raise CommandError(f"{opcion} debe tener formato AAAA-MM-DD.")
+        return fecha
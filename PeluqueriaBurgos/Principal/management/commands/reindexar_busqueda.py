@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Principal.busqueda import backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Rehace el índice de búsqueda de clientes (FTS5 en SQLite) desde la tabla "
+        "de clientes. Útil tras cargas masivas sin señales o cambios en el índice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=2000, help="Clientes indexados por vez.")
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote debe ser mayor que 0.")
+
+        motor = backend()
+        inicio = time.monotonic()
+        total = motor.reconstruir(lote=options["lote"])
+        segundos = time.monotonic() - inicio
+        if total is None:
+            self.stdout.write(f"{type(motor).__name__} no usa índice propio: nada que reindexar.")
+            return
+        self.stdout.write(
+            self.style.SUCCESS(f"Índice de búsqueda rehecho: {total} clientes en {segundos:.1f} s.")
+        )
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from Principal.disponibilidad import (
+    INICIO_REJILLA,
+    MASCARA_COMIDA,
+    _minutos,
+    _tramo_cita,
+    calendario_salon,
+    mascara_ocupada,
+    mascara_trabajo,
+    plantilla_semanal,
+    resolutor_turnos,
+)
+from Principal.models import CIERRE, Cita
+
+
+class Command(BaseCommand):
+    help = (
+        "Revisa las citas activas en una sola pasada (ordenadas por peluquero, fecha "
+        "y hora) y escribe en JSONL las que se solapan o incumplen las reglas: "
+        "domingos y cierres, comida, horario de la peluquería y turno del peluquero."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", default=None, help="Fecha inicial (AAAA-MM-DD).")
+        parser.add_argument("--hasta", default=None, help="Fecha final (AAAA-MM-DD).")
+        parser.add_argument("--salida", default="-", help="Fichero JSONL del informe ('-' = salida estándar).")
+        parser.add_argument("--lote", type=int, default=5000, help="Filas leídas de la BD por vez.")
+
+    def handle(self, *args, **options):
+        citas = Cita.objects.activas()
+        if options["desde"]:
+            citas = citas.filter(fecha__gte=self._fecha(options["desde"], "--desde"))
+        if options["hasta"]:
+            citas = citas.filter(fecha__lte=self._fecha(options["hasta"], "--hasta"))
+        filas = (
+            citas.order_by("peluquero_id", "fecha", "hora", "pk")
+            .values_list("pk", "peluquero_id", "fecha", "hora", "hora_fin")
+            .iterator(chunk_size=options["lote"])
+        )
+
+        if options["salida"] == "-":
+            salida = nullcontext(self.stdout)
+        else:
+            salida = open(options["salida"], "w", encoding="utf-8")
+        inicio = time.monotonic()
+        with salida as fichero:
+            revisadas, incidencias = self._barrer(filas, fichero)
+        segundos = time.monotonic() - inicio
+
+        resumen = ", ".join(f"{tipo}: {n}" for tipo, n in sorted(incidencias.items())) or "ninguna"
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"{revisadas} citas revisadas en {segundos:.1f} s "
+                f"({revisadas / segundos if segundos else 0:.0f} citas/s). Incidencias: {resumen}."
+            )
+        )
+
+    def _barrer(self, filas, salida):
+        """Barrido en orden: solo guarda el estado del peluquero/día en curso."""
+        incidencias = Counter()
+        revisadas = 0
+        cierre = _minutos(CIERRE)
+
+        peluquero_actual = dia_actual = None
+        plantilla = resolutor = None
+        abierto = trabajo = 0
+        fin_maximo, cita_fin_maximo = -1, None
+
+        def anotar(tipo, pk, peluquero_id, fecha, hora, hora_fin, **extra):
+            incidencias[tipo] += 1
+            registro = {
+                "tipo": tipo,
+                "cita": pk,
+                "peluquero_id": peluquero_id,
+                "fecha": fecha.isoformat(),
+                "hora": hora.strftime("%H:%M"),
+                "hora_fin": hora_fin.strftime("%H:%M") if hora_fin else None,
+                **extra,
+            }
+            salida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+        for pk, peluquero_id, fecha, hora, hora_fin in filas:
+            revisadas += 1
+            if peluquero_id != peluquero_actual:
+                peluquero_actual, dia_actual = peluquero_id, None
+                plantilla = plantilla_semanal(peluquero_id)
+                resolutor = resolutor_turnos(peluquero_id)
+            if fecha != dia_actual:
+                dia_actual = fecha
+                abierto = calendario_salon(fecha.year).mascara(fecha)
+                trabajo = mascara_trabajo(plantilla, resolutor, fecha)
+                fin_maximo, cita_fin_maximo = -1, None
+
+            fila = (pk, peluquero_id, fecha, hora, hora_fin)
+            inicio, fin = _tramo_cita(hora, hora_fin)
+
+            # Solape con la cita anterior que acaba más tarde
+            if inicio < fin_maximo:
+                anotar("solape", *fila, con=cita_fin_maximo)
+            if fin > fin_maximo:
+                fin_maximo, cita_fin_maximo = fin, pk
+
+            bloques = mascara_ocupada(inicio, fin)
+            if not abierto:
+                tipo = "domingo" if fecha.weekday() == 6 else "cierre"
+                anotar(tipo, *fila, detalle=calendario_salon(fecha.year).motivo_cierre(fecha))
+                continue
+            if bloques & ~abierto & MASCARA_COMIDA:
+                anotar("comida", *fila)
+            elif inicio < INICIO_REJILLA or fin > cierre or bloques & ~abierto:
+                anotar("fuera_de_horario", *fila)
+            if bloques & ~trabajo:
+                anotar("fuera_de_turno", *fila)
+
+        return revisadas, incidencias
+
+    def _fecha(self, valor, opcion):
+        fecha = parse_date(valor)
+        if not fecha:
+            raise CommandError(f"{opcion} debe tener formato AAAA-MM-DD.")
+        return fecha
+
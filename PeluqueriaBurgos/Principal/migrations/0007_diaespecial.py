@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Principal', '0006_turnopeluquero'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaEspecial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_inicio', models.DateField(verbose_name='Fecha inicio')),
+                ('fecha_fin', models.DateField(verbose_name='Fecha fin')),
+                ('tipo', models.CharField(choices=[('FESTIVO', 'Festivo'), ('CIERRE', 'Cierre'), ('HORARIO', 'Horario especial')], max_length=10, verbose_name='Tipo')),
+                ('hora_apertura', models.TimeField(blank=True, null=True, verbose_name='Hora apertura')),
+                ('hora_cierre', models.TimeField(blank=True, null=True, verbose_name='Hora cierre')),
+                ('cierre_comida', models.BooleanField(default=True, help_text='Solo horario especial: mantiene el cierre de 13:30 a 15:00.', verbose_name='Cierra para comer')),
+                ('incluye_domingos', models.BooleanField(default=False, help_text='Solo horario especial: si no se marca, los domingos siguen cerrados.', verbose_name='Abre también los domingos')),
+                ('descripcion', models.CharField(blank=True, max_length=150, verbose_name='Descripción')),
+                ('activo', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Día especial',
+                'verbose_name_plural': 'Días especiales (festivos y cierres)',
+                'ordering': ['-fecha_inicio'],
+                'indexes': [models.Index(fields=['fecha_inicio', 'fecha_fin'], name='Principal_d_fecha_i_d5980e_idx')],
+            },
+        ),
+    ]
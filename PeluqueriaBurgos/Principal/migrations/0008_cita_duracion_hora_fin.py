@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:11
+
+from datetime import date, datetime, time, timedelta
+
+from django.db import migrations, models, transaction
+
+TAMANO_LOTE = 2000
+
+
+def rellenar_duracion_y_hora_fin(apps, schema_editor):
+    """Copia en cada cita la duración actual de su servicio.
+
+    Va por lotes de id, cada uno en su transacción, para no bloquear la
+    tabla entera; si se interrumpe, al relanzarla sigue por las pendientes.
+    """
+    Cita = apps.get_model("Principal", "Cita")
+    alias = schema_editor.connection.alias
+    ultimo_id = 0
+    while True:
+        lote = list(
+            Cita.objects.using(alias)
+            .filter(pk__gt=ultimo_id, hora_fin__isnull=True)
+            .order_by("pk")
+            .values_list("pk", "hora", "servicio__duracion_minutos")[:TAMANO_LOTE]
+        )
+        if not lote:
+            break
+
+        citas = []
+        for pk, hora, duracion in lote:
+            duracion = int(duracion or 30)
+            fin = datetime.combine(date(2000, 1, 1), hora) + timedelta(minutes=duracion)
+            hora_fin = fin.time() if fin.date() == date(2000, 1, 1) else time(23, 59)
+            citas.append(Cita(pk=pk, duracion_minutos=duracion, hora_fin=hora_fin))
+        with transaction.atomic(using=alias):
+            Cita.objects.using(alias).bulk_update(citas, ["duracion_minutos", "hora_fin"])
+        ultimo_id = lote[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('Principal', '0007_diaespecial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='duracion_minutos',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Duración (minutos)'),
+        ),
+        migrations.AddField(
+            model_name='cita',
+            name='hora_fin',
+            field=models.TimeField(blank=True, editable=False, null=True, verbose_name='Hora fin'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['peluquero', 'fecha', 'hora', 'hora_fin'], name='Principal_c_peluque_d5070f_idx'),
+        ),
+        migrations.RunPython(
+            rellenar_duracion_y_hora_fin,
+            migrations.RunPython.noop,
+            atomic=False,
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Principal', '0008_cita_duracion_hora_fin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('realizadas', models.IntegerField(default=0, verbose_name='Citas realizadas')),
+                ('canceladas', models.IntegerField(default=0, verbose_name='Citas canceladas')),
+                ('minutos', models.IntegerField(default=0, verbose_name='Minutos realizados')),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Ingresos')),
+                ('peluquero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='Principal.peluqueros', verbose_name='Peluquero')),
+                ('servicio', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='resumenes', to='Principal.servicio', verbose_name='Servicio')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario',
+                'verbose_name_plural': 'Resúmenes diarios',
+                'ordering': ['-fecha', 'peluquero'],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'peluquero', 'servicio'), name='resumen_diario_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Principal', '0009_resumendiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CitaHistorica',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha', models.DateField(verbose_name='Fecha de la cita')),
+                ('hora', models.TimeField(verbose_name='Hora de la cita')),
+                ('duracion_minutos', models.PositiveIntegerField(blank=True, null=True, verbose_name='Duración (minutos)')),
+                ('hora_fin', models.TimeField(blank=True, null=True, verbose_name='Hora fin')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('REALIZADA', 'Realizada'), ('CANCELADA', 'Cancelada')], max_length=10, verbose_name='Estado')),
+                ('motivo', models.CharField(blank=True, max_length=255, verbose_name='Motivo')),
+                ('creado_en', models.DateTimeField(verbose_name='Creada en')),
+                ('archivado_en', models.DateTimeField(auto_now_add=True, verbose_name='Archivada en')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='citas_historicas', to='Principal.cliente', verbose_name='Cliente')),
+                ('peluquero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='citas_historicas', to='Principal.peluqueros', verbose_name='Peluquero')),
+                ('servicio', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='citas_historicas', to='Principal.servicio', verbose_name='Servicio')),
+            ],
+            options={
+                'verbose_name': 'Cita histórica',
+                'verbose_name_plural': 'Citas históricas',
+                'ordering': ['-fecha', '-hora'],
+                'indexes': [models.Index(fields=['cliente', 'fecha'], name='Principal_c_cliente_a68d90_idx')],
+            },
+        ),
+    ]
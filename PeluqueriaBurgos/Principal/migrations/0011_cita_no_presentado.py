@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Principal', '0010_citahistorica'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cita',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('REALIZADA', 'Realizada'), ('CANCELADA', 'Cancelada'), ('NO_PRESENTADO', 'No presentado')], default='PENDIENTE', max_length=15, verbose_name='Estado'),
+        ),
+        migrations.AlterField(
+            model_name='citahistorica',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('REALIZADA', 'Realizada'), ('CANCELADA', 'Cancelada'), ('NO_PRESENTADO', 'No presentado')], max_length=15, verbose_name='Estado'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Principal', '0011_cita_no_presentado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='turnopeluquero',
+            name='turno',
+            field=models.CharField(choices=[('MANANA', 'Mañana (08:00–13:30)'), ('TARDE', 'Tarde (15:00–21:00)'), ('COMPLETO', 'Completo (mañana + tarde)'), ('AUSENCIA', 'Ausencia (no trabaja)')], max_length=10, verbose_name='Turno'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:34
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Principal', '0012_turno_ausencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.comparison.Collate('nombre', 'NOCASE'), name='cliente_nombre_nocase'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.comparison.Collate('apellido', 'NOCASE'), name='cliente_apellido_nocase'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.comparison.Collate('telefono', 'NOCASE'), name='cliente_telefono_nocase'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.comparison.Collate('email', 'NOCASE'), name='cliente_email_nocase'),
+        ),
+    ]
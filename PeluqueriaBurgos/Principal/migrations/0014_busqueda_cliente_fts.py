@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:40
+
+import re
+
+from django.db import migrations
+
+# Copia de Principal.busqueda tal como estaba al crear el índice: la
+# migración no debe cambiar si cambia el código de la aplicación
+TABLA_FTS = "busqueda_cliente"
+
+
+def fila_indice(nombre, apellido, email, telefono):
+    """Columnas del índice: el teléfono en dígitos, con y sin prefijo +34 / 0034."""
+    digitos = re.sub(r"\D", "", telefono or "")
+    nacional = digitos
+    for prefijo in ("0034", "34"):
+        if digitos.startswith(prefijo) and len(digitos) - len(prefijo) == 9:
+            nacional = digitos[len(prefijo):]
+            break
+    telefonos = nacional if nacional == digitos else f"{nacional} {digitos}"
+    return (nombre or "", apellido or "", email or "", telefonos)
+
+
+def crear_indice(apps, schema_editor):
+    # Solo SQLite: con otra base de datos la búsqueda usa BusquedaORM
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5("
+        "nombre, apellido, email, telefono, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    Cliente = apps.get_model("Principal", "Cliente")
+    alias = schema_editor.connection.alias
+    filas = [
+        (pk, *fila_indice(nombre, apellido, email, telefono))
+        for pk, nombre, apellido, email, telefono in Cliente.objects.using(alias).values_list(
+            "pk", "nombre", "apellido", "email", "telefono"
+        ).iterator()
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {TABLA_FTS} (rowid, nombre, apellido, email, telefono) VALUES (%s, %s, %s, %s, %s)",
+            filas,
+        )
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLA_FTS}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Principal", "0013_cliente_indices_busqueda"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
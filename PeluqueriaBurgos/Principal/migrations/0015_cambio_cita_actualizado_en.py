@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:52
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Principal', '0014_busqueda_cliente_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='actualizado_en',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Actualizada en'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='Cambio',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('modelo', models.CharField(choices=[('CITA', 'Cita'), ('TURNO', 'Turno por fechas'), ('HORARIO', 'Horario semanal')], max_length=10, verbose_name='Modelo')),
+                ('objeto_id', models.BigIntegerField(verbose_name='Id del objeto')),
+                ('accion', models.CharField(choices=[('ALTA', 'Alta'), ('MODIFICACION', 'Modificación'), ('CANCELACION', 'Cancelación'), ('BORRADO', 'Borrado'), ('ARCHIVADA', 'Archivada')], max_length=15, verbose_name='Acción')),
+                ('datos', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Datos')),
+                ('creado_en', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+            ],
+            options={
+                'verbose_name': 'Cambio',
+                'verbose_name_plural': 'Cambios',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['modelo', 'objeto_id', 'id'], name='Principal_c_modelo_06b792_idx')],
+            },
+        ),
+    ]
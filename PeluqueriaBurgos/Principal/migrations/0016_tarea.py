@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:42
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Principal', '0015_cambio_cita_actualizado_en'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50, verbose_name='Tipo')),
+                ('datos', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Datos')),
+                ('clave', models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='Clave')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En curso'), ('HECHA', 'Hecha'), ('FALLIDA', 'Fallida')], default='PENDIENTE', max_length=10, verbose_name='Estado')),
+                ('intentos', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('max_intentos', models.PositiveIntegerField(default=5, verbose_name='Máximo de intentos')),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Disponible en')),
+                ('reservada_por', models.CharField(blank=True, max_length=64, verbose_name='Reservada por')),
+                ('reservada_hasta', models.DateTimeField(blank=True, null=True, verbose_name='Reservada hasta')),
+                ('ultimo_error', models.TextField(blank=True, verbose_name='Último error')),
+                ('creado_en', models.DateTimeField(auto_now_add=True, verbose_name='Creada en')),
+                ('terminada_en', models.DateTimeField(blank=True, null=True, verbose_name='Terminada en')),
+            ],
+            options={
+                'verbose_name': 'Tarea',
+                'verbose_name_plural': 'Tareas',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['tipo', 'estado', 'disponible_en'], name='Principal_t_tipo_2e0912_idx')],
+            },
+        ),
+    ]
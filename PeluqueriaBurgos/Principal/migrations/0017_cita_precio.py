@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:02
+
+from django.db import migrations, models, transaction
+
+TAMANO_LOTE = 2000
+
+
+def rellenar_precio(apps, schema_editor):
+    """Copia en cada cita (y cita archivada) el precio actual de su servicio.
+
+    Para las citas ya existentes no se sabe el precio al reservar: se toma
+    el de ahora, que es el que usaba el resumen hasta este cambio. Va por
+    lotes de id, cada uno en su transacción.
+    """
+    alias = schema_editor.connection.alias
+    for nombre in ("Cita", "CitaHistorica"):
+        modelo = apps.get_model("Principal", nombre)
+        ultimo_id = 0
+        while True:
+            lote = list(
+                modelo.objects.using(alias)
+                .filter(pk__gt=ultimo_id, precio__isnull=True, servicio__isnull=False)
+                .order_by("pk")
+                .values_list("pk", "servicio__precio")[:TAMANO_LOTE]
+            )
+            if not lote:
+                break
+            with transaction.atomic(using=alias):
+                modelo.objects.using(alias).bulk_update(
+                    [modelo(pk=pk, precio=precio) for pk, precio in lote], ["precio"]
+                )
+            ultimo_id = lote[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('Principal', '0016_tarea'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='precio',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=7, null=True, verbose_name='Precio'),
+        ),
+        migrations.AddField(
+            model_name='citahistorica',
+            name='precio',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True, verbose_name='Precio'),
+        ),
+        migrations.RunPython(
+            rellenar_precio,
+            migrations.RunPython.noop,
+            atomic=False,
+        ),
+    ]
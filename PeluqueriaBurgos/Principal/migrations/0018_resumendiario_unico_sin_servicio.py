@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:00
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+CAMPOS = ("realizadas", "canceladas", "minutos", "ingresos")
+
+
+def fusionar_filas_sin_servicio(apps, schema_editor):
+    """Junta en una las filas sin servicio repetidas antes de crear la restricción."""
+    ResumenDiario = apps.get_model("Principal", "ResumenDiario")
+    filas = ResumenDiario.objects.using(schema_editor.connection.alias).filter(servicio__isnull=True)
+    repetidas = (
+        filas.order_by()
+        .values("fecha", "peluquero_id")
+        .annotate(n=Count("pk"), **{f"total_{c}": Sum(c) for c in CAMPOS})
+        .filter(n__gt=1)
+    )
+    for grupo in repetidas:
+        del_dia = filas.filter(fecha=grupo["fecha"], peluquero_id=grupo["peluquero_id"]).order_by("pk")
+        primera = del_dia.first()
+        del_dia.exclude(pk=primera.pk).delete()
+        del_dia.filter(pk=primera.pk).update(**{c: grupo[f"total_{c}"] for c in CAMPOS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Principal', '0017_cita_precio'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_filas_sin_servicio, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='resumendiario',
+            constraint=models.UniqueConstraint(condition=models.Q(('servicio__isnull', True)), fields=('fecha', 'peluquero'), name='resumen_diario_unico_sin_servicio'),
+        ),
+    ]
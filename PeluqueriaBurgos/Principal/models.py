@@ -2,7 +2,9 @@ from datetime import date, datetime, time, timedelta
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import Collate
 from django.utils import timezone
 
 
@@ -64,6 +66,16 @@ class Cliente(models.Model):
     telefono = models.CharField("Teléfono", max_length=20, blank=True)
     email = models.EmailField("Email", blank=True)
 
+    class Meta:
+        # Para las búsquedas por prefijo del admin (`^campo` -> LIKE 'texto%'):
+        # en SQLite el LIKE no distingue mayúsculas y solo usa índices NOCASE.
+        indexes = [
+            models.Index(Collate("nombre", "NOCASE"), name="cliente_nombre_nocase"),
+            models.Index(Collate("apellido", "NOCASE"), name="cliente_apellido_nocase"),
+            models.Index(Collate("telefono", "NOCASE"), name="cliente_telefono_nocase"),
+            models.Index(Collate("email", "NOCASE"), name="cliente_email_nocase"),
+        ]
+
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
 
@@ -111,7 +123,9 @@ class HorarioPeluquero(models.Model):
         """
         super().clean()
 
-        if self.dia_semana == HorarioPeluquero.DiaSemana.DOMINGO:
+        from .disponibilidad import MASCARAS_SEMANA_SALON
+
+        if self.dia_semana is not None and not MASCARAS_SEMANA_SALON[self.dia_semana]:
             raise ValidationError("La peluquería cierra los domingos.")
 
         if not self.hora_inicio or not self.hora_fin:
@@ -151,6 +165,8 @@ class TurnoPeluquero(models.Model):
         MANANA = "MANANA", f"Mañana ({APERTURA.strftime('%H:%M')}–{COMIDA_INICIO.strftime('%H:%M')})"
         TARDE = "TARDE", f"Tarde ({COMIDA_FIN.strftime('%H:%M')}–{CIERRE.strftime('%H:%M')})"
         COMPLETO = "COMPLETO", "Completo (mañana + tarde)"
+        # Baja, vacaciones...: no trabaja y manda sobre cualquier otro turno
+        AUSENCIA = "AUSENCIA", "Ausencia (no trabaja)"
 
     peluquero = models.ForeignKey(
         Peluqueros,
@@ -180,11 +196,93 @@ class TurnoPeluquero(models.Model):
             raise ValidationError({"fecha_fin": "La fecha fin no puede ser anterior a la fecha inicio."})
 
 
+class DiaEspecial(models.Model):
+    """Festivos, cierres y horarios especiales de la peluquería por rango de fechas."""
+
+    class Tipo(models.TextChoices):
+        FESTIVO = "FESTIVO", "Festivo"
+        CIERRE = "CIERRE", "Cierre"
+        HORARIO = "HORARIO", "Horario especial"
+
+    fecha_inicio = models.DateField("Fecha inicio")
+    fecha_fin = models.DateField("Fecha fin")
+    tipo = models.CharField("Tipo", max_length=10, choices=Tipo.choices)
+    hora_apertura = models.TimeField("Hora apertura", null=True, blank=True)
+    hora_cierre = models.TimeField("Hora cierre", null=True, blank=True)
+    cierre_comida = models.BooleanField(
+        "Cierra para comer",
+        default=True,
+        help_text=f"Solo horario especial: mantiene el cierre de {COMIDA_INICIO.strftime('%H:%M')} a {COMIDA_FIN.strftime('%H:%M')}.",
+    )
+    incluye_domingos = models.BooleanField(
+        "Abre también los domingos",
+        default=False,
+        help_text="Solo horario especial: si no se marca, los domingos siguen cerrados.",
+    )
+    descripcion = models.CharField("Descripción", max_length=150, blank=True)
+    activo = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = "Día especial"
+        verbose_name_plural = "Días especiales (festivos y cierres)"
+        ordering = ["-fecha_inicio"]
+        indexes = [
+            models.Index(fields=["fecha_inicio", "fecha_fin"]),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.fecha_inicio}–{self.fecha_fin} {self.descripcion}".strip()
+
+    def clean(self):
+        super().clean()
+        if self.fecha_inicio and self.fecha_fin and self.fecha_fin < self.fecha_inicio:
+            raise ValidationError({"fecha_fin": "La fecha fin no puede ser anterior a la fecha inicio."})
+
+        if self.tipo != DiaEspecial.Tipo.HORARIO:
+            return
+
+        if not self.hora_apertura or not self.hora_cierre:
+            raise ValidationError("El horario especial necesita hora de apertura y de cierre.")
+
+        if self.hora_cierre <= self.hora_apertura:
+            raise ValidationError("La hora de cierre debe ser posterior a la de apertura.")
+
+        for campo, t in (("hora_apertura", self.hora_apertura), ("hora_cierre", self.hora_cierre)):
+            if t.second != 0 or t.microsecond != 0 or (t.minute not in (0, 30)):
+                raise ValidationError(
+                    {campo: "Las horas deben ir en tramos de 30 minutos (00 o 30)."}
+                )
+
+        if self.hora_apertura < APERTURA or self.hora_cierre > CIERRE:
+            raise ValidationError(
+                f"El horario debe estar dentro de {APERTURA.strftime('%H:%M')}–{CIERRE.strftime('%H:%M')}"
+            )
+
+
+class CitaQuerySet(models.QuerySet):
+    def activas(self):
+        """Citas que ocupan hueco (todas salvo las canceladas)."""
+        return self.exclude(estado=Cita.Estado.CANCELADA)
+
+    def solapadas(self, *, peluquero, fecha, inicio, fin):
+        """Citas activas del peluquero que pisan el tramo [inicio, fin) de ese día.
+
+        Se resuelve en SQL con hora/hora_fin guardadas en la propia cita.
+        """
+        return self.activas().filter(
+            peluquero=peluquero,
+            fecha=fecha,
+            hora__lt=fin,
+            hora_fin__gt=inicio,
+        )
+
+
 class Cita(models.Model):
     class Estado(models.TextChoices):
         PENDIENTE = "PENDIENTE", "Pendiente"
         REALIZADA = "REALIZADA", "Realizada"
         CANCELADA = "CANCELADA", "Cancelada"
+        NO_PRESENTADO = "NO_PRESENTADO", "No presentado"
 
     cliente = models.ForeignKey(
         Cliente,
@@ -208,28 +306,72 @@ class Cita(models.Model):
     )
     fecha = models.DateField("Fecha de la cita")
     hora = models.TimeField("Hora de la cita")
+    # Se fijan al reservar: cambiar la duración del servicio no mueve citas ya dadas
+    duracion_minutos = models.PositiveIntegerField("Duración (minutos)", null=True, blank=True, editable=False)
+    hora_fin = models.TimeField("Hora fin", null=True, blank=True, editable=False)
+    # Precio del servicio al reservar: el resumen de ingresos no cambia si luego cambia la tarifa
+    precio = models.DecimalField("Precio", max_digits=7, decimal_places=2, null=True, blank=True, editable=False)
     estado = models.CharField(
         "Estado",
-        max_length=10,
+        max_length=15,
         choices=Estado.choices,
         default=Estado.PENDIENTE,
     )
     motivo = models.CharField("Motivo", max_length=255, blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
+    # auto_now no se aplica en update(): esos caminos lo fijan a mano
+    actualizado_en = models.DateTimeField("Actualizada en", auto_now=True)
 
     class Meta:
         verbose_name = "Cita"
         verbose_name_plural = "Citas"
         ordering = ["-fecha", "-hora"]
         unique_together = ("peluquero", "fecha", "hora")
+        indexes = [
+            models.Index(fields=["peluquero", "fecha", "hora", "hora_fin"]),
+        ]
+
+    objects = CitaQuerySet.as_manager()
 
     def __str__(self):
         return f"Cita de {self.cliente} con {self.peluquero} el {self.fecha} a las {self.hora}"
 
+    # Campos cuyo valor en BD se recuerda para detectar cambios al guardar
+    CAMPOS_GUARDADOS = ("estado", "fecha", "peluquero_id", "servicio_id", "duracion_minutos", "precio")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._guardado = {c: instance.__dict__.get(c) for c in cls.CAMPOS_GUARDADOS}
+        return instance
+
+    def duracion_efectiva(self):
+        """Duración guardada o, si es nueva o ha cambiado de servicio, la del servicio."""
+        guardado = getattr(self, "_guardado", None)
+        if self.duracion_minutos and (guardado is None or self.servicio_id == guardado["servicio_id"]):
+            return self.duracion_minutos
+        return _servicio_duracion_minutos(self.servicio)
+
+    def precio_efectivo(self):
+        """Precio guardado o, si es nueva o ha cambiado de servicio, el actual del servicio."""
+        guardado = getattr(self, "_guardado", None)
+        if self.precio is not None and (guardado is None or self.servicio_id == guardado["servicio_id"]):
+            return self.precio
+        return self.servicio.precio if self.servicio else None
+
+    def save(self, *args, **kwargs):
+        if self.hora:
+            self.duracion_minutos = self.duracion_efectiva()
+            self.hora_fin = _sumar_minutos(self.hora, self.duracion_minutos)
+        self.precio = self.precio_efectivo()
+        super().save(*args, **kwargs)
+        self._guardado = {c: getattr(self, c) for c in self.CAMPOS_GUARDADOS}
+
     def clean(self):
         """Reglas de negocio de las citas.
 
         - Solo franjas de 30 minutos.
+        - La peluquería debe estar abierta ese día y a esa hora (DiaEspecial).
         - Debe caer dentro de un horario activo del peluquero.
         - No puede solapar con otras citas del mismo peluquero.
         - La fecha no puede ser anterior a hoy.
@@ -243,21 +385,25 @@ class Cita(models.Model):
         if self.hora and (self.hora.minute not in (0, 30) or self.hora.second != 0):
             raise ValidationError("Las citas solo pueden comenzar a en punto o y media.")
 
-        # Cierre los domingos
-        if self.fecha and self.fecha.weekday() == 6:
-            raise ValidationError("La peluquería cierra los domingos.")
-
-        # Cierre para comer: 13:30-15:00 (cualquier servicio que solape se rechaza)
-        if self.fecha and self.hora:
-            duracion = _servicio_duracion_minutos(self.servicio)
-            inicio = _time_to_dt(self.hora)
-            fin = inicio + timedelta(minutes=duracion)
-            comida_inicio = _time_to_dt(COMIDA_INICIO)
-            comida_fin = _time_to_dt(COMIDA_FIN)
-            if inicio < comida_fin and comida_inicio < fin:
-                raise ValidationError(
-                    f"La peluquería cierra de {COMIDA_INICIO.strftime('%H:%M')} a {COMIDA_FIN.strftime('%H:%M')} para comer."
-                )
+        # Cierre según el calendario de la peluquería (domingos, festivos, horarios especiales)
+        if self.fecha:
+            from .disponibilidad import MASCARA_COMIDA, _minutos, calendario_salon, mascara_ocupada
+
+            calendario = calendario_salon(self.fecha.year)
+            abierto = calendario.mascara(self.fecha)
+            if not abierto:
+                raise ValidationError(calendario.motivo_cierre(self.fecha))
+
+            # Cualquier servicio que se salga del horario (o pise la comida) se rechaza
+            if self.hora:
+                inicio = _minutos(self.hora)
+                bloques = mascara_ocupada(inicio, inicio + self.duracion_efectiva())
+                if bloques & ~abierto & MASCARA_COMIDA:
+                    raise ValidationError(
+                        f"La peluquería cierra de {COMIDA_INICIO.strftime('%H:%M')} a {COMIDA_FIN.strftime('%H:%M')} para comer."
+                    )
+                if bloques & ~abierto:
+                    raise ValidationError("La peluquería no está abierta a esa hora ese día.")
 
         # Validar que el peluquero ofrece el servicio seleccionado
         if self.servicio_id and self.peluquero_id:
@@ -266,6 +412,19 @@ class Cita(models.Model):
                     "El peluquero seleccionado no ofrece el servicio elegido."
                 )
 
+        # Solapes con otras citas del peluquero (consulta por rango en SQL)
+        if self.peluquero_id and self.fecha and self.hora:
+            solapadas = Cita.objects.solapadas(
+                peluquero=self.peluquero_id,
+                fecha=self.fecha,
+                inicio=self.hora,
+                fin=_sumar_minutos(self.hora, self.duracion_efectiva()),
+            )
+            if self.pk:
+                solapadas = solapadas.exclude(pk=self.pk)
+            if solapadas.exists():
+                raise ValidationError("La hora seleccionada se solapa con otra cita del peluquero.")
+
         # Validar disponibilidad real (horario + duración + no solapes)
         if self.peluquero_id and self.fecha and self.hora:
             horas_disponibles = get_horas_disponibles(
@@ -278,6 +437,198 @@ class Cita(models.Model):
                 raise ValidationError("La hora seleccionada no está disponible.")
 
 
+class CitaHistorica(models.Model):
+    """Cita antigua ya cerrada (realizada, cancelada o no presentado), fuera de la tabla de citas.
+
+    Conserva el id de la cita original. La mueve `manage.py archivar_citas`
+    para que la tabla de citas (reservas, "Mis citas", admin) siga pequeña.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(
+        Cliente,
+        on_delete=models.CASCADE,
+        related_name="citas_historicas",
+        verbose_name="Cliente",
+    )
+    peluquero = models.ForeignKey(
+        Peluqueros,
+        on_delete=models.CASCADE,
+        related_name="citas_historicas",
+        verbose_name="Peluquero",
+    )
+    servicio = models.ForeignKey(
+        Servicio,
+        on_delete=models.SET_NULL,
+        related_name="citas_historicas",
+        verbose_name="Servicio",
+        null=True,
+        blank=True,
+    )
+    fecha = models.DateField("Fecha de la cita")
+    hora = models.TimeField("Hora de la cita")
+    duracion_minutos = models.PositiveIntegerField("Duración (minutos)", null=True, blank=True)
+    hora_fin = models.TimeField("Hora fin", null=True, blank=True)
+    precio = models.DecimalField("Precio", max_digits=7, decimal_places=2, null=True, blank=True)
+    estado = models.CharField("Estado", max_length=15, choices=Cita.Estado.choices)
+    motivo = models.CharField("Motivo", max_length=255, blank=True)
+    creado_en = models.DateTimeField("Creada en")
+    archivado_en = models.DateTimeField("Archivada en", auto_now_add=True)
+
+    # Campos que se copian tal cual desde Cita
+    CAMPOS_CITA = (
+        "id",
+        "cliente_id",
+        "peluquero_id",
+        "servicio_id",
+        "fecha",
+        "hora",
+        "duracion_minutos",
+        "hora_fin",
+        "precio",
+        "estado",
+        "motivo",
+        "creado_en",
+    )
+
+    class Meta:
+        verbose_name = "Cita histórica"
+        verbose_name_plural = "Citas históricas"
+        ordering = ["-fecha", "-hora"]
+        indexes = [
+            models.Index(fields=["cliente", "fecha"]),
+        ]
+
+    def __str__(self):
+        return f"Cita de {self.cliente} con {self.peluquero} el {self.fecha} a las {self.hora} (archivada)"
+
+
+class ResumenDiario(models.Model):
+    """Citas realizadas/canceladas e ingresos por día, peluquero y servicio.
+
+    Se mantiene al cambiar el estado de las citas (ver `Principal.resumenes`)
+    y se puede reconstruir con `manage.py recalcular_resumenes`.
+    """
+
+    fecha = models.DateField("Fecha")
+    peluquero = models.ForeignKey(
+        Peluqueros,
+        on_delete=models.CASCADE,
+        related_name="resumenes",
+        verbose_name="Peluquero",
+    )
+    servicio = models.ForeignKey(
+        Servicio,
+        on_delete=models.SET_NULL,
+        related_name="resumenes",
+        verbose_name="Servicio",
+        null=True,
+        blank=True,
+    )
+    realizadas = models.IntegerField("Citas realizadas", default=0)
+    canceladas = models.IntegerField("Citas canceladas", default=0)
+    minutos = models.IntegerField("Minutos realizados", default=0)
+    ingresos = models.DecimalField("Ingresos", max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumen diario"
+        verbose_name_plural = "Resúmenes diarios"
+        ordering = ["-fecha", "peluquero"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fecha", "peluquero", "servicio"],
+                name="resumen_diario_unico",
+            ),
+            # En la de arriba dos NULL no chocan: las filas sin servicio
+            # (citas sin servicio o de un servicio borrado) necesitan la suya
+            models.UniqueConstraint(
+                fields=["fecha", "peluquero"],
+                condition=models.Q(servicio__isnull=True),
+                name="resumen_diario_unico_sin_servicio",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.peluquero} - {self.servicio or 'Sin servicio'}"
+
+
+class Cambio(models.Model):
+    """Registro de cambios de citas, turnos y horarios (solo se añade).
+
+    El id sirve de cursor para `/api/cambios/?after=`. Se llena desde las
+    señales y, en los caminos que no las lanzan (update, bulk_create), a
+    mano. Ver `Principal.cambios`.
+    """
+
+    class Modelo(models.TextChoices):
+        CITA = "CITA", "Cita"
+        TURNO = "TURNO", "Turno por fechas"
+        HORARIO = "HORARIO", "Horario semanal"
+
+    class Accion(models.TextChoices):
+        ALTA = "ALTA", "Alta"
+        MODIFICACION = "MODIFICACION", "Modificación"
+        CANCELACION = "CANCELACION", "Cancelación"
+        BORRADO = "BORRADO", "Borrado"
+        ARCHIVADA = "ARCHIVADA", "Archivada"
+
+    id = models.BigAutoField(primary_key=True)
+    modelo = models.CharField("Modelo", max_length=10, choices=Modelo.choices)
+    objeto_id = models.BigIntegerField("Id del objeto")
+    accion = models.CharField("Acción", max_length=15, choices=Accion.choices)
+    # Estado del objeto tras el cambio (vacío si se ha borrado o archivado)
+    datos = models.JSONField("Datos", null=True, blank=True, encoder=DjangoJSONEncoder)
+    creado_en = models.DateTimeField("Fecha", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Cambio"
+        verbose_name_plural = "Cambios"
+        ordering = ["id"]
+        indexes = [
+            # Compactación: ¿hay un cambio posterior del mismo objeto?
+            models.Index(fields=["modelo", "objeto_id", "id"]),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.get_accion_display()} {self.get_modelo_display()} {self.objeto_id}"
+
+
+class Tarea(models.Model):
+    """Trabajo en segundo plano (cola en la BD). Ver `Principal.tareas`."""
+
+    class Estado(models.TextChoices):
+        PENDIENTE = "PENDIENTE", "Pendiente"
+        EN_CURSO = "EN_CURSO", "En curso"
+        HECHA = "HECHA", "Hecha"
+        FALLIDA = "FALLIDA", "Fallida"
+
+    tipo = models.CharField("Tipo", max_length=50)
+    datos = models.JSONField("Datos", default=dict, blank=True, encoder=DjangoJSONEncoder)
+    # Evita encolar dos veces lo mismo (p. ej. el recordatorio de una cita)
+    clave = models.CharField("Clave", max_length=100, unique=True, null=True, blank=True)
+    estado = models.CharField("Estado", max_length=10, choices=Estado.choices, default=Estado.PENDIENTE)
+    intentos = models.PositiveIntegerField("Intentos", default=0)
+    max_intentos = models.PositiveIntegerField("Máximo de intentos", default=5)
+    disponible_en = models.DateTimeField("Disponible en", default=timezone.now)
+    # Quién la tiene reservada y hasta cuándo (si el trabajador muere, caduca)
+    reservada_por = models.CharField("Reservada por", max_length=64, blank=True)
+    reservada_hasta = models.DateTimeField("Reservada hasta", null=True, blank=True)
+    ultimo_error = models.TextField("Último error", blank=True)
+    creado_en = models.DateTimeField("Creada en", auto_now_add=True)
+    terminada_en = models.DateTimeField("Terminada en", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Tarea"
+        verbose_name_plural = "Tareas"
+        ordering = ["-id"]
+        indexes = [
+            models.Index(fields=["tipo", "estado", "disponible_en"]),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.tipo} ({self.get_estado_display()})"
+
+
 def _servicio_duracion_minutos(servicio: "Servicio | None") -> int:
     """Duración en minutos del servicio (fallback: 30)."""
     if servicio and servicio.duracion_minutos:
@@ -289,7 +640,15 @@ def _time_to_dt(t):
     return datetime.combine(date(2000, 1, 1), t)
 
 
-def get_horas_disponibles(*, peluquero: Peluqueros, fecha, servicio=None, exclude_cita_pk=None):
+def _sumar_minutos(t, minutos):
+    """Hora `t` más `minutos` (sin pasar de medianoche)."""
+    fin = _time_to_dt(t) + timedelta(minutes=minutos)
+    if fin.date() != date(2000, 1, 1):
+        return time(23, 59)
+    return fin.time()
+
+
+def get_horas_disponibles(*, peluquero: Peluqueros, fecha, servicio=None, exclude_cita_pk=None, titular=None):
     """Devuelve horas de inicio disponibles (datetime.time) para un peluquero/fecha/servicio.
 
     Prioridad de fuentes:
@@ -298,125 +657,89 @@ def get_horas_disponibles(*, peluquero: Peluqueros, fecha, servicio=None, exclud
 
     - Paso de 30 minutos.
     - Respeta duración del servicio y evita solapes con otras citas no canceladas.
-    - Regla global: cerrado domingos y de 13:30 a 15:00.
+    - Calendario de la peluquería (DiaEspecial): por defecto cerrado domingos
+      y de 13:30 a 15:00, además de festivos, cierres y horarios especiales.
+    - Si se indica `titular`, descuenta las horas retenidas por otros
+      clientes (ver `Principal.retenciones`).
     """
-    if not peluquero or not fecha:
-        return []
-
-    if fecha < timezone.localdate():
-        return []
+    from .disponibilidad import horas_de_mascara
 
-    # Cerrado domingos
-    if fecha.weekday() == 6:
-        return []
-
-    duracion = _servicio_duracion_minutos(servicio)
-    paso = 30
-
-    # 1) Turno por fechas (si existe, manda sobre el semanal)
-    turnos_qs = TurnoPeluquero.objects.filter(
-        peluquero=peluquero,
-        activo=True,
-        fecha_inicio__lte=fecha,
-        fecha_fin__gte=fecha,
-    ).order_by("-fecha_inicio", "-id")
-
-    intervalos_merged = []
-
-    if turnos_qs.exists():
-        turno = turnos_qs.first().turno
-        if turno == TurnoPeluquero.Turno.MANANA:
-            intervalos_merged = [[_time_to_dt(APERTURA), _time_to_dt(COMIDA_INICIO)]]
-        elif turno == TurnoPeluquero.Turno.TARDE:
-            intervalos_merged = [[_time_to_dt(COMIDA_FIN), _time_to_dt(CIERRE)]]
-        else:
-            intervalos_merged = [
-                [_time_to_dt(APERTURA), _time_to_dt(COMIDA_INICIO)],
-                [_time_to_dt(COMIDA_FIN), _time_to_dt(CIERRE)],
-            ]
-    else:
-        # 2) Plantilla semanal
-        dia_semana = fecha.weekday()
-        horarios = (
-            HorarioPeluquero.objects.filter(
-                peluquero=peluquero,
-                dia_semana=dia_semana,
-                activo=True,
-            )
-            .order_by("hora_inicio")
-        )
-
-        if not horarios.exists():
-            return []
-
-        intervalos = []
-        for h in horarios:
-            inicio_h = _time_to_dt(h.hora_inicio)
-            fin_h = _time_to_dt(h.hora_fin)
-            if fin_h <= inicio_h:
-                continue
-            intervalos.append((inicio_h, fin_h))
-
-        intervalos.sort(key=lambda x: x[0])
-        for start, end in intervalos:
-            if not intervalos_merged or start > intervalos_merged[-1][1]:
-                intervalos_merged.append([start, end])
-            else:
-                intervalos_merged[-1][1] = max(intervalos_merged[-1][1], end)
-
-    citas_qs = (
-        Cita.objects.filter(
+    return horas_de_mascara(
+        get_mascara_disponible(
             peluquero=peluquero,
             fecha=fecha,
+            servicio=servicio,
+            exclude_cita_pk=exclude_cita_pk,
+            titular=titular,
         )
-        .exclude(estado=Cita.Estado.CANCELADA)
-        .select_related("servicio")
     )
-    if exclude_cita_pk:
-        citas_qs = citas_qs.exclude(pk=exclude_cita_pk)
 
-    ocupadas = []
-    for cita in citas_qs:
-        cita_duracion = _servicio_duracion_minutos(cita.servicio)
-        inicio = _time_to_dt(cita.hora)
-        fin = inicio + timedelta(minutes=cita_duracion)
-        ocupadas.append((inicio, fin))
 
-    disponibles = set()
+def get_mascara_disponible(
+    *, peluquero: Peluqueros, fecha, servicio=None, exclude_cita_pk=None, titular=None
+) -> int:
+    """Como `get_horas_disponibles`, pero como máscara de bloques de 30 minutos.
 
-    # Cierre para comer (13:30-15:00)
-    comida_inicio = _time_to_dt(COMIDA_INICIO)
-    comida_fin = _time_to_dt(COMIDA_FIN)
+    El bit i es la hora APERTURA + 30*i (ver `Principal.disponibilidad`).
+    """
+    if not peluquero or not fecha:
+        return 0
 
-    for inicio_h, fin_h in intervalos_merged:
-        ultimo_inicio = fin_h - timedelta(minutes=duracion)
-        if ultimo_inicio < inicio_h:
-            continue
+    if fecha < timezone.localdate():
+        return 0
+
+    from .disponibilidad import (
+        _tramo_cita,
+        calendario_salon,
+        inicios_disponibles,
+        mascara_ocupada,
+        mascara_trabajo,
+        mascaras_dias,
+        plantilla_semanal,
+        resolutor_turnos,
+    )
 
-        cursor = inicio_h
-        # Ajustar al siguiente bloque de 30 minutos (00 o 30)
-        if cursor.minute % paso != 0:
-            cursor += timedelta(minutes=(paso - (cursor.minute % paso)))
-        cursor = cursor.replace(second=0, microsecond=0)
+    duracion = _servicio_duracion_minutos(servicio)
 
-        while cursor <= ultimo_inicio:
-            inicio_cita = cursor
-            fin_cita = cursor + timedelta(minutes=duracion)
+    if not exclude_cita_pk:
+        # Caso normal: el día ya calculado (o precalentado) en la caché compartida
+        libre, ocupado = mascaras_dias([(peluquero.pk, fecha)])[(peluquero.pk, fecha)]
+        if not libre:
+            return 0
+        if titular is not None:
+            from .retenciones import mascara_retenida
+
+            ocupado |= mascara_retenida(peluquero.pk, fecha, excepto=titular)
+        return inicios_disponibles(libre, ocupado, duracion)
+
+    # Calendario de la peluquería: domingos, festivos, cierres y horarios especiales
+    abierto = calendario_salon(fecha.year).mascara(fecha)
+    if not abierto:
+        return 0
+
+    # Turno por fechas si existe; si no, plantilla semanal (ambos compilados y cacheados)
+    trabajo = mascara_trabajo(
+        plantilla_semanal(peluquero.pk),
+        resolutor_turnos(peluquero.pk),
+        fecha,
+    )
+    if not trabajo:
+        return 0
 
-            # No permitir citas durante el cierre de comida
-            if inicio_cita < comida_fin and comida_inicio < fin_cita:
-                cursor += timedelta(minutes=paso)
-                continue
+    citas_qs = Cita.objects.activas().filter(
+        peluquero=peluquero,
+        fecha=fecha,
+    )
+    if exclude_cita_pk:
+        citas_qs = citas_qs.exclude(pk=exclude_cita_pk)
 
-            solapa = False
-            for o_inicio, o_fin in ocupadas:
-                if inicio_cita < o_fin and o_inicio < fin_cita:
-                    solapa = True
-                    break
+    ocupado = 0
+    for hora, hora_fin in citas_qs.values_list("hora", "hora_fin"):
+        ocupado |= mascara_ocupada(*_tramo_cita(hora, hora_fin))
 
-            if not solapa:
-                disponibles.add(inicio_cita.time().replace(second=0, microsecond=0))
+    if titular is not None:
+        from .retenciones import mascara_retenida
 
-            cursor += timedelta(minutes=paso)
+        ocupado |= mascara_retenida(peluquero.pk, fecha, excepto=titular)
 
-    return sorted(disponibles)
+    return inicios_disponibles(trabajo & abierto, ocupado, duracion)
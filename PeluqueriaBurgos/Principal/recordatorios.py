@@ -0,0 +1,84 @@
+"""Recordatorios de citas por correo.
+
+`programar_recordatorios(fecha)` encola en bloque una tarea por cada cita
+pendiente de ese día cuyo cliente tiene email (la clave evita duplicados si
+se lanza dos veces). El trabajador de tareas las envía por lotes, cada lote
+por una sola conexión del EMAIL_BACKEND.
+"""
+
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import Cita
+from .tareas import encolar, manejador
+
+TIPO = "recordatorio_cita"
+
+
+def programar_recordatorios(fecha):
+    """Encola los recordatorios de las citas de `fecha`. Devuelve cuántas citas hay."""
+    ids = list(
+        Cita.objects.filter(fecha=fecha, estado=Cita.Estado.PENDIENTE)
+        .exclude(cliente__email="")
+        .order_by("hora", "pk")
+        .values_list("pk", flat=True)
+    )
+    encolar(
+        TIPO,
+        [{"cita_id": pk, "fecha": fecha.isoformat()} for pk in ids],
+        claves=[f"recordatorio:{pk}:{fecha.isoformat()}" for pk in ids],
+    )
+    return len(ids)
+
+
+def _mensaje(cita, hoy):
+    if cita.fecha == hoy:
+        cuando = "hoy"
+    elif cita.fecha == hoy + timedelta(days=1):
+        cuando = "mañana"
+    else:
+        cuando = f"el {cita.fecha:%d/%m/%Y}"
+    servicio = f" de {cita.servicio.nombre}" if cita.servicio else ""
+    cuerpo = (
+        f"Hola {cita.cliente.nombre}:\n\n"
+        f"Te recordamos que tu cita{servicio} con {cita.peluquero} es {cuando} a las {cita.hora:%H:%M}.\n\n"
+        "Si no puedes venir, cancélala desde «Mis citas».\n\n"
+        "Peluquería Burgos\n"
+    )
+    return EmailMessage(f"Tu cita es {cuando} a las {cita.hora:%H:%M}", cuerpo, to=[cita.cliente.email])
+
+
+@manejador(TIPO, lote=100)
+def enviar_recordatorios(tareas):
+    """Envía un lote de recordatorios por una sola conexión. Devuelve los errores por tarea."""
+    citas = Cita.objects.select_related("cliente", "peluquero", "servicio").in_bulk(
+        [t.datos.get("cita_id") for t in tareas]
+    )
+    hoy = timezone.localdate()
+
+    mensajes = []
+    for tarea in tareas:
+        cita = citas.get(tarea.datos.get("cita_id"))
+        # Cancelada, cambiada de día o ya pasada: no se avisa
+        if (
+            cita is None
+            or cita.estado != Cita.Estado.PENDIENTE
+            or cita.fecha.isoformat() != tarea.datos.get("fecha")
+            or cita.fecha < hoy
+            or not cita.cliente.email
+        ):
+            continue
+        mensajes.append((tarea, _mensaje(cita, hoy)))
+
+    errores = {}
+    if not mensajes:
+        return errores
+    with get_connection() as conexion:
+        for tarea, mensaje in mensajes:
+            try:
+                conexion.send_messages([mensaje])
+            except Exception as e:
+                errores[tarea.pk] = f"{type(e).__name__}: {e}"
+    return errores
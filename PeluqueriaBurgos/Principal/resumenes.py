@@ -0,0 +1,144 @@
+"""Mantenimiento del resumen diario de citas (ResumenDiario).
+
+Cada cita realizada o cancelada aporta a la fila de su día, peluquero y
+servicio. Al guardar o borrar una cita se aplica solo la diferencia entre
+lo que aportaba antes y lo que aporta ahora. Los ingresos usan el precio
+fijado en la cita al reservarla (`Cita.precio`), no la tarifa actual del
+servicio: cambiar una tarifa no mueve los ingresos ya contados.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Cita, CitaHistorica, ResumenDiario
+
+CAMPOS = ("realizadas", "canceladas", "minutos", "ingresos")
+
+
+def _aportacion(estado, fecha, peluquero_id, servicio_id, minutos, precio):
+    clave = (fecha, peluquero_id, servicio_id)
+    if estado == Cita.Estado.REALIZADA:
+        return clave, (1, 0, minutos or 0, precio or Decimal("0"))
+    if estado == Cita.Estado.CANCELADA:
+        return clave, (0, 1, 0, Decimal("0"))
+    return None
+
+
+def aplicar(deltas):
+    """Suma `deltas` ({(fecha, peluquero_id, servicio_id): (realizadas, canceladas, minutos, ingresos)})."""
+    for (fecha, peluquero_id, servicio_id), valores in deltas.items():
+        if not any(valores):
+            continue
+        filtro = {"fecha": fecha, "peluquero_id": peluquero_id, "servicio_id": servicio_id}
+        incrementos = {campo: F(campo) + v for campo, v in zip(CAMPOS, valores)}
+        if ResumenDiario.objects.filter(**filtro).update(**incrementos):
+            continue
+        try:
+            with transaction.atomic():
+                ResumenDiario.objects.create(**filtro, **dict(zip(CAMPOS, valores)))
+        except IntegrityError:
+            # Otra petición ha creado la fila mientras tanto
+            ResumenDiario.objects.filter(**filtro).update(**incrementos)
+
+
+def actualizar_por_cita(cita, borrada=False):
+    """Aplica al resumen el cambio de una cita recién guardada o borrada."""
+    antes = getattr(cita, "_guardado", None)
+    if borrada and antes is None:
+        antes = {c: getattr(cita, c) for c in Cita.CAMPOS_GUARDADOS}
+    ahora = None if borrada else {c: getattr(cita, c) for c in Cita.CAMPOS_GUARDADOS}
+
+    estados = {Cita.Estado.REALIZADA, Cita.Estado.CANCELADA}
+    estados_implicados = [e["estado"] for e in (antes, ahora) if e]
+    if antes == ahora or not estados.intersection(estados_implicados):
+        return
+
+    deltas = defaultdict(lambda: [0, 0, 0, Decimal("0")])
+    for estado_cita, signo in ((antes, -1), (ahora, 1)):
+        if not estado_cita:
+            continue
+        aportacion = _aportacion(
+            estado_cita["estado"],
+            estado_cita["fecha"],
+            estado_cita["peluquero_id"],
+            estado_cita["servicio_id"],
+            estado_cita["duracion_minutos"],
+            estado_cita["precio"],
+        )
+        if aportacion:
+            clave, valores = aportacion
+            for i, v in enumerate(valores):
+                deltas[clave][i] += signo * v
+
+    aplicar(deltas)
+
+
+def agregar_citas(citas):
+    """Filas de resumen calculadas desde un queryset de citas o citas históricas (una consulta)."""
+    realizada = Q(estado=Cita.Estado.REALIZADA)
+    return (
+        citas.filter(estado__in=[Cita.Estado.REALIZADA, Cita.Estado.CANCELADA])
+        .order_by()
+        .values("fecha", "peluquero_id", "servicio_id")
+        .annotate(
+            realizadas=Count("pk", filter=realizada),
+            canceladas=Count("pk", filter=Q(estado=Cita.Estado.CANCELADA)),
+            minutos=Coalesce(Sum("duracion_minutos", filter=realizada), 0),
+            ingresos=Coalesce(
+                Sum("precio", filter=realizada),
+                Value(Decimal("0")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+    )
+
+
+def sumar_citas(citas):
+    """Suma al resumen lo que aportan `citas` (tras un update() que no lanza señales)."""
+    deltas = {}
+    for fila in agregar_citas(citas):
+        deltas[(fila["fecha"], fila["peluquero_id"], fila["servicio_id"])] = [fila[c] for c in CAMPOS]
+    aplicar(deltas)
+
+
+@transaction.atomic
+def soltar_servicio(servicio_id):
+    """Pasa a las filas sin servicio el resumen de un servicio que se va a borrar.
+
+    El borrado pondría `servicio` a NULL y chocaría con la fila sin servicio
+    que ya tuviera ese día y peluquero; así se suman en ella.
+    """
+    filas = ResumenDiario.objects.filter(servicio_id=servicio_id)
+    deltas = {
+        (fecha, peluquero_id, None): valores
+        for fecha, peluquero_id, *valores in filas.values_list("fecha", "peluquero_id", *CAMPOS)
+    }
+    filas.delete()
+    aplicar(deltas)
+
+
+@transaction.atomic
+def recalcular(desde, hasta):
+    """Reconstruye el resumen de [desde, hasta] desde las citas (también las archivadas).
+
+    Devuelve las filas creadas.
+    """
+    ResumenDiario.objects.filter(fecha__gte=desde, fecha__lte=hasta).delete()
+
+    totales = defaultdict(lambda: [0, 0, 0, Decimal("0")])
+    for modelo in (Cita, CitaHistorica):
+        for fila in agregar_citas(modelo.objects.filter(fecha__gte=desde, fecha__lte=hasta)):
+            clave = (fila["fecha"], fila["peluquero_id"], fila["servicio_id"])
+            for i, campo in enumerate(CAMPOS):
+                totales[clave][i] += fila[campo]
+
+    filas = [
+        ResumenDiario(fecha=fecha, peluquero_id=peluquero_id, servicio_id=servicio_id, **dict(zip(CAMPOS, valores)))
+        for (fecha, peluquero_id, servicio_id), valores in totales.items()
+    ]
+    ResumenDiario.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
@@ -0,0 +1,111 @@
+"""Retenciones temporales de horas mientras el cliente termina la reserva.
+
+Al elegir una hora el formulario la retiene unos minutos en la caché: cada
+bloque de 30 minutos que ocupa el servicio es una clave creada con
+`cache.add` (atómico), así que dos clientes no pueden retener el mismo
+bloque. No se escribe nada en la BD; si el cliente no confirma, la
+retención caduca sola.
+
+El titular es una cadena que identifica al cliente (ver `titular_de`).
+Cada titular retiene como mucho una hora: retener otra libera la anterior.
+"""
+
+from django.core.cache import cache
+
+from .disponibilidad import N_BLOQUES, _minutos, mascara_ocupada
+
+DURACION_RETENCION = 5 * 60
+
+
+def titular_de(user):
+    return f"u{user.pk}"
+
+
+def _clave_bloque(peluquero_id, fecha, bloque):
+    return f"retencion:{peluquero_id}:{fecha.isoformat()}:{bloque}"
+
+
+def _clave_titular(titular):
+    return f"retencion:titular:{titular}"
+
+
+def _bloques_de(mascara):
+    return [i for i in range(N_BLOQUES) if mascara >> i & 1]
+
+
+def _mascara_hora(hora, duracion):
+    inicio = _minutos(hora)
+    return mascara_ocupada(inicio, inicio + duracion)
+
+
+def retener(titular, peluquero_id, fecha, hora, duracion):
+    """Retiene los bloques de la hora indicada para `titular`.
+
+    Devuelve False (sin retener nada) si algún bloque lo tiene otro titular.
+    Volver a retener lo que ya es suyo renueva la caducidad.
+    """
+    claves = [_clave_bloque(peluquero_id, fecha, b) for b in _bloques_de(_mascara_hora(hora, duracion))]
+
+    anadidas = []
+    for clave in claves:
+        if cache.add(clave, titular, DURACION_RETENCION):
+            anadidas.append(clave)
+        elif cache.get(clave) != titular:
+            cache.delete_many(anadidas)
+            return False
+
+    anterior = cache.get(_clave_titular(titular))
+    if anterior:
+        _borrar_propias(titular, [c for c in anterior if c not in claves])
+
+    cache.set_many({clave: titular for clave in claves}, DURACION_RETENCION)
+    cache.set(_clave_titular(titular), claves, DURACION_RETENCION)
+    return True
+
+
+def _borrar_propias(titular, claves):
+    actuales = cache.get_many(claves)
+    cache.delete_many([clave for clave, valor in actuales.items() if valor == titular])
+
+
+def liberar(titular):
+    """Suelta la retención vigente del titular, si la tiene."""
+    claves = cache.get(_clave_titular(titular))
+    if claves:
+        _borrar_propias(titular, claves)
+    cache.delete(_clave_titular(titular))
+
+
+def mascaras_retenidas(consultas, excepto=None):
+    """Bloques retenidos por otros titulares para cada `(peluquero_id, fecha)`.
+
+    Una sola lectura de la caché para todas las consultas; devuelve una
+    máscara por consulta, en el mismo orden.
+    """
+    consultas = list(consultas)
+    claves = {
+        (peluquero_id, fecha, b): _clave_bloque(peluquero_id, fecha, b)
+        for peluquero_id, fecha in consultas
+        for b in range(N_BLOQUES)
+    }
+    encontradas = cache.get_many(claves.values())
+
+    mascaras = []
+    for peluquero_id, fecha in consultas:
+        mascara = 0
+        for b in range(N_BLOQUES):
+            titular = encontradas.get(claves[(peluquero_id, fecha, b)])
+            if titular is not None and titular != excepto:
+                mascara |= 1 << b
+        mascaras.append(mascara)
+    return mascaras
+
+
+def mascara_retenida(peluquero_id, fecha, excepto=None):
+    return mascaras_retenidas([(peluquero_id, fecha)], excepto)[0]
+
+
+def retenida_por_otro(titular, peluquero_id, fecha, hora, duracion):
+    """True si algún bloque de la hora lo retiene alguien distinto de `titular`."""
+    return bool(mascara_retenida(peluquero_id, fecha, excepto=titular) & _mascara_hora(hora, duracion))
+
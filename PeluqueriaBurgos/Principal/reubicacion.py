@@ -0,0 +1,225 @@
+"""Ausencias de peluqueros y reubicación de sus citas.
+
+Al marcar una ausencia se crea un turno AUSENCIA, se cancelan de una vez
+las citas pendientes afectadas y se proponen huecos nuevos para todas en
+una sola pasada: una agenda (BloqueAgenda) con todos los peluqueros que
+pueden atenderlas, primero el mismo día y después los días más cercanos.
+Las propuestas se confirman también de una vez.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import disponibilidad
+from .cambios import registrar, registrar_ids
+from .disponibilidad import INICIO_REJILLA, PASO, BloqueAgenda, _hora, _minutos, mascara_ocupada
+from .models import Cambio, Cita, Peluqueros, TurnoPeluquero, _servicio_duracion_minutos, _sumar_minutos
+from .resumenes import sumar_citas
+
+DIAS_BUSQUEDA = 14
+
+
+@transaction.atomic
+def marcar_ausencia(peluqueros, desde, hasta):
+    """Crea la ausencia y cancela las citas pendientes del rango.
+
+    Devuelve las citas canceladas (con cliente, servicio y peluquero cargados);
+    no las que otra petición haya cambiado mientras tanto.
+    """
+    ids = [p.pk for p in peluqueros]
+    ausencias = TurnoPeluquero.objects.bulk_create(
+        [
+            TurnoPeluquero(peluquero_id=pid, fecha_inicio=desde, fecha_fin=hasta, turno=TurnoPeluquero.Turno.AUSENCIA)
+            for pid in ids
+        ]
+    )
+    # bulk_create no lanza señales
+    disponibilidad.invalidar("turnos", *ids)
+    registrar(Cambio.Accion.ALTA, ausencias)
+
+    afectadas = Cita.objects.filter(
+        peluquero_id__in=ids,
+        fecha__gte=desde,
+        fecha__lte=hasta,
+        estado=Cita.Estado.PENDIENTE,
+    )
+    citas = list(afectadas.select_related("cliente", "servicio", "peluquero").order_by("fecha", "hora"))
+    ahora = timezone.now()
+    afectadas.filter(pk__in=[c.pk for c in citas]).update(estado=Cita.Estado.CANCELADA, actualizado_en=ahora)
+    pks = set(
+        Cita.objects.filter(
+            pk__in=[c.pk for c in citas], estado=Cita.Estado.CANCELADA, actualizado_en=ahora
+        ).values_list("pk", flat=True)
+    )
+    citas = [c for c in citas if c.pk in pks]
+    for cita in citas:
+        cita.estado = Cita.Estado.CANCELADA
+    sumar_citas(Cita.objects.filter(pk__in=pks))
+    registrar_ids(Cita, Cambio.Accion.CANCELACION, sorted(pks))
+    disponibilidad.invalidar_dias((c.peluquero_id, c.fecha) for c in citas)
+    return citas
+
+
+def _dias_candidatos(fecha, hoy, dias):
+    """El mismo día y después los más cercanos (primero el posterior), desde hoy."""
+    if fecha >= hoy:
+        yield fecha
+    for d in range(1, dias + 1):
+        for candidata in (fecha + timedelta(days=d), fecha - timedelta(days=d)):
+            if candidata >= hoy:
+                yield candidata
+
+
+def proponer_reubicaciones(citas, excluidos=(), dias=DIAS_BUSQUEDA):
+    """Hueco propuesto para cada cita: {cita.pk: (peluquero_id, fecha, hora) o None}.
+
+    Todas las propuestas salen de una misma agenda en memoria y no se pisan
+    entre sí: cada una ocupa su hueco antes de buscar la siguiente. Dentro
+    de un día se elige la hora más cercana a la original. No se proponen
+    horas en que el peluquero ya tiene una cita, aunque esté cancelada:
+    unique_together (peluquero, fecha, hora) también las cuenta.
+    """
+    citas = list(citas)
+    if not citas:
+        return {}
+
+    hoy = timezone.localdate()
+    ahora = _minutos(timezone.localtime().time())
+    excluidos = set(excluidos)
+
+    servicio_ids = {c.servicio_id for c in citas}
+    candidatos = {sid: [] for sid in servicio_ids}
+    for pid, sid in (
+        Peluqueros.servicios.through.objects.filter(servicio_id__in=servicio_ids)
+        .order_by("peluqueros__nombre", "peluqueros__apellido")
+        .values_list("peluqueros_id", "servicio_id")
+    ):
+        if pid not in excluidos:
+            candidatos[sid].append(pid)
+
+    ids = {pid for lista in candidatos.values() for pid in lista}
+    if not ids:
+        return {c.pk: None for c in citas}
+
+    desde = max(hoy, min(c.fecha for c in citas) - timedelta(days=dias))
+    hasta = max(hoy, max(c.fecha for c in citas) + timedelta(days=dias))
+    bloque = BloqueAgenda(ids, desde, hasta)
+    usadas = _horas_usadas(ids, desde, hasta)
+    reservado = {}
+
+    propuestas = {}
+    for cita in citas:
+        duracion = cita.duracion_minutos or _servicio_duracion_minutos(cita.servicio)
+        original = _minutos(cita.hora)
+        propuestas[cita.pk] = None
+        for fecha in _dias_candidatos(cita.fecha, hoy, dias):
+            mejor = None
+            for pid in candidatos.get(cita.servicio_id, []):
+                mascara = bloque.mascara_disponible(pid, fecha, duracion, reservado.get((pid, fecha), 0))
+                i = 0
+                while mascara:
+                    if mascara & 1:
+                        inicio = INICIO_REJILLA + i * PASO
+                        if (fecha > hoy or inicio > ahora) and (pid, fecha, _hora(inicio)) not in usadas:
+                            distancia = abs(inicio - original)
+                            if mejor is None or distancia < mejor[0]:
+                                mejor = (distancia, pid, inicio)
+                    mascara >>= 1
+                    i += 1
+            if mejor:
+                _, pid, inicio = mejor
+                reservado[(pid, fecha)] = reservado.get((pid, fecha), 0) | mascara_ocupada(inicio, inicio + duracion)
+                propuestas[cita.pk] = (pid, fecha, _hora(inicio))
+                break
+    return propuestas
+
+
+def _horas_usadas(peluquero_ids, desde, hasta):
+    """{(peluquero_id, fecha, hora)} con alguna cita, también canceladas."""
+    return set(
+        Cita.objects.filter(peluquero_id__in=peluquero_ids, fecha__gte=desde, fecha__lte=hasta).values_list(
+            "peluquero_id", "fecha", "hora"
+        )
+    )
+
+
+@transaction.atomic
+def confirmar_reubicaciones(propuestas):
+    """Crea las citas nuevas de las propuestas elegidas, todas o ninguna.
+
+    `propuestas`: lista de (cita_original, peluquero_id, fecha, hora). Antes
+    de crearlas se comprueba en bloque lo mismo que `Cita.clean` (que
+    bulk_create no llama): que los huecos siguen libres, que el peluquero
+    ofrece el servicio y que la cita no se ha reubicado ya. Los peluqueros
+    se bloquean (select_for_update) para que dos confirmaciones a la vez no
+    den el mismo hueco. Devuelve las citas creadas; lanza ValueError si
+    alguna ya no cabe.
+    """
+    if not propuestas:
+        return []
+
+    pids = {pid for _, pid, _, _ in propuestas}
+    list(Peluqueros.objects.select_for_update().filter(pk__in=pids).values_list("pk", flat=True))
+
+    motivos = {cita.pk: f"Reubicada de la cita #{cita.pk}" for cita, *_ in propuestas}
+    repetida = (
+        Cita.objects.filter(motivo__in=motivos.values())
+        .exclude(estado=Cita.Estado.CANCELADA)
+        .values_list("motivo", flat=True)
+        .first()
+    )
+    if repetida:
+        raise ValueError(f"{repetida} ya existe.")
+
+    ofrecidos = set(
+        Peluqueros.servicios.through.objects.filter(
+            peluqueros_id__in=pids, servicio_id__in={cita.servicio_id for cita, *_ in propuestas}
+        ).values_list("peluqueros_id", "servicio_id")
+    )
+    for cita, pid, _, _ in propuestas:
+        if cita.servicio_id and (pid, cita.servicio_id) not in ofrecidos:
+            raise ValueError(f"El peluquero elegido para la cita #{cita.pk} no ofrece {cita.servicio}.")
+
+    consultas = [
+        (pid, fecha, cita.duracion_minutos or _servicio_duracion_minutos(cita.servicio))
+        for cita, pid, fecha, _ in propuestas
+    ]
+    desde, hasta = min(c[1] for c in consultas), max(c[1] for c in consultas)
+    bloque = BloqueAgenda(pids, desde, hasta)
+    usadas = _horas_usadas(pids, desde, hasta)
+
+    reservado = {}
+    nuevas = []
+    for (cita, pid, fecha, hora), (_, _, duracion) in zip(propuestas, consultas):
+        inicio = _minutos(hora)
+        libres = bloque.mascara_disponible(pid, fecha, duracion, reservado.get((pid, fecha), 0))
+        bit = (inicio - INICIO_REJILLA) // PASO
+        if fecha < timezone.localdate() or bit < 0 or not libres >> bit & 1:
+            raise ValueError(f"El hueco del {fecha} a las {hora:%H:%M} para la cita #{cita.pk} ya no está libre.")
+        if (pid, fecha, hora) in usadas:
+            raise ValueError(
+                f"El peluquero ya tiene una cita (quizá cancelada) el {fecha} a las {hora:%H:%M}: "
+                f"elige otra hora para la cita #{cita.pk}."
+            )
+        reservado[(pid, fecha)] = reservado.get((pid, fecha), 0) | mascara_ocupada(inicio, inicio + duracion)
+        nueva = Cita(
+            cliente_id=cita.cliente_id,
+            peluquero_id=pid,
+            servicio_id=cita.servicio_id,
+            fecha=fecha,
+            hora=hora,
+            motivo=motivos[cita.pk],
+        )
+        # bulk_create no llama a save(): duración y hora fin se fijan aquí
+        nueva.duracion_minutos = duracion
+        nueva.hora_fin = _sumar_minutos(hora, duracion)
+        # Se mantiene el precio con que se reservó: el cambio no es cosa del cliente
+        nueva.precio = cita.precio if cita.precio is not None else (cita.servicio.precio if cita.servicio else None)
+        nuevas.append(nueva)
+
+    nuevas = Cita.objects.bulk_create(nuevas)
+    registrar(Cambio.Accion.ALTA, nuevas)
+    disponibilidad.invalidar_dias((c.peluquero_id, c.fecha) for c in nuevas)
+    return nuevas
@@ -0,0 +1,115 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import archivo, busqueda, cambios, catalogo, clientes, disponibilidad, resumenes
+from .models import Cambio, Cita, Cliente, DiaEspecial, HorarioPeluquero, Peluqueros, Servicio, TurnoPeluquero
+
+
+@receiver(post_save, sender=HorarioPeluquero)
+@receiver(post_delete, sender=HorarioPeluquero)
+def invalidar_plantilla_semanal(sender, instance, **kwargs):
+    disponibilidad.invalidar("horarios", instance.peluquero_id)
+
+
+@receiver(post_save, sender=TurnoPeluquero)
+@receiver(post_delete, sender=TurnoPeluquero)
+def invalidar_resolutor_turnos(sender, instance, **kwargs):
+    disponibilidad.invalidar("turnos", instance.peluquero_id)
+
+
+@receiver(post_save, sender=DiaEspecial)
+@receiver(post_delete, sender=DiaEspecial)
+def invalidar_calendario_salon(sender, instance, **kwargs):
+    disponibilidad.invalidar("calendario", "salon")
+
+
+@receiver(post_save, sender=Cita)
+@receiver(post_delete, sender=Cita)
+def invalidar_dia_de_cita(sender, instance, **kwargs):
+    # El día de antes y el de ahora, por si la cita ha cambiado de peluquero o de fecha
+    if archivo.archivando():
+        return
+    antes = getattr(instance, "_guardado", None) or {}
+    disponibilidad.invalidar_dias(
+        [(instance.peluquero_id, instance.fecha), (antes.get("peluquero_id"), antes.get("fecha"))]
+    )
+
+
+@receiver(post_save, sender=Cita)
+def actualizar_resumen_al_guardar(sender, instance, raw=False, **kwargs):
+    if not raw:
+        resumenes.actualizar_por_cita(instance)
+
+
+@receiver(post_delete, sender=Cita)
+def actualizar_resumen_al_borrar(sender, instance, **kwargs):
+    # Al archivar la cita sigue contando, solo cambia de tabla
+    if not archivo.archivando():
+        resumenes.actualizar_por_cita(instance, borrada=True)
+
+
+@receiver(pre_delete, sender=Servicio)
+def soltar_resumen_del_servicio(sender, instance, **kwargs):
+    resumenes.soltar_servicio(instance.pk)
+
+
+@receiver(post_save, sender=Cita)
+@receiver(post_save, sender=TurnoPeluquero)
+@receiver(post_save, sender=HorarioPeluquero)
+def registrar_cambio_al_guardar(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    accion = Cambio.Accion.MODIFICACION
+    if sender is Cita:
+        accion = cambios.accion_cita(instance, created)
+    elif created:
+        accion = Cambio.Accion.ALTA
+    cambios.registrar(accion, [instance])
+
+
+@receiver(post_delete, sender=Cita)
+@receiver(post_delete, sender=TurnoPeluquero)
+@receiver(post_delete, sender=HorarioPeluquero)
+def registrar_cambio_al_borrar(sender, instance, **kwargs):
+    # Las citas archivadas se registran por lotes en archivo.archivar_lote
+    if not (sender is Cita and archivo.archivando()):
+        cambios.registrar(Cambio.Accion.BORRADO, [instance])
+
+
+@receiver(post_save, sender=Servicio)
+@receiver(post_delete, sender=Servicio)
+@receiver(post_save, sender=Peluqueros)
+@receiver(post_delete, sender=Peluqueros)
+@receiver(m2m_changed, sender=Peluqueros.servicios.through)
+def invalidar_catalogo_reserva(sender, **kwargs):
+    catalogo.invalidar_catalogo()
+
+
+@receiver(user_logged_in)
+def crear_cliente_al_entrar(sender, request, user, **kwargs):
+    clientes.get_or_create_cliente(user)
+
+
+@receiver(pre_save, sender=Cliente)
+def olvidar_cliente_al_cambiar(sender, instance, raw=False, **kwargs):
+    # El usuario puede cambiar desde el admin: olvidar el anterior y el nuevo
+    anterior = None
+    if instance.pk and not raw:
+        anterior = Cliente.objects.filter(pk=instance.pk).values_list("user_id", flat=True).first()
+    clientes.olvidar(anterior, instance.user_id)
+
+
+@receiver(post_delete, sender=Cliente)
+def olvidar_cliente_al_borrar(sender, instance, **kwargs):
+    clientes.olvidar(instance.user_id)
+
+
+@receiver(post_save, sender=Cliente)
+def indexar_cliente(sender, instance, **kwargs):
+    busqueda.backend().indexar([instance])
+
+
+@receiver(post_delete, sender=Cliente)
+def quitar_cliente_del_indice(sender, instance, **kwargs):
+    busqueda.backend().quitar([instance.pk])
@@ -0,0 +1,140 @@
+"""Cola de tareas en la base de datos (Tarea).
+
+Las vistas no hacen trabajo lento (enviar correos...): encolan una Tarea y
+el trabajador (`manage.py procesar_tareas`) la ejecuta aparte. Cada tipo de
+tarea tiene un manejador registrado con `@manejador("tipo")` que recibe un
+lote de tareas y devuelve {tarea.id: error o None}; así un lote de correos
+sale por una sola conexión SMTP.
+
+Para reservar un lote se usa `select_for_update(skip_locked=True)` donde
+la BD lo permite (en SQLite, un UPDATE condicional con subconsulta) y las
+tareas quedan marcadas con el nombre de la reserva. La reserva caduca a
+los BLOQUEO segundos: si el trabajador muere, la tarea vuelve a la cola.
+Los fallos se reintentan con espera exponencial hasta `max_intentos`;
+después la tarea queda FALLIDA.
+"""
+
+import uuid
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Tarea
+
+BLOQUEO = 5 * 60
+ESPERA_BASE = 30
+ESPERA_MAXIMA = 60 * 60
+
+MANEJADORES = {}
+
+
+def manejador(tipo, lote=50):
+    """Registra la función que procesa las tareas de `tipo`, hasta `lote` por llamada."""
+
+    def registrar(funcion):
+        MANEJADORES[tipo] = (funcion, lote)
+        return funcion
+
+    return registrar
+
+
+def encolar(tipo, datos, claves=None, cuando=None):
+    """Encola una tarea por cada elemento de `datos`, en un solo INSERT por lote.
+
+    Con `claves`, las que ya existan se ignoran (encolar dos veces no duplica).
+    """
+    cuando = cuando or timezone.now()
+    claves = claves or [None] * len(datos)
+    tareas = [Tarea(tipo=tipo, datos=d, clave=c, disponible_en=cuando) for d, c in zip(datos, claves)]
+    Tarea.objects.bulk_create(tareas, batch_size=1000, ignore_conflicts=True)
+    return len(tareas)
+
+
+def espera_reintento(intentos):
+    """Segundos hasta el siguiente intento: 30 s, 1 min, 2 min... hasta 1 h."""
+    return min(ESPERA_BASE * 2 ** max(intentos - 1, 0), ESPERA_MAXIMA)
+
+
+def _disponibles(tipo, ahora):
+    caducadas = Q(estado=Tarea.Estado.EN_CURSO, reservada_hasta__lt=ahora)
+    return Tarea.objects.filter(Q(estado=Tarea.Estado.PENDIENTE, disponible_en__lte=ahora) | caducadas, tipo=tipo)
+
+
+def reservar(tipo, tamano, trabajador=""):
+    """Reserva hasta `tamano` tareas de `tipo` listas para ejecutarse."""
+    ahora = timezone.now()
+    reserva = f"{trabajador}:{uuid.uuid4().hex[:12]}"
+    candidatas = _disponibles(tipo, ahora).order_by("disponible_en", "id")
+    cambios = {
+        "estado": Tarea.Estado.EN_CURSO,
+        "reservada_por": reserva,
+        "reservada_hasta": ahora + timedelta(seconds=BLOQUEO),
+        "intentos": F("intentos") + 1,
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidatas.select_for_update(skip_locked=True).values_list("id", flat=True)[:tamano])
+            if not ids:
+                return []
+            _disponibles(tipo, ahora).filter(id__in=ids).update(**cambios)
+    else:
+        # SQLite: un solo UPDATE con subconsulta (leer y después escribir en
+        # la misma transacción puede dar "database is locked" entre hilos)
+        if not _disponibles(tipo, ahora).filter(id__in=candidatas.values("id")[:tamano]).update(**cambios):
+            return []
+    return list(Tarea.objects.filter(reservada_por=reserva, estado=Tarea.Estado.EN_CURSO).order_by("id"))
+
+
+def terminar(tareas, errores):
+    """Guarda el resultado de un lote. Devuelve (hechas, reintentos, fallidas).
+
+    Solo se tocan las tareas que siguen reservadas con esta reserva: si ha
+    caducado y otro trabajador la ha tomado, su resultado manda y esta no
+    cuenta. Los fallos se guardan con un UPDATE condicional por tarea (cada
+    una tiene su espera y su error).
+    """
+    if not tareas:
+        return 0, 0, 0
+    ahora = timezone.now()
+    reserva = tareas[0].reservada_por
+    nuestras = Tarea.objects.filter(reservada_por=reserva, estado=Tarea.Estado.EN_CURSO)
+    hechas = [t.pk for t in tareas if not errores.get(t.pk)]
+    n_hechas = n_reintentos = n_fallidas = 0
+
+    with transaction.atomic():
+        if hechas:
+            n_hechas = nuestras.filter(pk__in=hechas).update(
+                estado=Tarea.Estado.HECHA, terminada_en=ahora, reservada_por="", reservada_hasta=None, ultimo_error=""
+            )
+        for tarea in tareas:
+            error = errores.get(tarea.pk)
+            if not error:
+                continue
+            cambios = {"ultimo_error": str(error)[:2000], "reservada_por": "", "reservada_hasta": None}
+            if tarea.intentos >= tarea.max_intentos:
+                n_fallidas += nuestras.filter(pk=tarea.pk).update(
+                    estado=Tarea.Estado.FALLIDA, terminada_en=ahora, **cambios
+                )
+            else:
+                n_reintentos += nuestras.filter(pk=tarea.pk).update(
+                    estado=Tarea.Estado.PENDIENTE,
+                    disponible_en=ahora + timedelta(seconds=espera_reintento(tarea.intentos)),
+                    **cambios,
+                )
+    return n_hechas, n_reintentos, n_fallidas
+
+
+def procesar_lote(tipo, trabajador=""):
+    """Reserva y ejecuta un lote de `tipo`. Devuelve (hechas, reintentos, fallidas) o None si no había."""
+    funcion, tamano = MANEJADORES[tipo]
+    tareas = reservar(tipo, tamano, trabajador)
+    if not tareas:
+        return None
+    try:
+        errores = funcion(tareas) or {}
+    except Exception as e:
+        # Si falla el lote entero, cuenta como un intento fallido de cada tarea
+        errores = {t.pk: f"{type(e).__name__}: {e}" for t in tareas}
+    return terminar(tareas, errores)
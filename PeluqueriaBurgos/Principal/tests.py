@@ -1,3 +1,2046 @@
-from django.test import TestCase
+"""Pruebas de la disponibilidad contra una copia del cálculo original.
 
-# Create your tests here.
+Se generan agendas al azar (horarios con límites que no caen en la media
+hora, turnos que se pisan, ausencias, días especiales y citas de varias
+duraciones y estados, muchas junto a la comida) y se compara lo que
+devuelven `get_horas_disponibles`, `BloqueAgenda` y
+`mascaras_disponibles_lote` con `horas_referencia`, una copia del cálculo
+original por tramos de tiempo, sin máscaras ni cachés. Con las horas en la
+media hora (lo que deja meter la validación) tienen que coincidir; con
+horas sueltas las máscaras pueden quitar alguna, nunca añadirla.
+
+    python manage.py test Principal
+    FUZZ_SEMILLAS=200 python manage.py test Principal     # más agendas
+    BENCHMARK=1 python manage.py test Principal.tests.RendimientoDisponibilidadTests
+
+Si falla, el mensaje indica la semilla: `FUZZ_SEMILLA=<n>` repite solo esa.
+"""
+
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time as reloj
+from contextlib import contextmanager
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.admin import helpers
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet, Sum
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archivo, disponibilidad, limites, recordatorios, tareas
+from .archivo import historial_de_cliente
+from .busqueda import backend as busqueda
+from .busqueda import filtro_citas
+from .cambios import cambios_desde
+from .catalogo import N_DIAS, catalogo_reserva, datos_reserva, proximos_dias
+from .checks import cache_compartida
+from .clientes import cliente_id_de
+from .disponibilidad import (
+    HORIZONTE_DIAS,
+    BloqueAgenda,
+    CalendarioSalon,
+    PlantillaSemanal,
+    ResolutorTurnos,
+    buscar_proximas_horas,
+    calendario_salon,
+    horas_de_mascara,
+    mascaras_dias,
+    mascaras_disponibles_lote,
+    plantilla_semanal,
+    resolutor_turnos,
+)
+from .forms import CitaForm
+from .informes import calcular_ocupacion
+from .models import (
+    APERTURA,
+    CIERRE,
+    COMIDA_FIN,
+    COMIDA_INICIO,
+    Cambio,
+    Cita,
+    CitaHistorica,
+    Cliente,
+    DiaEspecial,
+    HorarioPeluquero,
+    Peluqueros,
+    ResumenDiario,
+    Servicio,
+    Tarea,
+    TurnoPeluquero,
+    _servicio_duracion_minutos,
+    get_horas_disponibles,
+)
+from .resumenes import recalcular
+from .retenciones import DURACION_RETENCION, liberar, mascara_retenida, retenida_por_otro, retener, titular_de
+from .reubicacion import confirmar_reubicaciones, marcar_ausencia, proponer_reubicaciones
+from .views import MAX_CONSULTAS_LOTE, TIPO_MASCARA
+
+# 0 es un servicio sin duración: cuenta como 30 minutos
+DURACIONES = (0, 15, 30, 40, 45, 60, 75, 90, 120)
+PASO = 30
+
+
+def _min(t):
+    return t.hour * 60 + t.minute
+
+
+def _hora(minutos):
+    return time(minutos // 60, minutos % 60)
+
+
+# --- Generador de agendas -------------------------------------------------
+
+
+def _minuto(rng, desde, hasta):
+    """Minuto en [desde, hasta]: casi siempre en la media hora, a veces no."""
+    m = rng.randint(desde, hasta)
+    if rng.random() < 0.6:
+        m -= m % PASO
+    elif rng.random() < 0.5:
+        m -= m % 5
+    return max(desde, min(m, hasta))
+
+
+def _hora_cita(rng):
+    cerca_comida = (_min(COMIDA_INICIO) - 45, _min(COMIDA_INICIO) - 15, _min(COMIDA_FIN) - 15, _min(COMIDA_FIN))
+    if rng.random() < 0.3:
+        return rng.choice(cerca_comida) + rng.choice((0, 0, 5, 10))
+    return _minuto(rng, _min(APERTURA) - 30, _min(CIERRE))
+
+
+def generar_agenda(rng, hoy, n_peluqueros=3, n_dias=21, rejilla=True):
+    """Crea en la BD una agenda al azar y devuelve (peluqueros, servicios, fechas).
+
+    Se crea con bulk_create, sin señales ni validaciones: también salen
+    datos que el admin no dejaría meter (citas solapadas, horarios que se
+    pisan o que terminan antes de empezar). Con `rejilla` las horas de
+    horarios, días especiales y comienzo de las citas caen en la media hora,
+    como exige la validación; el fin de las citas depende de la duración.
+    Sin ella salen también horas sueltas (datos de antes de validarlas).
+    """
+    ajustar = (lambda m: m - m % PASO) if rejilla else (lambda m: m)
+    servicios = Servicio.objects.bulk_create(
+        [Servicio(nombre=f"Servicio {d}", duracion_minutos=d, precio=10) for d in DURACIONES]
+    )
+    peluqueros = Peluqueros.objects.bulk_create(
+        [Peluqueros(nombre=f"Peluquero {i}", apellido="Prueba") for i in range(n_peluqueros)]
+    )
+    for peluquero in peluqueros:
+        peluquero.servicios.set(servicios)
+    cliente = Cliente.objects.create(nombre="Cliente", apellido="Prueba")
+
+    horarios = []
+    for peluquero in peluqueros:
+        for dia in range(7):
+            fin_anterior = None
+            for _ in range(rng.choice((0, 1, 1, 2, 2, 3))):
+                if fin_anterior is not None and rng.random() < 0.4:
+                    # Pegado al anterior o pisándolo
+                    inicio = max(fin_anterior - rng.choice((0, 0, 10, 45)), 0)
+                else:
+                    inicio = _minuto(rng, 7 * 60, 20 * 60)
+                fin = min(inicio + rng.choice((-30, 20, 45, 90, 150, 240, 330)), 23 * 60 + 30)
+                fin = fin if rng.random() < 0.5 else _minuto(rng, fin, fin + 20)
+                horarios.append(
+                    HorarioPeluquero(
+                        peluquero=peluquero,
+                        dia_semana=dia,
+                        hora_inicio=_hora(ajustar(inicio)),
+                        hora_fin=_hora(ajustar(max(fin, 0))),
+                        activo=rng.random() < 0.9,
+                    )
+                )
+                fin_anterior = fin
+    HorarioPeluquero.objects.bulk_create(horarios)
+
+    turnos = []
+    for peluquero in peluqueros:
+        for _ in range(rng.randint(0, 4)):
+            inicio = hoy + timedelta(days=rng.randint(-10, n_dias))
+            turnos.append(
+                TurnoPeluquero(
+                    peluquero=peluquero,
+                    fecha_inicio=inicio,
+                    fecha_fin=inicio + timedelta(days=rng.randint(-1, 10)),
+                    turno=rng.choice(TurnoPeluquero.Turno.values),
+                    activo=rng.random() < 0.85,
+                )
+            )
+    TurnoPeluquero.objects.bulk_create(turnos)
+
+    especiales = []
+    for _ in range(rng.randint(0, 4)):
+        inicio = hoy + timedelta(days=rng.randint(-3, n_dias))
+        apertura = _minuto(rng, 6 * 60, 12 * 60)
+        especiales.append(
+            DiaEspecial(
+                fecha_inicio=inicio,
+                fecha_fin=inicio + timedelta(days=rng.randint(0, 5)),
+                tipo=rng.choice(DiaEspecial.Tipo.values),
+                hora_apertura=_hora(ajustar(apertura)),
+                hora_cierre=_hora(ajustar(_minuto(rng, apertura + 60, 22 * 60))),
+                cierre_comida=rng.random() < 0.5,
+                incluye_domingos=rng.random() < 0.3,
+                activo=rng.random() < 0.85,
+            )
+        )
+    DiaEspecial.objects.bulk_create(especiales)
+
+    fechas = [hoy + timedelta(days=d) for d in range(-2, n_dias)]
+    citas = []
+    for peluquero in peluqueros:
+        for fecha in fechas:
+            for _ in range(rng.randint(0, 8)):
+                servicio = rng.choice(servicios + [None])
+                inicio = ajustar(_hora_cita(rng))
+                # Como al guardar; las antiguas las rellenó la migración 0008
+                fin = inicio + _servicio_duracion_minutos(servicio)
+                citas.append(
+                    Cita(
+                        cliente=cliente,
+                        peluquero=peluquero,
+                        servicio=servicio,
+                        fecha=fecha,
+                        hora=_hora(inicio),
+                        hora_fin=_hora(fin),
+                        estado=rng.choice(Cita.Estado.values),
+                    )
+                )
+    Cita.objects.bulk_create(citas, ignore_conflicts=True)
+    return peluqueros, servicios, fechas
+
+
+# --- Referencia ------------------------------------------------------------
+#
+# Copia del `get_horas_disponibles` original (antes de las máscaras): tramos
+# de trabajo unidos, inicios cada media hora desde el principio de cada
+# tramo y solape exacto, al minuto, con la comida y con las citas. Añade lo
+# que el original no tenía: días especiales, ausencias, varios turnos el
+# mismo día (manda el más reciente) y la hora fin guardada en la cita.
+
+
+def _unir(tramos):
+    """Tramos [inicio, fin) ordenados y unidos cuando se tocan o se pisan."""
+    unidos = []
+    for inicio, fin in sorted(t for t in tramos if t[1] > t[0]):
+        if not unidos or inicio > unidos[-1][1]:
+            unidos.append([inicio, fin])
+        else:
+            unidos[-1][1] = max(unidos[-1][1], fin)
+    return [tuple(t) for t in unidos]
+
+
+def _cortar(tramos, otros):
+    """Parte común de dos listas de tramos unidos."""
+    return _unir(
+        (max(i1, i2), min(f1, f2)) for i1, f1 in tramos for i2, f2 in otros if max(i1, i2) < min(f1, f2)
+    )
+
+
+def _tramos_abiertos(fecha):
+    """Tramos en que la peluquería está abierta ese día."""
+    especiales = DiaEspecial.objects.filter(activo=True, fecha_inicio__lte=fecha, fecha_fin__gte=fecha)
+    if any(e.tipo != DiaEspecial.Tipo.HORARIO for e in especiales):
+        return []
+    horarios = [e for e in especiales if e.incluye_domingos or fecha.weekday() != 6]
+    if horarios:
+        especial = max(horarios, key=lambda e: (e.fecha_inicio, e.pk))
+        abierto = [(_min(especial.hora_apertura), _min(especial.hora_cierre))]
+        comida = especial.cierre_comida
+    elif fecha.weekday() == 6:
+        return []
+    else:
+        abierto = [(_min(APERTURA), _min(CIERRE))]
+        comida = True
+    if comida:
+        abierto = _cortar(abierto, [(0, _min(COMIDA_INICIO)), (_min(COMIDA_FIN), 24 * 60)])
+    return _cortar(abierto, [(_min(APERTURA), _min(CIERRE))])
+
+
+def _tramos_trabajo(peluquero_id, fecha):
+    """Tramos que trabaja: su turno de ese día o, si no tiene, la plantilla semanal."""
+    turnos = list(
+        TurnoPeluquero.objects.filter(
+            peluquero_id=peluquero_id, activo=True, fecha_inicio__lte=fecha, fecha_fin__gte=fecha
+        )
+    )
+    manana = (_min(APERTURA), _min(COMIDA_INICIO))
+    tarde = (_min(COMIDA_FIN), _min(CIERRE))
+    if any(t.turno == TurnoPeluquero.Turno.AUSENCIA for t in turnos):
+        return []
+    if turnos:
+        turno = max(turnos, key=lambda t: (t.fecha_inicio, t.pk)).turno
+        return {
+            TurnoPeluquero.Turno.MANANA: [manana],
+            TurnoPeluquero.Turno.TARDE: [tarde],
+            TurnoPeluquero.Turno.COMPLETO: [manana, tarde],
+        }[turno]
+    return _unir(
+        (_min(inicio), _min(fin))
+        for inicio, fin in HorarioPeluquero.objects.filter(
+            peluquero_id=peluquero_id, dia_semana=fecha.weekday(), activo=True
+        ).values_list("hora_inicio", "hora_fin")
+    )
+
+
+def agenda_referencia(peluquero_id, fecha, exclude_cita_pk=None):
+    """(tramos en que está abierto y el peluquero trabaja, tramos de sus citas)."""
+    tramos = _cortar(_tramos_abiertos(fecha), _tramos_trabajo(peluquero_id, fecha))
+    citas = Cita.objects.filter(peluquero_id=peluquero_id, fecha=fecha).exclude(estado=Cita.Estado.CANCELADA)
+    if exclude_cita_pk:
+        citas = citas.exclude(pk=exclude_cita_pk)
+    ocupadas = []
+    for cita in citas.select_related("servicio"):
+        inicio = _min(cita.hora)
+        # Sin hora fin (citas de antes de guardarla), como el original: la duración del servicio
+        fin = _min(cita.hora_fin) if cita.hora_fin else inicio + _servicio_duracion_minutos(cita.servicio)
+        ocupadas.append((inicio, fin))
+    return tramos, ocupadas
+
+
+def horas_referencia(agenda, fecha, duracion):
+    """Horas de inicio con hueco para `duracion` minutos, como el original."""
+    if fecha < timezone.localdate():
+        return []
+    tramos, ocupadas = agenda
+    disponibles = []
+    for inicio_h, fin_h in tramos:
+        # Al siguiente bloque de 30 minutos (00 o 30)
+        cursor = -(-inicio_h // PASO) * PASO
+        while cursor + duracion <= fin_h:
+            fin = cursor + duracion
+            if not any(cursor < o_fin and o_inicio < fin for o_inicio, o_fin in ocupadas):
+                disponibles.append(_hora(cursor))
+            cursor += PASO
+    return disponibles
+
+
+# --- Pruebas ---------------------------------------------------------------
+
+
+def _semillas():
+    if "FUZZ_SEMILLA" in os.environ:
+        return [int(os.environ["FUZZ_SEMILLA"])]
+    return range(int(os.environ.get("FUZZ_SEMILLAS", 8)))
+
+
+@contextmanager
+def agenda_aleatoria(semilla, **kwargs):
+    """Genera la agenda de `semilla` y la deshace al salir.
+
+    Al deshacerla los ids se reutilizan: se vacía la caché para que las
+    versiones (y con ellas las cachés de cada proceso) empiecen de cero.
+    """
+    with transaction.atomic():
+        cache.clear()
+        yield generar_agenda(random.Random(semilla), timezone.localdate(), **kwargs)
+        transaction.set_rollback(True)
+    cache.clear()
+
+
+class DisponibilidadReferenciaTests(TestCase):
+    def _comprobar(self, semilla, peluqueros, servicios, fechas, obtener):
+        for peluquero in peluqueros:
+            for fecha in fechas:
+                agenda = agenda_referencia(peluquero.pk, fecha)
+                for servicio in servicios:
+                    duracion = _servicio_duracion_minutos(servicio)
+                    self.assertEqual(
+                        obtener(peluquero, fecha, servicio),
+                        horas_referencia(agenda, fecha, duracion),
+                        f"semilla {semilla}, peluquero {peluquero.pk}, {fecha}, {duracion} min",
+                    )
+
+    def test_get_horas_disponibles(self):
+        for semilla in _semillas():
+            with self.subTest(semilla=semilla), agenda_aleatoria(semilla) as (peluqueros, servicios, fechas):
+                obtener = lambda p, f, s: get_horas_disponibles(peluquero=p, fecha=f, servicio=s)
+                self._comprobar(semilla, peluqueros, servicios, fechas, obtener)
+                # Segunda pasada: ya sale de la caché de cada día
+                self._comprobar(semilla, peluqueros, servicios, fechas, obtener)
+
+    def test_bloque_agenda(self):
+        for semilla in _semillas():
+            with self.subTest(semilla=semilla), agenda_aleatoria(semilla) as (peluqueros, servicios, fechas):
+                hoy = timezone.localdate()
+                bloque = BloqueAgenda([p.pk for p in peluqueros], hoy, fechas[-1])
+
+                def obtener(peluquero, fecha, servicio):
+                    if fecha < hoy:
+                        return []
+                    return bloque.horas_disponibles(peluquero.pk, fecha, _servicio_duracion_minutos(servicio))
+
+                self._comprobar(semilla, peluqueros, servicios, fechas, obtener)
+
+    def test_mascaras_disponibles_lote(self):
+        for semilla in _semillas():
+            with self.subTest(semilla=semilla), agenda_aleatoria(semilla) as (peluqueros, servicios, fechas):
+                consultas = [
+                    (p.pk, f, _servicio_duracion_minutos(s)) for p in peluqueros for f in fechas for s in servicios
+                ]
+                mascaras = dict(zip(consultas, mascaras_disponibles_lote(consultas)))
+                obtener = lambda p, f, s: horas_de_mascara(mascaras[(p.pk, f, _servicio_duracion_minutos(s))])
+                self._comprobar(semilla, peluqueros, servicios, fechas, obtener)
+
+    def test_excluyendo_una_cita(self):
+        for semilla in _semillas():
+            with self.subTest(semilla=semilla), agenda_aleatoria(semilla) as (_, servicios, _fechas):
+                hoy = timezone.localdate()
+                for cita in Cita.objects.activas().filter(fecha__gte=hoy).order_by("pk")[:20]:
+                    agenda = agenda_referencia(cita.peluquero_id, cita.fecha, exclude_cita_pk=cita.pk)
+                    for servicio in servicios:
+                        self.assertEqual(
+                            get_horas_disponibles(
+                                peluquero=cita.peluquero,
+                                fecha=cita.fecha,
+                                servicio=servicio,
+                                exclude_cita_pk=cita.pk,
+                            ),
+                            horas_referencia(agenda, cita.fecha, _servicio_duracion_minutos(servicio)),
+                            f"semilla {semilla}, cita {cita.pk} excluida",
+                        )
+
+    def test_cambios_en_la_agenda(self):
+        """Tras guardar, mover, cancelar o borrar citas la caché no devuelve horas viejas."""
+        for semilla in _semillas():
+            with self.subTest(semilla=semilla), agenda_aleatoria(semilla) as (peluqueros, servicios, fechas):
+                rng = random.Random(semilla)
+                hoy = timezone.localdate()
+                futuras = [f for f in fechas if f >= hoy]
+                obtener = lambda p, f, s: get_horas_disponibles(peluquero=p, fecha=f, servicio=s)
+                self._comprobar(semilla, peluqueros, servicios, futuras, obtener)
+
+                for _ in range(6):
+                    peluquero, fecha, servicio = rng.choice(peluqueros), rng.choice(futuras), rng.choice(servicios)
+                    # Una cita cancelada sigue ocupando su hora en unique_together
+                    usadas = set(
+                        Cita.objects.filter(peluquero=peluquero, fecha=fecha).values_list("hora", flat=True)
+                    )
+                    horas = [
+                        h for h in get_horas_disponibles(peluquero=peluquero, fecha=fecha, servicio=servicio)
+                        if h not in usadas
+                    ]
+                    cita = Cita.objects.activas().filter(fecha__gte=hoy).order_by("?").first()
+                    accion = rng.choice(("alta", "mover", "cancelar", "borrar"))
+                    if accion == "alta" and horas:
+                        Cita.objects.create(
+                            cliente=Cliente.objects.first(),
+                            peluquero=peluquero,
+                            servicio=servicio,
+                            fecha=fecha,
+                            hora=rng.choice(horas),
+                        )
+                    elif accion == "mover" and cita and horas:
+                        cita.peluquero, cita.fecha, cita.hora = peluquero, fecha, rng.choice(horas)
+                        cita.servicio = servicio
+                        cita.save()
+                    elif accion == "cancelar" and cita:
+                        cita.estado = Cita.Estado.CANCELADA
+                        cita.save()
+                    elif accion == "borrar" and cita:
+                        cita.delete()
+                    self._comprobar(semilla, peluqueros, servicios, futuras, obtener)
+
+    def test_horas_fuera_de_la_rejilla(self):
+        """Con horas sueltas (datos antiguos) las máscaras redondean a la media hora sin dar huecos de más.
+
+        Con duraciones de medias horas enteras el resultado es el mismo que
+        el del original; con las demás puede faltar alguna hora, nunca sobrar.
+        """
+        for semilla in _semillas():
+            aleatoria = agenda_aleatoria(semilla, rejilla=False)
+            with self.subTest(semilla=semilla), aleatoria as (peluqueros, servicios, fechas):
+                for peluquero in peluqueros:
+                    for fecha in fechas:
+                        agenda = agenda_referencia(peluquero.pk, fecha)
+                        for servicio in servicios:
+                            duracion = _servicio_duracion_minutos(servicio)
+                            horas = get_horas_disponibles(peluquero=peluquero, fecha=fecha, servicio=servicio)
+                            referencia = horas_referencia(agenda, fecha, duracion)
+                            mensaje = f"semilla {semilla}, peluquero {peluquero.pk}, {fecha}, {duracion} min"
+                            if duracion % PASO == 0:
+                                self.assertEqual(horas, referencia, mensaje)
+                            else:
+                                self.assertLessEqual(set(horas), set(referencia), mensaje)
+
+    def test_horarios_pegados(self):
+        """Dos tramos seguidos que no caen en la media hora cuentan como uno."""
+        peluquero = Peluqueros.objects.create(nombre="Ana", apellido="Prueba")
+        lunes = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        for inicio, fin in ((time(9, 0), time(10, 15)), (time(10, 15), time(11, 0))):
+            HorarioPeluquero.objects.create(peluquero=peluquero, dia_semana=0, hora_inicio=inicio, hora_fin=fin)
+        self.assertEqual(
+            get_horas_disponibles(peluquero=peluquero, fecha=lunes),
+            [time(9, 0), time(9, 30), time(10, 0), time(10, 30)],
+        )
+
+
+# --- Datos de prueba del resto de funciones ---------------------------------
+
+
+def proximo_laborable(desde_hoy=1):
+    """Primer día no domingo a `desde_hoy` días o más de hoy."""
+    fecha = timezone.localdate() + timedelta(days=desde_hoy)
+    return fecha + timedelta(days=1) if fecha.weekday() == 6 else fecha
+
+
+@contextmanager
+def cambio_concurrente(cita, **campos):
+    """Otra petición cambia `cita` justo antes del primer update() sobre citas."""
+    original = QuerySet.update
+    pendiente = [True]
+
+    def update(qs, **kwargs):
+        if pendiente and qs.model is Cita:
+            pendiente.clear()
+            original(Cita.objects.filter(pk=cita.pk), **campos)
+        return original(qs, **kwargs)
+
+    with mock.patch.object(QuerySet, "update", update):
+        yield
+
+
+class SalonTestCase(TestCase):
+    """Un servicio de 30 minutos a 10 €, una peluquera que lo hace de lunes a sábado y una clienta.
+
+    La caché (versiones, resultados por día, catálogo...) se vacía en cada
+    prueba: al deshacer la transacción los ids se reutilizan.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.servicio = Servicio.objects.create(nombre="Corte", duracion_minutos=30, precio=Decimal("10.00"))
+        self.peluquero = Peluqueros.objects.create(nombre="Ana", apellido="Prueba")
+        self.peluquero.servicios.add(self.servicio)
+        for dia in range(6):
+            HorarioPeluquero.objects.create(
+                peluquero=self.peluquero, dia_semana=dia, hora_inicio=time(9, 0), hora_fin=time(13, 30)
+            )
+            HorarioPeluquero.objects.create(
+                peluquero=self.peluquero, dia_semana=dia, hora_inicio=time(15, 0), hora_fin=time(20, 0)
+            )
+        self.cliente = Cliente.objects.create(
+            nombre="Berta", apellido="Prueba", email="berta@example.com", telefono="612 345 678"
+        )
+
+    def cita(self, fecha=None, hora=time(10, 0), **campos):
+        campos.setdefault("servicio", self.servicio)
+        campos.setdefault("cliente", self.cliente)
+        return Cita.objects.create(
+            peluquero=self.peluquero,
+            fecha=fecha or proximo_laborable(),
+            hora=hora,
+            **campos,
+        )
+
+    def entrar(self):
+        """Inicia sesión con un usuario enlazado a la clienta de prueba."""
+        self.cliente.user = User.objects.create_user("berta", email=self.cliente.email, password="x")
+        self.cliente.save()
+        self.client.force_login(self.cliente.user)
+
+
+class ProximaCitaTests(SalonTestCase):
+    def test_primeros_huecos_en_orden(self):
+        fecha = proximo_laborable()
+        huecos = buscar_proximas_horas(servicio=self.servicio, desde=fecha, limite=3)
+        self.assertEqual(
+            huecos,
+            [(fecha, self.peluquero, hora) for hora in (time(9, 0), time(9, 30), time(10, 0))],
+        )
+
+    def test_salta_las_horas_ocupadas_y_los_dias_cerrados(self):
+        fecha = proximo_laborable()
+        self.cita(fecha=fecha, hora=time(9, 0))
+        festivo = fecha + timedelta(days=1)
+        DiaEspecial.objects.create(fecha_inicio=festivo, fecha_fin=festivo, tipo=DiaEspecial.Tipo.FESTIVO)
+        huecos = buscar_proximas_horas(servicio=self.servicio, desde=fecha, limite=30)
+        self.assertEqual(huecos[0][2], time(9, 30))
+        self.assertNotIn(festivo, {f for f, _, _ in huecos})
+
+    def test_carga_solo_las_semanas_que_recorre(self):
+        fecha = proximo_laborable()
+        consultas = []
+        for horizonte in (7, HORIZONTE_DIAS):
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                buscar_proximas_horas(servicio=self.servicio, desde=fecha, horizonte_dias=horizonte, limite=1)
+            consultas.append(len(ctx))
+        self.assertEqual(consultas[0], consultas[1])
+
+    def test_servicio_sin_peluqueros(self):
+        tinte = Servicio.objects.create(nombre="Tinte", duracion_minutos=60, precio=Decimal("40.00"))
+        self.assertEqual(buscar_proximas_horas(servicio=tinte), [])
+
+    def test_api(self):
+        self.entrar()
+        url = reverse("api_proxima_cita")
+        datos = self.client.get(url, {"servicio_id": self.servicio.pk, "limite": 2}).json()
+        self.assertEqual(len(datos["huecos"]), 2)
+        self.assertEqual(datos["huecos"][0]["peluquero"], "Ana Prueba")
+        self.assertEqual(self.client.get(url, {"servicio_id": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"servicio_id": 999}).status_code, 404)
+        self.assertEqual(
+            self.client.get(url, {"servicio_id": self.servicio.pk, "peluquero_id": 999}).status_code, 404
+        )
+
+
+class PlantillaSemanalTests(SalonTestCase):
+    def test_une_los_tramos_que_se_tocan_antes_de_redondear(self):
+        plantilla = PlantillaSemanal.compilar(
+            [(0, time(10, 15), time(11, 0)), (0, time(9, 0), time(10, 15)), (1, time(9, 0), time(10, 15))]
+        )
+        self.assertEqual(
+            horas_de_mascara(plantilla.mascara(0)), [time(9, 0), time(9, 30), time(10, 0), time(10, 30)]
+        )
+        self.assertEqual(horas_de_mascara(plantilla.mascara(1)), [time(9, 0), time(9, 30)])
+        self.assertEqual(plantilla.mascara(6), 0)
+
+    def test_se_cachea_y_se_recompila_al_cambiar_el_horario(self):
+        lunes = plantilla_semanal(self.peluquero.pk).mascara(0)
+        with self.assertNumQueries(0):
+            self.assertEqual(plantilla_semanal(self.peluquero.pk).mascara(0), lunes)
+
+        horario = HorarioPeluquero.objects.get(peluquero=self.peluquero, dia_semana=0, hora_inicio=time(15, 0))
+        horario.activo = False
+        horario.save()
+        self.assertEqual(horas_de_mascara(plantilla_semanal(self.peluquero.pk).mascara(0))[-1], time(13, 0))
+
+
+class DesfaseCacheTests(SalonTestCase):
+    def test_lo_compilado_caduca_aunque_no_llegue_la_invalidacion(self):
+        ahora = reloj.monotonic()
+        with mock.patch.object(disponibilidad, "monotonic", return_value=ahora):
+            lunes = plantilla_semanal(self.peluquero.pk).mascara(0)
+        # Cambio hecho en otro proceso: aquí no se renueva la versión
+        HorarioPeluquero.objects.filter(peluquero=self.peluquero, hora_inicio=time(15, 0)).update(activo=False)
+        with mock.patch.object(disponibilidad, "monotonic", return_value=ahora + disponibilidad.MAX_DESFASE - 1):
+            self.assertEqual(plantilla_semanal(self.peluquero.pk).mascara(0), lunes)
+        with mock.patch.object(disponibilidad, "monotonic", return_value=ahora + disponibilidad.MAX_DESFASE):
+            self.assertEqual(horas_de_mascara(plantilla_semanal(self.peluquero.pk).mascara(0))[-1], time(13, 0))
+
+    def test_caducidad_de_las_versiones(self):
+        self.assertEqual(disponibilidad._caducidad_version("horarios"), disponibilidad.MAX_DESFASE)
+        self.assertEqual(disponibilidad._caducidad_version("dia"), disponibilidad.MAX_DESFASE)
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}):
+            self.assertEqual(disponibilidad._caducidad_version("horarios"), disponibilidad.MAX_DESFASE)
+            self.assertEqual(disponibilidad._caducidad_version("dia"), disponibilidad.CADUCIDAD_VERSIONES["dia"])
+
+    def test_aviso_de_cache_por_proceso(self):
+        with override_settings(DEBUG=False):
+            self.assertEqual([aviso.id for aviso in cache_compartida(None)], ["Principal.W001"])
+            with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}):
+                self.assertEqual(cache_compartida(None), [])
+        with override_settings(DEBUG=True):
+            self.assertEqual(cache_compartida(None), [])
+
+
+class ResolutorTurnosTests(SalonTestCase):
+    def test_coincide_con_la_prioridad_de_la_bd(self):
+        rng = random.Random(28)
+        hoy = timezone.localdate()
+        for _ in range(50):
+            turnos = []
+            for pk in range(1, rng.randint(1, 8)):
+                inicio = hoy + timedelta(days=rng.randint(0, 40))
+                fin = inicio + timedelta(days=rng.randint(-1, 15))
+                turnos.append((inicio, fin, pk, rng.choice(TurnoPeluquero.Turno.values)))
+            resolutor = ResolutorTurnos.compilar(turnos)
+
+            desde, hasta = hoy - timedelta(days=2), hoy + timedelta(days=60)
+            esperado = []
+            fecha = desde
+            while fecha <= hasta:
+                aplican = sorted((t for t in turnos if t[0] <= fecha <= t[1]), key=lambda t: (t[0], t[2]))
+                ausencias = [t for t in aplican if t[3] == TurnoPeluquero.Turno.AUSENCIA]
+                esperado.append((fecha, (ausencias or aplican or [(None,) * 4])[-1][3]))
+                fecha += timedelta(days=1)
+
+            self.assertEqual([(f, resolutor.turno(f)) for f, _ in esperado], esperado, turnos)
+            self.assertEqual(list(resolutor.rango(desde, hasta)), esperado, turnos)
+
+    def test_un_turno_nuevo_manda_sobre_la_plantilla(self):
+        fecha = proximo_laborable()
+        self.assertIsNone(resolutor_turnos(self.peluquero.pk).turno(fecha))
+        TurnoPeluquero.objects.create(
+            peluquero=self.peluquero, fecha_inicio=fecha, fecha_fin=fecha, turno=TurnoPeluquero.Turno.AUSENCIA
+        )
+        self.assertEqual(resolutor_turnos(self.peluquero.pk).turno(fecha), TurnoPeluquero.Turno.AUSENCIA)
+        self.assertEqual(get_horas_disponibles(peluquero=self.peluquero, fecha=fecha, servicio=self.servicio), [])
+
+
+class CalendarioSalonTests(SalonTestCase):
+    def especial(self, pk, desde, hasta, tipo, **campos):
+        return DiaEspecial(pk=pk, fecha_inicio=desde, fecha_fin=hasta, tipo=tipo, **campos)
+
+    def test_festivos_y_cierres_mandan_sobre_los_horarios_especiales(self):
+        calendario = CalendarioSalon.compilar(
+            2031,
+            [
+                self.especial(1, date(2030, 12, 29), date(2031, 1, 1), DiaEspecial.Tipo.CIERRE, descripcion="Obras"),
+                self.especial(
+                    2, date(2031, 1, 1), date(2031, 1, 7), DiaEspecial.Tipo.HORARIO,
+                    hora_apertura=time(10, 0), hora_cierre=time(12, 0),
+                ),
+                self.especial(
+                    3, date(2031, 1, 3), date(2031, 1, 3), DiaEspecial.Tipo.HORARIO,
+                    hora_apertura=time(9, 0), hora_cierre=time(18, 0), cierre_comida=False,
+                ),
+            ],
+        )
+        self.assertEqual(calendario.mascara(date(2031, 1, 1)), 0)
+        self.assertEqual(calendario.motivo_cierre(date(2031, 1, 1)), "La peluquería está cerrada ese día (Obras).")
+        self.assertEqual(
+            horas_de_mascara(calendario.mascara(date(2031, 1, 2))),
+            [time(10, 0), time(10, 30), time(11, 0), time(11, 30)],
+        )
+        # El horario que empieza más tarde manda, y sin cierre para comer
+        self.assertIn(time(14, 0), horas_de_mascara(calendario.mascara(date(2031, 1, 3))))
+        # 5 de enero de 2031: domingo, sigue cerrado
+        self.assertEqual(calendario.mascara(date(2031, 1, 5)), 0)
+        self.assertEqual(calendario.motivo_cierre(date(2031, 1, 5)), "La peluquería cierra los domingos.")
+        self.assertNotIn(time(14, 0), horas_de_mascara(calendario.mascara(date(2031, 1, 8))))
+
+    def test_un_festivo_nuevo_cierra_la_agenda(self):
+        fecha = proximo_laborable()
+        self.assertTrue(get_horas_disponibles(peluquero=self.peluquero, fecha=fecha, servicio=self.servicio))
+        DiaEspecial.objects.create(fecha_inicio=fecha, fecha_fin=fecha, tipo=DiaEspecial.Tipo.FESTIVO)
+        self.assertEqual(get_horas_disponibles(peluquero=self.peluquero, fecha=fecha, servicio=self.servicio), [])
+        self.assertEqual(
+            calendario_salon(fecha.year).motivo_cierre(fecha), "La peluquería está cerrada ese día (Festivo)."
+        )
+
+
+class DuracionCitaTests(SalonTestCase):
+    def test_guarda_duracion_y_hora_fin(self):
+        tinte = Servicio.objects.create(nombre="Tinte", duracion_minutos=90, precio=Decimal("40.00"))
+        self.peluquero.servicios.add(tinte)
+        cita = self.cita(hora=time(10, 0), servicio=tinte)
+        self.assertEqual((cita.duracion_minutos, cita.hora_fin), (90, time(11, 30)))
+
+        # Cambiar la duración del servicio no mueve las citas ya dadas
+        tinte.duracion_minutos = 120
+        tinte.save()
+        cita = Cita.objects.get(pk=cita.pk)
+        cita.motivo = "Con mechas"
+        cita.save()
+        self.assertEqual((cita.duracion_minutos, cita.hora_fin), (90, time(11, 30)))
+
+        # Cambiar la cita de servicio sí
+        cita.servicio = self.servicio
+        cita.save()
+        self.assertEqual((cita.duracion_minutos, cita.hora_fin), (30, time(10, 30)))
+
+    def test_solapadas(self):
+        fecha = proximo_laborable()
+        cita = self.cita(fecha=fecha, hora=time(10, 0), servicio=None)
+        Cita.objects.filter(pk=cita.pk).update(hora_fin=time(11, 0))
+
+        def solapadas(inicio, fin):
+            return list(
+                Cita.objects.solapadas(peluquero=self.peluquero, fecha=fecha, inicio=inicio, fin=fin)
+                .values_list("pk", flat=True)
+            )
+
+        self.assertEqual(solapadas(time(10, 30), time(11, 0)), [cita.pk])
+        self.assertEqual(solapadas(time(9, 0), time(10, 30)), [cita.pk])
+        self.assertEqual(solapadas(time(11, 0), time(11, 30)), [])
+        self.assertEqual(solapadas(time(9, 30), time(10, 0)), [])
+        Cita.objects.filter(pk=cita.pk).update(estado=Cita.Estado.CANCELADA)
+        self.assertEqual(solapadas(time(10, 30), time(11, 0)), [])
+
+    def test_clean_rechaza_el_solape(self):
+        fecha = proximo_laborable()
+        tinte = Servicio.objects.create(nombre="Tinte", duracion_minutos=60, precio=Decimal("40.00"))
+        self.peluquero.servicios.add(tinte)
+        self.cita(fecha=fecha, hora=time(10, 0), servicio=tinte)
+        nueva = Cita(
+            cliente=self.cliente, peluquero=self.peluquero, servicio=self.servicio, fecha=fecha, hora=time(10, 30)
+        )
+        with self.assertRaisesMessage(ValidationError, "se solapa con otra cita"):
+            nueva.clean()
+        nueva.hora = time(11, 0)
+        nueva.clean()
+
+
+class InformeOcupacionTests(SalonTestCase):
+    def test_horas_de_trabajo_reservadas_y_fuera_de_turno(self):
+        hoy = timezone.localdate()
+        lunes = hoy + timedelta(days=7 - hoy.weekday())
+        tinte = Servicio.objects.create(nombre="Tinte", duracion_minutos=60, precio=Decimal("40.00"))
+        self.peluquero.servicios.add(tinte)
+        self.cita(fecha=lunes, hora=time(10, 0), servicio=tinte)
+        self.cita(fecha=lunes + timedelta(days=1), hora=time(8, 0))
+        self.cita(fecha=lunes + timedelta(days=2), hora=time(10, 0), estado=Cita.Estado.CANCELADA)
+        sabado = lunes + timedelta(days=5)
+        TurnoPeluquero.objects.create(
+            peluquero=self.peluquero, fecha_inicio=sabado, fecha_fin=sabado, turno=TurnoPeluquero.Turno.AUSENCIA
+        )
+
+        informe = calcular_ocupacion(lunes, lunes + timedelta(days=6))
+        # 9:00-13:30 y 15:00-20:00 de lunes a viernes; el sábado no viene y el domingo se cierra
+        self.assertEqual(
+            informe["peluqueros"][0],
+            {
+                "nombre": "Ana Prueba",
+                "horas_trabajo": 47.5,
+                "horas_reservadas": 1.0,
+                "horas_libres": 46.5,
+                "horas_fuera_turno": 0.5,
+                "ocupacion": 100 / 47.5,
+            },
+        )
+        self.assertEqual(informe["dias_semana"][0]["horas_reservadas"], 1.0)
+        self.assertEqual([d["horas_trabajo"] for d in informe["dias_semana"][5:]], [0.0, 0.0])
+        self.assertEqual(informe["dias_semana"][0]["mapa"][4]["valor"], 100)
+
+    def test_vista_del_admin(self):
+        self.client.force_login(User.objects.create_superuser("admin", password="x"))
+        respuesta = self.client.get(reverse("admin:principal_peluqueros_informe_ocupacion"))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, "Ana Prueba")
+
+
+class ResumenDiarioTests(SalonTestCase):
+    def resumen(self):
+        return ResumenDiario.objects.filter(peluquero=self.peluquero).values_list("realizadas", "ingresos").first()
+
+    def test_realizar_suma_y_deshacer_resta(self):
+        cita = self.cita(fecha=timezone.localdate() - timedelta(days=1))
+        cita.estado = Cita.Estado.REALIZADA
+        cita.save()
+        self.assertEqual(self.resumen(), (1, Decimal("10.00")))
+        cita.estado = Cita.Estado.PENDIENTE
+        cita.save()
+        self.assertEqual(self.resumen(), (0, Decimal("0.00")))
+
+    def test_cambio_de_tarifa_no_mueve_ingresos(self):
+        cita = self.cita(fecha=timezone.localdate() - timedelta(days=1), estado=Cita.Estado.REALIZADA)
+        self.servicio.precio = Decimal("25.00")
+        self.servicio.save()
+        Cita.objects.get(pk=cita.pk).delete()
+        self.assertEqual(self.resumen(), (0, Decimal("0.00")))
+
+    def test_cita_nueva_toma_la_tarifa_vigente(self):
+        self.servicio.precio = Decimal("25.00")
+        self.servicio.save()
+        cita = self.cita(estado=Cita.Estado.REALIZADA)
+        self.assertEqual(cita.precio, Decimal("25.00"))
+        self.assertEqual(self.resumen(), (1, Decimal("25.00")))
+
+    def test_cambiar_de_servicio_toma_su_precio(self):
+        tinte = Servicio.objects.create(nombre="Tinte", duracion_minutos=30, precio=Decimal("40.00"))
+        cita = self.cita(estado=Cita.Estado.REALIZADA)
+        cita.servicio = tinte
+        cita.save()
+        self.assertEqual(
+            sorted(ResumenDiario.objects.values_list("servicio_id", "realizadas", "ingresos")),
+            sorted([(self.servicio.pk, 0, Decimal("0.00")), (tinte.pk, 1, Decimal("40.00"))]),
+        )
+
+    def test_recalcular_usa_el_precio_de_la_cita(self):
+        fecha = timezone.localdate() - timedelta(days=1)
+        self.cita(fecha=fecha, estado=Cita.Estado.REALIZADA)
+        self.servicio.precio = Decimal("25.00")
+        self.servicio.save()
+        recalcular(fecha, fecha)
+        self.assertEqual(self.resumen(), (1, Decimal("10.00")))
+
+    def test_una_sola_fila_sin_servicio(self):
+        fecha = timezone.localdate() - timedelta(days=1)
+        self.cita(fecha=fecha, servicio=None, estado=Cita.Estado.REALIZADA)
+        self.cita(fecha=fecha, hora=time(11, 0), servicio=None, estado=Cita.Estado.CANCELADA)
+        self.assertEqual(
+            list(ResumenDiario.objects.values_list("servicio_id", "realizadas", "canceladas")), [(None, 1, 1)]
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ResumenDiario.objects.create(fecha=fecha, peluquero=self.peluquero, servicio=None)
+
+    def test_borrar_servicio_suma_en_la_fila_sin_servicio(self):
+        fecha = timezone.localdate() - timedelta(days=1)
+        self.cita(fecha=fecha, servicio=None, estado=Cita.Estado.REALIZADA)
+        self.cita(fecha=fecha, hora=time(11, 0), estado=Cita.Estado.REALIZADA)
+        self.servicio.delete()
+        self.assertEqual(
+            list(ResumenDiario.objects.values_list("servicio_id", "realizadas", "minutos")), [(None, 2, 60)]
+        )
+
+
+class ReservaInicialTests(SalonTestCase):
+    def test_proximos_dias_de_cada_servicio_y_peluquero(self):
+        carla = Peluqueros.objects.create(nombre="Carla", apellido="Prueba")
+        carla.servicios.add(self.servicio)
+        miercoles = proximo_laborable()
+        while miercoles.weekday() != 2:
+            miercoles += timedelta(days=1)
+        HorarioPeluquero.objects.create(
+            peluquero=carla, dia_semana=2, hora_inicio=time(9, 0), hora_fin=time(13, 30)
+        )
+
+        dias = proximos_dias()[str(self.servicio.pk)]
+        self.assertEqual(set(dias), {"", str(self.peluquero.pk), str(carla.pk)})
+        self.assertEqual(len(dias[str(self.peluquero.pk)]), N_DIAS)
+        self.assertEqual(dias[""], dias[str(self.peluquero.pk)])
+        self.assertEqual(dias[str(carla.pk)][0], miercoles.isoformat())
+        self.assertTrue(all(date.fromisoformat(d).weekday() == 2 for d in dias[str(carla.pk)]))
+
+    def test_un_servicio_nuevo_invalida_los_datos(self):
+        datos_reserva()
+        tinte = Servicio.objects.create(nombre="Tinte", duracion_minutos=60, precio=Decimal("40.00"))
+        self.peluquero.servicios.add(tinte)
+        datos = datos_reserva()
+        self.assertIn(tinte.pk, [s["id"] for s in datos["servicios"]])
+        self.assertEqual(len(datos["proximos_dias"][str(tinte.pk)][str(self.peluquero.pk)]), N_DIAS)
+
+    def test_api_devuelve_todo_en_una_peticion(self):
+        self.entrar()
+        respuesta = self.client.get(reverse("api_reserva_inicial"))
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(datos["peluqueros_por_servicio"], {str(self.servicio.pk): [self.peluquero.pk]})
+        self.assertEqual(datos["proximos_dias"], proximos_dias())
+
+    def test_formulario_sale_del_catalogo(self):
+        catalogo_reserva()
+        with self.assertNumQueries(0):
+            form = CitaForm(data={"servicio": self.servicio.pk, "peluquero": self.peluquero.pk, "fecha": ""})
+        self.assertEqual(list(form.fields["peluquero"].queryset), [self.peluquero])
+
+        fecha = proximo_laborable()
+        form = CitaForm(
+            data={"servicio": self.servicio.pk, "peluquero": self.peluquero.pk, "fecha": fecha.isoformat()}
+        )
+        horas = get_horas_disponibles(peluquero=self.peluquero, fecha=fecha, servicio=self.servicio)
+        self.assertEqual([h for h, _ in form.fields["hora"].choices[1:]], [h.strftime("%H:%M") for h in horas])
+
+    def test_peluquero_que_no_hace_el_servicio_no_tiene_horas(self):
+        otro = Peluqueros.objects.create(nombre="Dora", apellido="Prueba")
+        form = CitaForm(
+            data={"servicio": self.servicio.pk, "peluquero": otro.pk, "fecha": proximo_laborable().isoformat()}
+        )
+        self.assertEqual(form.fields["hora"].choices, [("", "Selecciona una hora")])
+        self.assertFalse(form.is_valid())
+        self.assertIn("peluquero", form.errors)
+
+    def test_servicio_desactivado_sigue_editandose(self):
+        cita = self.cita()
+        self.servicio.activo = False
+        self.servicio.save()
+        form = CitaForm(instance=cita)
+        self.assertEqual(list(form.fields["peluquero"].queryset), [self.peluquero])
+        self.assertIn(cita.hora.strftime("%H:%M"), [h for h, _ in form.fields["hora"].choices])
+
+
+class HorasLoteTests(SalonTestCase):
+    def pedir(self, consultas, **cabeceras):
+        return self.client.post(
+            reverse("api_horas_disponibles_lote"),
+            json.dumps({"consultas": consultas}),
+            content_type="application/json",
+            **cabeceras,
+        )
+
+    def test_un_resultado_por_consulta_en_orden(self):
+        self.entrar()
+        fecha = proximo_laborable()
+        self.cita(fecha=fecha, hora=time(9, 0))
+        consulta = {"peluquero_id": self.peluquero.pk, "fecha": fecha.isoformat(), "servicio_id": self.servicio.pk}
+        respuesta = self.pedir([consulta, {"peluquero_id": "x"}, {**consulta, "servicio_id": 999}])
+        self.assertEqual(respuesta.status_code, 200)
+        bien, mal, falta = respuesta.json()["resultados"]
+        horas = get_horas_disponibles(peluquero=self.peluquero, fecha=fecha, servicio=self.servicio)
+        self.assertEqual(bien["horas"], [h.strftime("%H:%M") for h in horas])
+        self.assertNotIn("09:00", bien["horas"])
+        self.assertEqual(mal, {"error": "consulta inválida"})
+        self.assertEqual(falta["error"], "servicio/peluquero no encontrado")
+
+    def test_las_consultas_a_la_bd_no_dependen_del_tamano(self):
+        self.entrar()
+        consultas = []
+        for n in (2, 20):
+            fechas = [proximo_laborable() + timedelta(days=d) for d in range(n)]
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                self.pedir(
+                    [
+                        {"peluquero_id": self.peluquero.pk, "fecha": f.isoformat(), "servicio_id": self.servicio.pk}
+                        for f in fechas
+                    ]
+                )
+            consultas.append(len(ctx))
+        self.assertEqual(consultas[0], consultas[1])
+
+    def test_cuerpo_invalido_o_demasiadas_consultas(self):
+        self.entrar()
+        url = reverse("api_horas_disponibles_lote")
+        self.assertEqual(self.client.post(url, "no es json", content_type="application/json").status_code, 400)
+        self.assertEqual(self.pedir({"a": 1}).status_code, 400)
+        self.assertEqual(self.pedir([{}] * (MAX_CONSULTAS_LOTE + 1)).status_code, 400)
+
+
+class FormatoMascaraTests(SalonTestCase):
+    def test_mascara_equivale_a_las_horas(self):
+        self.entrar()
+        fecha = proximo_laborable()
+        self.cita(fecha=fecha, hora=time(10, 0))
+        url = reverse("api_horas_disponibles")
+        params = {"servicio_id": self.servicio.pk, "peluquero_id": self.peluquero.pk, "fecha": fecha.isoformat()}
+
+        horas = self.client.get(url, params)
+        compacta = self.client.get(url, {**params, "format": "mascara"})
+        por_cabecera = self.client.get(url, params, HTTP_ACCEPT=TIPO_MASCARA)
+
+        datos = compacta.json()
+        self.assertEqual((datos["formato"], datos["apertura"], datos["paso"]), ("mascara", "08:00", 30))
+        self.assertEqual(por_cabecera.json(), datos)
+        decodificadas = [
+            _hora(_min(APERTURA) + i * datos["paso"]).strftime("%H:%M")
+            for i in range(datos["mascara"].bit_length())
+            if datos["mascara"] >> i & 1
+        ]
+        self.assertEqual(decodificadas, horas.json()["horas"])
+        self.assertNotIn("10:00", decodificadas)
+        self.assertIn("Accept", horas["Vary"])
+
+    def test_lote_compacto(self):
+        self.entrar()
+        fecha = proximo_laborable()
+        respuesta = self.client.post(
+            reverse("api_horas_disponibles_lote") + "?format=mascara",
+            json.dumps(
+                {
+                    "consultas": [
+                        {"peluquero_id": self.peluquero.pk, "fecha": fecha.isoformat(), "servicio_id": self.servicio.pk}
+                    ]
+                }
+            ),
+            content_type="application/json",
+        )
+        datos = respuesta.json()
+        self.assertEqual(datos["formato"], "mascara")
+        self.assertEqual(
+            horas_de_mascara(datos["resultados"][0]["mascara"]),
+            get_horas_disponibles(peluquero=self.peluquero, fecha=fecha, servicio=self.servicio),
+        )
+
+
+class ApiPublicaTests(SalonTestCase):
+    def test_horas_sin_sesion_y_cacheables(self):
+        fecha = proximo_laborable()
+        url = reverse("api_publica_horas")
+        params = {"servicio_id": self.servicio.pk, "peluquero_id": self.peluquero.pk, "fecha": fecha.isoformat()}
+        respuesta = self.client.get(url, params)
+        self.assertEqual(respuesta.status_code, 200)
+        horas = get_horas_disponibles(peluquero=self.peluquero, fecha=fecha, servicio=self.servicio)
+        self.assertEqual(respuesta.json()["horas"], [h.strftime("%H:%M") for h in horas])
+        self.assertIn("public", respuesta["Cache-Control"])
+        self.assertEqual(
+            respuesta["Surrogate-Key"].split(),
+            [
+                f"peluquero-{self.peluquero.pk}",
+                f"dia-{fecha.isoformat()}",
+                f"peluquero-{self.peluquero.pk}-{fecha.isoformat()}",
+            ],
+        )
+        self.assertNotIn("Cookie", respuesta.get("Vary", ""))
+
+        fuera = {**params, "fecha": (timezone.localdate() + timedelta(days=HORIZONTE_DIAS)).isoformat()}
+        self.assertEqual(self.client.get(url, fuera).status_code, 400)
+        self.assertEqual(self.client.get(url, {**params, "peluquero_id": 999}).status_code, 404)
+
+    def test_densidad_del_mes(self):
+        hoy = timezone.localdate()
+        url = reverse("api_publica_densidad")
+        respuesta = self.client.get(url, {"servicio_id": self.servicio.pk, "mes": f"{hoy:%Y-%m}"})
+        self.assertEqual(respuesta.status_code, 200)
+        dias = respuesta.json()["dias"]
+        self.assertEqual(min(dias), hoy.isoformat())
+        self.assertIn(f"peluquero-{self.peluquero.pk}-{hoy:%Y-%m}", respuesta["Surrogate-Key"].split())
+        fecha = proximo_laborable()
+        if fecha.month == hoy.month:
+            horas = get_horas_disponibles(peluquero=self.peluquero, fecha=fecha, servicio=self.servicio)
+            self.assertEqual(dias[fecha.isoformat()], len(horas))
+
+    def test_densidad_rechaza_meses_fuera_de_plazo(self):
+        hoy = timezone.localdate()
+        url = reverse("api_publica_densidad")
+        pasado = hoy.replace(day=1) - timedelta(days=1)
+        futuro = hoy + timedelta(days=HORIZONTE_DIAS + 31)
+        for mes in ("9999-12", "0001-01", f"{pasado:%Y-%m}", f"{futuro:%Y-%m}", "2026-13", "mayo"):
+            with self.subTest(mes=mes):
+                respuesta = self.client.get(url, {"servicio_id": self.servicio.pk, "mes": mes})
+                self.assertEqual(respuesta.status_code, 400)
+
+
+class RetencionesTests(SalonTestCase):
+    def test_retener_y_liberar(self):
+        fecha = proximo_laborable()
+        self.assertTrue(retener("a", self.peluquero.pk, fecha, time(10, 0), 60))
+        self.assertFalse(retener("b", self.peluquero.pk, fecha, time(10, 30), 30))
+        self.assertTrue(retener("b", self.peluquero.pk, fecha, time(11, 0), 30))
+        self.assertTrue(retener("a", self.peluquero.pk, fecha, time(10, 0), 60))
+        self.assertTrue(retenida_por_otro("b", self.peluquero.pk, fecha, time(9, 30), 60))
+        self.assertFalse(retenida_por_otro("a", self.peluquero.pk, fecha, time(9, 30), 60))
+
+        # Retener otra hora suelta la anterior
+        self.assertTrue(retener("a", self.peluquero.pk, fecha, time(16, 0), 30))
+        self.assertFalse(retenida_por_otro("b", self.peluquero.pk, fecha, time(10, 0), 60))
+        liberar("a")
+        self.assertEqual(mascara_retenida(self.peluquero.pk, fecha, excepto="b"), 0)
+
+    def test_api_y_reserva_de_otro_cliente(self):
+        fecha = proximo_laborable()
+        cuerpo = {
+            "peluquero_id": self.peluquero.pk,
+            "servicio_id": self.servicio.pk,
+            "fecha": fecha.isoformat(),
+            "hora": "10:00",
+        }
+        url = reverse("api_retener_hora")
+        self.entrar()
+        respuesta = self.client.post(url, json.dumps(cuerpo), content_type="application/json")
+        self.assertEqual(respuesta.json(), {"retenida": True, "segundos": DURACION_RETENCION})
+
+        self.client.force_login(User.objects.create_user("carmen", email="carmen@example.com", password="x"))
+        self.assertEqual(self.client.post(url, json.dumps(cuerpo), content_type="application/json").status_code, 409)
+        horas = self.client.get(
+            reverse("api_horas_disponibles"),
+            {"servicio_id": self.servicio.pk, "peluquero_id": self.peluquero.pk, "fecha": fecha.isoformat()},
+        ).json()["horas"]
+        self.assertNotIn("10:00", horas)
+        self.assertIn("10:30", horas)
+
+        respuesta = self.client.post(
+            reverse("cita_nueva"),
+            {"servicio": self.servicio.pk, "peluquero": self.peluquero.pk, "fecha": fecha.isoformat(), "hora": "10:00"},
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, "Otro cliente está reservando esa hora")
+        self.assertFalse(Cita.objects.exists())
+
+        # Al liberarla, la hora vuelve a estar libre para los demás
+        self.client.force_login(self.cliente.user)
+        self.client.post(reverse("api_liberar_hora"))
+        self.assertFalse(retenida_por_otro("otro", self.peluquero.pk, fecha, time(10, 0), 30))
+
+    def test_formulario_sin_js_respeta_la_retencion_propia(self):
+        fecha = proximo_laborable()
+        self.entrar()
+        retener(titular_de(self.cliente.user), self.peluquero.pk, fecha, time(10, 0), 30)
+        retener("otro", self.peluquero.pk, fecha, time(10, 30), 30)
+        datos = {"servicio": self.servicio.pk, "peluquero": self.peluquero.pk, "fecha": fecha.isoformat()}
+
+        horas = self.client.post(reverse("cita_nueva"), datos).context["form"].fields["hora"].choices
+        self.assertIn(("10:00", "10:00"), horas)
+        self.assertNotIn(("10:30", "10:30"), horas)
+
+        respuesta = self.client.post(reverse("cita_nueva"), {**datos, "hora": "10:00"})
+        self.assertRedirects(respuesta, reverse("mis_citas"))
+        self.assertTrue(Cita.objects.filter(fecha=fecha, hora=time(10, 0)).exists())
+
+
+class ClientePorUsuarioTests(SalonTestCase):
+    def peticion(self, user):
+        request = RequestFactory().get("/")
+        request.user = user
+        return request
+
+    def test_se_resuelve_al_entrar_y_una_vez_por_peticion(self):
+        self.entrar()
+        request = self.peticion(self.cliente.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(cliente_id_de(request), self.cliente.pk)
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(cliente_id_de(request), self.cliente.pk)
+
+    def test_usuario_sin_cliente(self):
+        user = User.objects.create_user("carmen", email="carmen@example.com", password="x")
+        self.client.force_login(user)
+        cliente = Cliente.objects.get(user=user)
+        self.assertEqual((cliente.nombre, cliente.email), ("carmen", "carmen@example.com"))
+        self.assertEqual(cliente_id_de(self.peticion(user)), cliente.pk)
+
+    def test_cambiar_o_borrar_el_cliente_olvida_la_cache(self):
+        self.entrar()
+        user = self.cliente.user
+        otro = Cliente.objects.create(nombre="Carmen", apellido="Prueba")
+        self.cliente.user = None
+        self.cliente.save()
+        otro.user = user
+        otro.save()
+        self.assertEqual(cliente_id_de(self.peticion(user)), otro.pk)
+
+        otro.delete()
+        nuevo = cliente_id_de(self.peticion(user))
+        self.assertNotIn(nuevo, (otro.pk, self.cliente.pk))
+        self.assertEqual(Cliente.objects.get(pk=nuevo).user, user)
+
+    def test_mis_citas_solo_muestra_las_propias(self):
+        self.cita(hora=time(10, 0))
+        otra = Cliente.objects.create(nombre="Carmen", apellido="Prueba")
+        self.cita(hora=time(11, 0), cliente=otra)
+        self.entrar()
+        respuesta = self.client.get(reverse("mis_citas"))
+        self.assertEqual([c.cliente_id for c in respuesta.context["citas"]], [self.cliente.pk])
+
+
+@override_settings(LIMITES_PETICIONES={"prueba": (4, 60), "api": (2, 60), "login": (1, 300)})
+class LimitePeticionesTests(SalonTestCase):
+    @contextmanager
+    def en(self, segundo):
+        """Fija el reloj del limitador en `segundo` desde el inicio de una ventana."""
+        with mock.patch.object(limites.time, "time", return_value=self.inicio + segundo):
+            yield
+
+    def setUp(self):
+        super().setUp()
+        self.inicio = (int(reloj.time()) // 60 + 1) * 60
+
+    def test_ventana_deslizante(self):
+        with self.en(50):
+            self.assertEqual([limites.consumir("prueba", "x") for _ in range(4)], [0, 0, 0, 0])
+            self.assertEqual(limites.consumir("prueba", "x"), 11)
+            self.assertEqual(limites.consumir("prueba", "y"), 0)
+        # Con ventana fija se volverían a permitir 4 seguidas al cambiar de ventana
+        with self.en(60):
+            self.assertEqual(limites.consumir("prueba", "x"), 1)
+        with self.en(61):
+            self.assertEqual(limites.consumir("prueba", "x"), 0)
+            self.assertGreater(limites.consumir("prueba", "x"), 0)
+        # A mitad de ventana la anterior cuenta la mitad: 4 * 0.5 + 1 ya hecha
+        with self.en(90):
+            self.assertEqual(limites.consumir("prueba", "x"), 0)
+            self.assertEqual(limites.consumir("prueba", "x"), 1)
+        with self.en(200):
+            self.assertEqual([limites.consumir("prueba", "x") for _ in range(4)], [0, 0, 0, 0])
+
+    def test_las_rechazadas_no_cuentan(self):
+        with self.en(0):
+            for _ in range(4):
+                limites.consumir("prueba", "x")
+            for _ in range(10):
+                self.assertGreater(limites.consumir("prueba", "x"), 0)
+        # Si contaran, la ventana anterior pesaría 7 en vez de 2
+        with self.en(90):
+            self.assertEqual([limites.consumir("prueba", "x") for _ in range(3)], [0, 0, 1])
+
+    def test_un_viaje_a_la_cache_por_comprobacion(self):
+        with self.en(70):
+            limites.consumir("prueba", "x")
+        with self.en(75), mock.patch.object(limites, "cache", wraps=cache) as espia:
+            self.assertEqual(limites.consumir("prueba", "x"), 0)
+            self.assertEqual([llamada[0] for llamada in espia.method_calls], ["incr"])
+        # La primera de la ventana lee la anterior y crea la clave
+        with self.en(125), mock.patch.object(limites, "cache", wraps=cache) as espia:
+            self.assertEqual(limites.consumir("prueba", "x"), 0)
+            self.assertEqual([llamada[0] for llamada in espia.method_calls], ["incr", "get", "add"])
+
+    def test_429_con_retry_after(self):
+        self.entrar()
+        url = reverse("api_reserva_inicial")
+        with self.en(30):
+            self.assertEqual([self.client.get(url).status_code for _ in range(2)], [200, 200])
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta["Retry-After"], "31")
+        self.assertIn("31 segundos", respuesta.json()["error"])
+
+    def test_login_solo_limita_el_post(self):
+        url = reverse("login")
+        with self.en(0):
+            self.assertEqual(self.client.post(url, {"username": "x", "password": "y"}).status_code, 200)
+            respuesta = self.client.post(url, {"username": "x", "password": "y"})
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertTrue(respuesta["Content-Type"].startswith("text/plain"))
+
+
+class ImportarUsuariosTests(SalonTestCase):
+    CONTRASENA = "Tijeras-de-2026"
+
+    def importar(self, nombre, contenido):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ruta = os.path.join(directorio, nombre)
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(contenido)
+        salida, errores = StringIO(), StringIO()
+        call_command("importar_usuarios", ruta, procesos=1, lote=2, stdout=salida, stderr=errores)
+        return salida.getvalue(), errores.getvalue()
+
+    def test_csv_con_filas_invalidas_y_repetidas(self):
+        User.objects.create_user("existe", password="x")
+        salida, errores = self.importar(
+            "usuarios.csv",
+            "username,password,email,first_name,last_name,telefono\n"
+            f"carmen,{self.CONTRASENA},carmen@example.com,Carmen,Ruiz,600 111 222\n"
+            f"dora,{self.CONTRASENA},no-es-un-email,Dora,Gil,\n"
+            f"elena,{self.CONTRASENA},,,,\n"
+            f"elena,{self.CONTRASENA},,,,\n"
+            f"existe,{self.CONTRASENA},,,,\n"
+            f"fina,123,,,,\n"
+            f",{self.CONTRASENA},,,,\n",
+        )
+        self.assertIn("2 usuarios creados, 5 filas con error", salida)
+        self.assertIn("Línea 3 (dora): email:", errores)
+        self.assertIn("Línea 5 (elena): username repetido en el fichero", errores)
+        self.assertIn("Línea 6 (existe): el usuario ya existe", errores)
+        self.assertIn("Línea 7 (fina):", errores)
+        self.assertIn("Línea 8 (-): falta username", errores)
+
+        carmen = Cliente.objects.get(user__username="carmen")
+        self.assertEqual((carmen.nombre, carmen.apellido, carmen.telefono), ("Carmen", "Ruiz", "600 111 222"))
+        self.assertTrue(carmen.user.check_password(self.CONTRASENA))
+        self.assertEqual(Cliente.objects.get(user__username="elena").nombre, "elena")
+        self.assertEqual(busqueda().buscar("carmen", 10), [carmen.pk])
+
+    def test_jsonl_con_valores_que_no_son_texto(self):
+        filas = [
+            {"username": "carmen", "password": self.CONTRASENA, "telefono": 612345678},
+            {"username": "dora", "password": self.CONTRASENA, "email": ["dora@example.com"]},
+            {"username": "elena", "password": self.CONTRASENA, "first_name": True},
+            {"username": 12345, "password": self.CONTRASENA},
+        ]
+        contenido = "".join(json.dumps(fila) + "\n" for fila in filas) + "{roto\n\n[1, 2]\n"
+        salida, errores = self.importar("usuarios.jsonl", contenido)
+
+        self.assertIn("2 usuarios creados, 4 filas con error", salida)
+        self.assertEqual(Cliente.objects.get(user__username="carmen").telefono, "612345678")
+        self.assertTrue(User.objects.filter(username="12345").exists())
+        self.assertIn("Línea 2 (dora): email: se esperaba texto", errores)
+        self.assertIn("Línea 3 (elena): first_name: se esperaba texto", errores)
+        self.assertIn("Línea 5 (-): JSON inválido", errores)
+        self.assertIn("Línea 7 (-): JSON inválido: se esperaba un objeto", errores)
+
+
+class RevisarCitasTests(SalonTestCase):
+    def revisar(self, *args):
+        salida, resumen = StringIO(), StringIO()
+        call_command("revisar_citas", *args, stdout=salida, stderr=resumen)
+        registros = [json.loads(linea) for linea in salida.getvalue().splitlines()]
+        return sorted((r["tipo"], r["cita"]) for r in registros), registros, resumen.getvalue()
+
+    def test_solapes_y_reglas(self):
+        hoy = timezone.localdate()
+        lunes = hoy + timedelta(days=7 - hoy.weekday())
+        tinte = Servicio.objects.create(nombre="Tinte", duracion_minutos=60, precio=Decimal("40.00"))
+        larga = self.cita(fecha=lunes, hora=time(10, 0), servicio=tinte)
+        pisa = self.cita(fecha=lunes, hora=time(10, 30))
+        self.cita(fecha=lunes, hora=time(11, 0), estado=Cita.Estado.CANCELADA)
+        self.cita(fecha=lunes, hora=time(16, 0))
+        comida = self.cita(fecha=lunes, hora=time(13, 0), servicio=tinte)
+        temprano = self.cita(fecha=lunes, hora=time(8, 0))
+        tarde = self.cita(fecha=lunes, hora=time(20, 30), servicio=tinte)
+        domingo = self.cita(fecha=lunes + timedelta(days=6))
+
+        incidencias, registros, resumen = self.revisar()
+        self.assertEqual(
+            incidencias,
+            sorted(
+                [
+                    ("solape", pisa.pk),
+                    ("comida", comida.pk),
+                    ("fuera_de_turno", comida.pk),
+                    ("fuera_de_turno", temprano.pk),
+                    ("fuera_de_horario", tarde.pk),
+                    ("fuera_de_turno", tarde.pk),
+                    ("domingo", domingo.pk),
+                ]
+            ),
+        )
+        solape = next(r for r in registros if r["tipo"] == "solape")
+        self.assertEqual((solape["con"], solape["hora"], solape["hora_fin"]), (larga.pk, "10:30", "11:00"))
+        self.assertIn("7 citas revisadas", resumen)
+
+        incidencias, _, _ = self.revisar("--desde", (lunes + timedelta(days=1)).isoformat())
+        self.assertEqual(incidencias, [("domingo", domingo.pk)])
+        incidencias, _, _ = self.revisar("--hasta", lunes.isoformat())
+        self.assertNotIn(("domingo", domingo.pk), incidencias)
+
+    def test_fecha_invalida(self):
+        with self.assertRaises(CommandError):
+            self.revisar("--desde", "ayer")
+
+
+class ArchivoTests(SalonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ayer = timezone.localdate() - timedelta(days=1)
+        self.realizada = self.cita(fecha=self.ayer, hora=time(10, 0), estado=Cita.Estado.REALIZADA)
+        self.cancelada = self.cita(fecha=self.ayer, hora=time(11, 0), estado=Cita.Estado.CANCELADA)
+        self.pendiente = self.cita(fecha=self.ayer, hora=time(12, 0))
+
+    def archivar(self):
+        call_command("archivar_citas", "--antes", timezone.localdate().isoformat(), "--lote", "1", stdout=StringIO())
+
+    def resumen(self):
+        return list(ResumenDiario.objects.values_list("fecha", "realizadas", "canceladas", "ingresos"))
+
+    def test_archivar_y_restaurar(self):
+        resumen = self.resumen()
+        creada = Cita.objects.get(pk=self.realizada.pk).creado_en
+        self.archivar()
+
+        self.assertEqual(list(Cita.objects.values_list("pk", flat=True)), [self.pendiente.pk])
+        historica = CitaHistorica.objects.get(pk=self.realizada.pk)
+        self.assertEqual(
+            (historica.hora_fin, historica.precio, historica.creado_en), (time(10, 30), Decimal("10.00"), creada)
+        )
+        self.assertEqual(self.resumen(), resumen)
+        self.assertEqual(
+            set(Cambio.objects.filter(accion=Cambio.Accion.ARCHIVADA).values_list("objeto_id", flat=True)),
+            {self.realizada.pk, self.cancelada.pk},
+        )
+        self.assertEqual(len(historial_de_cliente(self.cliente.pk)), 2)
+
+        restauradas, saltadas = archivo.restaurar([self.realizada.pk, self.cancelada.pk])
+        self.assertEqual((sorted(restauradas), saltadas), (sorted([self.realizada.pk, self.cancelada.pk]), []))
+        self.assertFalse(CitaHistorica.objects.exists())
+        cita = Cita.objects.get(pk=self.realizada.pk)
+        self.assertEqual(
+            (cita.estado, cita.hora_fin, cita.precio, cita.creado_en),
+            (Cita.Estado.REALIZADA, time(10, 30), Decimal("10.00"), creada),
+        )
+        self.assertEqual(self.resumen(), resumen)
+        recalcular(self.ayer, self.ayer)
+        self.assertEqual(self.resumen(), resumen)
+        self.assertTrue(Cambio.objects.filter(objeto_id=cita.pk, accion=Cambio.Accion.ALTA).exists())
+
+        # Vuelta a archivar: el proceso es repetible
+        self.archivar()
+        self.assertEqual(CitaHistorica.objects.count(), 2)
+
+    def test_no_restaura_encima_de_otra_cita(self):
+        self.archivar()
+        nueva = self.cita(fecha=self.ayer, hora=time(11, 0))
+        restauradas, saltadas = archivo.restaurar([self.realizada.pk, self.cancelada.pk])
+        self.assertEqual((restauradas, saltadas), ([self.realizada.pk], [self.cancelada.pk]))
+        self.assertEqual(Cita.objects.get(fecha=self.ayer, hora=time(11, 0)).pk, nueva.pk)
+        self.assertTrue(CitaHistorica.objects.filter(pk=self.cancelada.pk).exists())
+
+    def test_admin_historial_y_accion_de_restaurar(self):
+        self.archivar()
+        self.client.force_login(User.objects.create_superuser("admin", password="x"))
+        self.assertContains(self.client.get(reverse("admin:Principal_cita_changelist")), 'href="historial/"')
+        url = reverse("admin:principal_cita_historial")
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            [(f["id"], f["archivada"]) for f in respuesta.context["filas"]],
+            [(self.pendiente.pk, False), (self.cancelada.pk, True), (self.realizada.pk, True)],
+        )
+        filas = self.client.get(url, {"q": "berta", "estado": Cita.Estado.REALIZADA}).context["filas"]
+        self.assertEqual([f["id"] for f in filas], [self.realizada.pk])
+        self.assertEqual(self.client.get(url, {"q": "nadie"}).context["filas"], [])
+
+        self.client.post(
+            reverse("admin:Principal_citahistorica_changelist"),
+            {"action": "restaurar", helpers.ACTION_CHECKBOX_NAME: [self.realizada.pk]},
+        )
+        self.assertTrue(Cita.objects.filter(pk=self.realizada.pk).exists())
+        self.assertEqual(list(CitaHistorica.objects.values_list("pk", flat=True)), [self.cancelada.pk])
+
+
+class CerrarCitasPasadasTests(SalonTestCase):
+    def cerrar(self, *args):
+        call_command("cerrar_citas_pasadas", *args, "--lote", "2", stdout=StringIO())
+
+    def test_cierra_solo_las_pendientes_pasadas(self):
+        hoy = timezone.localdate()
+        pasadas = [self.cita(fecha=hoy - timedelta(days=d), hora=time(10, 0)) for d in (1, 2, 3)]
+        cancelada = self.cita(fecha=hoy - timedelta(days=1), hora=time(11, 0), estado=Cita.Estado.CANCELADA)
+        de_hoy = self.cita(fecha=hoy, hora=time(10, 0))
+        futura = self.cita()
+
+        self.cerrar()
+        estados = dict(Cita.objects.values_list("pk", "estado"))
+        self.assertEqual({estados[c.pk] for c in pasadas}, {Cita.Estado.REALIZADA})
+        self.assertEqual(
+            (estados[cancelada.pk], estados[de_hoy.pk], estados[futura.pk]),
+            (Cita.Estado.CANCELADA, Cita.Estado.PENDIENTE, Cita.Estado.PENDIENTE),
+        )
+        self.assertEqual(
+            ResumenDiario.objects.aggregate(realizadas=Sum("realizadas"), ingresos=Sum("ingresos")),
+            {"realizadas": 3, "ingresos": Decimal("30.00")},
+        )
+        self.assertEqual(
+            Cambio.objects.filter(accion=Cambio.Accion.MODIFICACION, objeto_id__in=[c.pk for c in pasadas]).count(), 3
+        )
+
+        # Repetir no cambia nada
+        self.cerrar()
+        self.assertEqual(ResumenDiario.objects.aggregate(Sum("realizadas"))["realizadas__sum"], 3)
+
+    def test_solo_cuenta_las_que_cierra(self):
+        hoy = timezone.localdate()
+        pasadas = [self.cita(fecha=hoy - timedelta(days=1), hora=time(h, 0)) for h in (10, 11)]
+        with cambio_concurrente(pasadas[0], estado=Cita.Estado.CANCELADA):
+            self.cerrar()
+        self.assertEqual(
+            list(Cambio.objects.filter(accion=Cambio.Accion.MODIFICACION).values_list("objeto_id", flat=True)),
+            [pasadas[1].pk],
+        )
+        self.assertEqual(list(ResumenDiario.objects.values_list("realizadas", "canceladas")), [(1, 0)])
+
+    def test_como_no_presentado_y_antes(self):
+        hoy = timezone.localdate()
+        antigua = self.cita(fecha=hoy - timedelta(days=5))
+        reciente = self.cita(fecha=hoy - timedelta(days=1))
+        self.cerrar("--como", "no-presentado", "--antes", (hoy - timedelta(days=2)).isoformat())
+        self.assertEqual(Cita.objects.get(pk=antigua.pk).estado, Cita.Estado.NO_PRESENTADO)
+        self.assertEqual(Cita.objects.get(pk=reciente.pk).estado, Cita.Estado.PENDIENTE)
+
+    def test_no_cierra_citas_futuras(self):
+        futura = self.cita()
+        for antes in ((futura.fecha + timedelta(days=1)).isoformat(), "mañana"):
+            with self.subTest(antes=antes), self.assertRaises(CommandError):
+                self.cerrar("--antes", antes)
+        self.assertEqual(Cita.objects.get(pk=futura.pk).estado, Cita.Estado.PENDIENTE)
+
+
+class ReubicacionTests(SalonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.otra = Peluqueros.objects.create(nombre="Bea", apellido="Prueba")
+        self.otra.servicios.add(self.servicio)
+        for horario in HorarioPeluquero.objects.filter(peluquero=self.peluquero):
+            HorarioPeluquero.objects.create(
+                peluquero=self.otra,
+                dia_semana=horario.dia_semana,
+                hora_inicio=horario.hora_inicio,
+                hora_fin=horario.hora_fin,
+            )
+        self.dia = proximo_laborable()
+        self.original = self.cita(fecha=self.dia)
+
+    def proponer(self):
+        citas = marcar_ausencia([self.peluquero], self.dia, self.dia)
+        return citas, proponer_reubicaciones(citas, excluidos={self.peluquero.pk})
+
+    def test_propone_y_confirma(self):
+        citas, propuestas = self.proponer()
+        self.assertEqual(propuestas, {self.original.pk: (self.otra.pk, self.dia, time(10, 0))})
+        self.assertEqual(Cita.objects.get(pk=self.original.pk).estado, Cita.Estado.CANCELADA)
+
+        (nueva,) = confirmar_reubicaciones([(citas[0], self.otra.pk, self.dia, time(10, 0))])
+        nueva = Cita.objects.get(pk=nueva.pk)
+        self.assertEqual(
+            (nueva.peluquero_id, nueva.estado, nueva.hora_fin, nueva.precio, nueva.motivo),
+            (
+                self.otra.pk,
+                Cita.Estado.PENDIENTE,
+                time(10, 30),
+                Decimal("10.00"),
+                f"Reubicada de la cita #{self.original.pk}",
+            ),
+        )
+
+        # Un segundo envío del mismo formulario no la duplica
+        with self.assertRaisesMessage(ValueError, "ya existe"):
+            confirmar_reubicaciones([(citas[0], self.otra.pk, self.dia, time(11, 0))])
+        self.assertEqual(Cita.objects.filter(peluquero=self.otra).count(), 1)
+
+    def test_ausencia_no_cancela_lo_que_otro_ha_cambiado(self):
+        with cambio_concurrente(self.original, estado=Cita.Estado.REALIZADA):
+            citas = marcar_ausencia([self.peluquero], self.dia, self.dia)
+        self.assertEqual(citas, [])
+        self.assertEqual(Cita.objects.get(pk=self.original.pk).estado, Cita.Estado.REALIZADA)
+        self.assertFalse(Cambio.objects.filter(accion=Cambio.Accion.CANCELACION).exists())
+        self.assertFalse(ResumenDiario.objects.filter(canceladas__gt=0).exists())
+
+    def test_no_propone_la_hora_de_una_cita_cancelada(self):
+        # unique_together cuenta también las canceladas: esa hora no se puede usar
+        Cita.objects.create(
+            cliente=self.cliente,
+            peluquero=self.otra,
+            servicio=self.servicio,
+            fecha=self.dia,
+            hora=time(10, 0),
+            estado=Cita.Estado.CANCELADA,
+        )
+        citas, propuestas = self.proponer()
+        pid, fecha, hora = propuestas[self.original.pk]
+        self.assertEqual((pid, fecha), (self.otra.pk, self.dia))
+        self.assertNotEqual(hora, time(10, 0))
+        with self.assertRaisesMessage(ValueError, "quizá cancelada"):
+            confirmar_reubicaciones([(citas[0], self.otra.pk, self.dia, time(10, 0))])
+
+        # Se mantiene el precio de la reserva aunque la tarifa haya cambiado
+        Servicio.objects.filter(pk=self.servicio.pk).update(precio=Decimal("12.50"))
+        citas[0].servicio.refresh_from_db()
+        (nueva,) = confirmar_reubicaciones([(citas[0], pid, fecha, hora)])
+        self.assertEqual(Cita.objects.get(pk=nueva.pk).precio, Decimal("10.00"))
+
+    def test_rechaza_huecos_ocupados_o_peluquero_sin_el_servicio(self):
+        citas, _ = self.proponer()
+        Cita.objects.create(
+            cliente=self.cliente, peluquero=self.otra, servicio=self.servicio, fecha=self.dia, hora=time(10, 0)
+        )
+        with self.assertRaisesMessage(ValueError, "ya no está libre"):
+            confirmar_reubicaciones([(citas[0], self.otra.pk, self.dia, time(10, 0))])
+
+        self.otra.servicios.clear()
+        with self.assertRaisesMessage(ValueError, "no ofrece"):
+            confirmar_reubicaciones([(citas[0], self.otra.pk, self.dia, time(11, 0))])
+        self.assertEqual(Cita.objects.filter(peluquero=self.otra).count(), 1)
+
+    def test_admin(self):
+        self.cita(fecha=self.dia, hora=time(11, 0), servicio=None)
+        self.client.force_login(User.objects.create_superuser("admin", password="x"))
+        respuesta = self.client.post(
+            reverse("admin:Principal_peluqueros_changelist"),
+            {
+                "action": "marcar_ausencia",
+                helpers.ACTION_CHECKBOX_NAME: [self.peluquero.pk],
+                "aplicar": "1",
+                "fecha_inicio": self.dia.isoformat(),
+                "fecha_fin": self.dia.isoformat(),
+            },
+        )
+        self.assertContains(respuesta, "Sin servicio: no se puede proponer hueco")
+        valor = f"{self.original.pk}|{self.otra.pk}|{self.dia.isoformat()}|10:00"
+        self.assertContains(respuesta, valor)
+
+        # Si otra reserva gana la carrera al alta, error y no un 500
+        url = reverse("admin:principal_peluqueros_reubicar_citas")
+        with mock.patch("Principal.admin.confirmar_reubicaciones", side_effect=IntegrityError):
+            respuesta = self.client.post(url, {"reubicar": [valor]}, follow=True)
+        self.assertContains(respuesta, "alguno de los huecos ya no está libre")
+        self.assertFalse(Cita.objects.filter(peluquero=self.otra).exists())
+
+        respuesta = self.client.post(url, {"reubicar": [valor]}, follow=True)
+        self.assertContains(respuesta, "Citas reubicadas: 1.")
+        self.assertTrue(Cita.objects.filter(peluquero=self.otra, fecha=self.dia, hora=time(10, 0)).exists())
+
+
+class AutocompletadoAdminTests(SalonTestCase):
+    def setUp(self):
+        super().setUp()
+        Cliente.objects.create(nombre="Carmen", apellido="Otra", email="carmen@example.com", telefono="699 000 111")
+        self.client.force_login(User.objects.create_superuser("admin", password="x"))
+
+    def buscar(self, modelo, campo, termino):
+        respuesta = self.client.get(
+            reverse("admin:autocomplete"),
+            {"app_label": "Principal", "model_name": modelo, "field_name": campo, "term": termino},
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        return [r["text"] for r in respuesta.json()["results"]]
+
+    def test_busqueda_por_prefijo(self):
+        self.assertEqual(self.buscar("cita", "cliente", "ber"), [str(self.cliente)])
+        self.assertEqual(self.buscar("cita", "cliente", "612"), [str(self.cliente)])
+        self.assertEqual(self.buscar("cita", "cliente", "erta"), [])
+        self.assertEqual(self.buscar("cita", "peluquero", "ana"), [str(self.peluquero)])
+        self.assertEqual(self.buscar("cita", "servicio", "cor"), [str(self.servicio)])
+
+    def test_los_formularios_no_incluyen_todas_las_filas(self):
+        for url in (
+            reverse("admin:Principal_cita_add"),
+            reverse("admin:principal_peluqueros_bulk_horarios"),
+        ):
+            with self.subTest(url=url):
+                respuesta = self.client.get(url)
+                self.assertContains(respuesta, "admin-autocomplete")
+                self.assertContains(respuesta, "admin/js/autocomplete.js")
+                self.assertNotContains(respuesta, "Carmen")
+                self.assertNotContains(respuesta, str(self.peluquero))
+
+        # El listado de clientes no cuenta la tabla entera
+        respuesta = self.client.get(reverse("admin:Principal_cliente_changelist"), {"q": "carmen"})
+        self.assertEqual([c.pk for c in respuesta.context["cl"].result_list], [Cliente.objects.get(nombre="Carmen").pk])
+        self.assertIsNone(respuesta.context["cl"].full_result_count)
+
+
+@skipUnless(connection.vendor == "sqlite", "índice FTS5 solo en SQLite")
+class BusquedaClientesTests(SalonTestCase):
+    def buscar(self, texto):
+        return busqueda().buscar(texto, 10)
+
+    def test_el_indice_sigue_a_los_clientes(self):
+        garcia = Cliente.objects.create(nombre="José", apellido="García", telefono="+34 600 111 222")
+        for texto in ("jose garc", "GARCÍA", "600111", "600 111 222", "34600111222", "0034 600 111 222"):
+            with self.subTest(texto=texto):
+                self.assertEqual(self.buscar(texto), [garcia.pk])
+        self.assertEqual(self.buscar("arcia"), [])
+
+        garcia.apellido = "Gómez"
+        garcia.save()
+        self.assertEqual(self.buscar("garcia"), [])
+        self.assertEqual(self.buscar("gomez"), [garcia.pk])
+        self.assertEqual(list(Cliente.objects.filter(busqueda().filtro("gom"))), [garcia])
+
+        garcia.delete()
+        self.assertEqual(self.buscar("gomez"), [])
+
+    def test_alta_masiva_y_reindexado(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ruta = os.path.join(directorio, "usuarios.csv")
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write("username,password,first_name,last_name\n")
+            for n in range(5):
+                f.write(f"usuario{n},Tijeras-de-2026,Íñigo{n},Muñoz\n")
+        call_command("importar_usuarios", ruta, procesos=1, lote=2, stdout=StringIO(), stderr=StringIO())
+        importados = set(Cliente.objects.filter(apellido="Muñoz").values_list("pk", flat=True))
+        self.assertEqual(len(importados), 5)
+        self.assertEqual(set(self.buscar("inigo munoz")), importados)
+
+        # Si el índice se pierde, reindexar_busqueda lo rehace
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM busqueda_cliente")
+        self.assertEqual(self.buscar("munoz"), [])
+        call_command("reindexar_busqueda", stdout=StringIO())
+        self.assertEqual(set(self.buscar("munoz")), importados)
+        self.assertEqual(self.buscar("berta"), [self.cliente.pk])
+
+    def test_citas_por_cliente_peluquero_o_servicio(self):
+        cita = self.cita()
+        for texto in ("berta", "ana", "corte", "berta cor"):
+            with self.subTest(texto=texto):
+                self.assertEqual(list(Cita.objects.filter(filtro_citas(texto))), [cita])
+        self.assertEqual(list(Cita.objects.filter(filtro_citas("berta tinte"))), [])
+
+
+class CambiosTests(SalonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.citas = [self.cita(hora=time(h, 0)) for h in (9, 10, 11, 12)]
+        self.citas[0].estado = Cita.Estado.CANCELADA
+        self.citas[0].save()
+        self.borrada = self.citas[1].pk
+        self.citas[1].delete()
+        self.client.force_login(User.objects.create_user("recepcion", password="x", is_staff=True))
+
+    def pagina(self, **parametros):
+        respuesta = self.client.get(reverse("api_cambios"), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_paginas_por_cursor(self):
+        leidos, cursor, paginas = [], 0, 0
+        while True:
+            pagina = self.pagina(after=cursor, limite=2, modelo="CITA")
+            leidos += pagina["cambios"]
+            cursor = pagina["siguiente"]
+            paginas += 1
+            if not pagina["hay_mas"]:
+                break
+        esperados = list(Cambio.objects.filter(modelo=Cambio.Modelo.CITA).order_by("id"))
+        self.assertEqual([c["cursor"] for c in leidos], [c.pk for c in esperados])
+        self.assertEqual(paginas, 3)
+        self.assertEqual(
+            [(c["id"], c["accion"]) for c in leidos[-2:]],
+            [(self.citas[0].pk, Cambio.Accion.CANCELACION), (self.borrada, Cambio.Accion.BORRADO)],
+        )
+        self.assertEqual(leidos[-3]["datos"]["hora"], "12:00:00")
+        self.assertIsNone(leidos[-1]["datos"])
+
+        # Sin cambios nuevos el cursor no se mueve
+        vacia = {"cambios": [], "siguiente": cursor, "hay_mas": False}
+        self.assertEqual(self.pagina(after=cursor, modelo="CITA"), vacia)
+        nueva = self.cita(hora=time(16, 0))
+        self.assertEqual([c["id"] for c in self.pagina(after=cursor, modelo="CITA")["cambios"]], [nueva.pk])
+
+    def test_filtros_y_errores(self):
+        self.assertEqual(len(self.pagina(modelo="cita")["cambios"]), 6)
+        self.assertEqual(self.pagina(modelo="TURNO")["cambios"], [])
+        self.assertEqual(len(self.pagina(modelo="turno,horario")["cambios"]), 12)
+        self.assertEqual(len(self.pagina()["cambios"]), 18)
+        for parametros in ({"after": "x"}, {"limite": "muchos"}, {"modelo": "CLIENTE"}):
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self.client.get(reverse("api_cambios"), parametros).status_code, 400)
+        self.client.force_login(User.objects.create_user("cliente", password="x"))
+        self.assertEqual(self.client.get(reverse("api_cambios")).status_code, 403)
+
+    def test_margen_de_visibilidad_fuera_de_sqlite(self):
+        ultimo = Cambio.objects.order_by("-id").first()
+        with mock.patch.object(connection, "vendor", "postgresql"):
+            self.assertEqual(cambios_desde(0, 100), [])
+            Cambio.objects.filter(pk=ultimo.pk).update(creado_en=timezone.now() - timedelta(minutes=1))
+            self.assertEqual(cambios_desde(0, 100), [ultimo])
+
+    def test_admin_solo_lectura(self):
+        self.client.force_login(User.objects.create_superuser("admin", password="x"))
+        cambio = Cambio.objects.first()
+        respuesta = self.client.get(reverse("admin:Principal_cambio_changelist"))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotContains(respuesta, 'value="delete_selected"')
+        self.assertEqual(self.client.get(reverse("admin:Principal_cambio_delete", args=[cambio.pk])).status_code, 403)
+        self.assertEqual(
+            self.client.post(reverse("admin:Principal_cambio_delete", args=[cambio.pk]), {"post": "yes"}).status_code,
+            403,
+        )
+        self.assertTrue(Cambio.objects.filter(pk=cambio.pk).exists())
+
+
+class TareasTests(TestCase):
+    def test_reserva_por_lotes_sin_duplicar(self):
+        self.assertEqual(tareas.encolar("prueba", [{"n": n} for n in range(5)], claves=list("abcde")), 5)
+        tareas.encolar("prueba", [{"n": 0}], claves=["a"])
+        tareas.encolar("otra", [{}])
+        self.assertEqual(Tarea.objects.filter(tipo="prueba").count(), 5)
+
+        primero = tareas.reservar("prueba", 3, "uno")
+        segundo = tareas.reservar("prueba", 3, "dos")
+        self.assertEqual(([t.datos["n"] for t in primero], [t.datos["n"] for t in segundo]), ([0, 1, 2], [3, 4]))
+        self.assertEqual({(t.estado, t.intentos) for t in primero + segundo}, {(Tarea.Estado.EN_CURSO, 1)})
+        self.assertNotEqual(primero[0].reservada_por, segundo[0].reservada_por)
+        self.assertEqual(tareas.reservar("prueba", 3, "tres"), [])
+
+    def test_reintentos_y_fallo_final(self):
+        tareas.encolar("prueba", [{"n": 0}, {"n": 1}])
+        Tarea.objects.update(max_intentos=2)
+
+        def manejador(lote):
+            return {t.pk: "sin conexión" for t in lote if t.datos["n"] == 1}
+
+        with mock.patch.dict(tareas.MANEJADORES, {"prueba": (manejador, 10)}):
+            self.assertEqual(tareas.procesar_lote("prueba"), (1, 1, 0))
+            tarea = Tarea.objects.get(datos__n=1)
+            self.assertEqual(
+                (tarea.estado, tarea.ultimo_error, tarea.reservada_por), (Tarea.Estado.PENDIENTE, "sin conexión", "")
+            )
+            self.assertAlmostEqual((tarea.disponible_en - timezone.now()).total_seconds(), tareas.ESPERA_BASE, delta=5)
+            # Hasta que pase la espera no se vuelve a intentar
+            self.assertIsNone(tareas.procesar_lote("prueba"))
+
+            Tarea.objects.filter(pk=tarea.pk).update(disponible_en=timezone.now())
+            self.assertEqual(tareas.procesar_lote("prueba"), (0, 0, 1))
+            tarea.refresh_from_db()
+            self.assertEqual((tarea.estado, tarea.intentos), (Tarea.Estado.FALLIDA, 2))
+        self.assertEqual(tareas.espera_reintento(3), 4 * tareas.ESPERA_BASE)
+        self.assertEqual(tareas.espera_reintento(50), tareas.ESPERA_MAXIMA)
+
+    def test_una_reserva_caducada_no_pisa_a_la_nueva(self):
+        tareas.encolar("prueba", [{"n": 0}, {"n": 1}])
+        lento = tareas.reservar("prueba", 10, "lento")
+        Tarea.objects.update(reservada_hasta=timezone.now() - timedelta(seconds=1))
+        rapido = tareas.reservar("prueba", 10, "rapido")
+        self.assertEqual([t.intentos for t in rapido], [2, 2])
+
+        # El trabajador lento termina tarde: ni su éxito ni su error cuentan
+        self.assertEqual(tareas.terminar(lento, {lento[1].pk: "tarde"}), (0, 0, 0))
+        self.assertEqual(
+            set(Tarea.objects.values_list("estado", "reservada_por", "ultimo_error")),
+            {(Tarea.Estado.EN_CURSO, rapido[0].reservada_por, "")},
+        )
+
+        self.assertEqual(tareas.terminar(rapido, {rapido[1].pk: "error"}), (1, 1, 0))
+        self.assertEqual(Tarea.objects.get(pk=rapido[0].pk).estado, Tarea.Estado.HECHA)
+
+
+class PrecalentarDisponibilidadTests(SalonTestCase):
+    def precalentar(self, *args):
+        salida, errores = StringIO(), StringIO()
+        call_command("precalentar_disponibilidad", "--procesos", "1", *args, stdout=salida, stderr=errores)
+        return salida.getvalue(), errores.getvalue()
+
+    def test_deja_los_dias_en_cache(self):
+        dia = proximo_laborable()
+        dias = (dia - timezone.localdate()).days + 1
+        salida, _ = self.precalentar("--dias", str(dias))
+        self.assertIn(f"{dias} días precalculados (1 peluqueros × {dias} días, 1 duraciones", salida)
+
+        esperado = BloqueAgenda([self.peluquero.pk], dia, dia).mascaras_dia(self.peluquero.pk, dia)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(mascaras_dias([(self.peluquero.pk, dia)]), {(self.peluquero.pk, dia): esperado})
+        self.assertEqual(len(consultas), 0)
+
+        # Una cita nueva invalida solo su día
+        self.cita(fecha=dia, hora=time(10, 0))
+        with CaptureQueriesContext(connection) as consultas:
+            libre, ocupado = mascaras_dias([(self.peluquero.pk, dia)])[(self.peluquero.pk, dia)]
+        self.assertGreater(len(consultas), 0)
+        self.assertNotIn(time(10, 0), horas_de_mascara(libre & ~ocupado))
+        self.assertIn(time(10, 0), horas_de_mascara(esperado[0] & ~esperado[1]))
+
+        # Y un cambio de horario, todos los días del peluquero
+        self.precalentar("--dias", str(dias))
+        for horario in HorarioPeluquero.objects.filter(peluquero=self.peluquero, hora_inicio=time(15, 0)):
+            horario.activo = False
+            horario.save()
+        libre, ocupado = mascaras_dias([(self.peluquero.pk, dia)])[(self.peluquero.pk, dia)]
+        self.assertNotIn(time(16, 0), horas_de_mascara(libre & ~ocupado))
+
+    def test_opciones(self):
+        for args in (("--dias", "0"), ("--procesos", "0")):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                self.precalentar(*args)
+        salida, errores = self.precalentar("--dias", "1", "--peluquero", str(self.peluquero.pk + 1))
+        self.assertIn("nada que calcular", salida)
+        self.assertIn("LocMemCache", errores)
+
+
+class RecordatoriosTests(SalonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dia = proximo_laborable()
+        self.otro = Cliente.objects.create(nombre="Carmen", apellido="Prueba", email="carmen@example.com")
+        sin_email = Cliente.objects.create(nombre="Dora", apellido="Prueba")
+        self.citas = [
+            self.cita(fecha=self.dia, hora=time(10, 0)),
+            self.cita(fecha=self.dia, hora=time(11, 0), cliente=self.otro),
+            self.cita(fecha=self.dia, hora=time(12, 0), cliente=sin_email),
+            self.cita(fecha=self.dia, hora=time(16, 0), estado=Cita.Estado.CANCELADA),
+        ]
+
+    def procesar(self):
+        return tareas.procesar_lote(recordatorios.TIPO)
+
+    def test_encolar_dos_veces_no_duplica(self):
+        call_command("programar_recordatorios", "--fecha", self.dia.isoformat(), stdout=StringIO())
+        call_command("programar_recordatorios", "--fecha", self.dia.isoformat(), stdout=StringIO())
+        self.assertEqual(
+            sorted(Tarea.objects.values_list("datos__cita_id", flat=True)), [self.citas[0].pk, self.citas[1].pk]
+        )
+        with self.assertRaises(CommandError):
+            call_command("programar_recordatorios", "--fecha", "mañana", stdout=StringIO())
+
+    def test_un_lote_por_una_conexion(self):
+        recordatorios.programar_recordatorios(self.dia)
+        with mock.patch("Principal.recordatorios.get_connection", wraps=get_connection) as conexion:
+            self.assertEqual(self.procesar(), (2, 0, 0))
+        self.assertEqual(conexion.call_count, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["berta@example.com", "carmen@example.com"])
+        self.assertIn("a las 10:00", next(m.subject for m in mail.outbox if m.to == ["berta@example.com"]))
+        self.assertEqual(set(Tarea.objects.values_list("estado", flat=True)), {Tarea.Estado.HECHA})
+
+    def test_no_avisa_de_citas_canceladas_movidas_o_pasadas(self):
+        recordatorios.programar_recordatorios(self.dia)
+        ayer = timezone.localdate() - timedelta(days=1)
+        self.cita(fecha=ayer, hora=time(10, 0))
+        recordatorios.programar_recordatorios(ayer)
+
+        cancelada, movida = self.citas[0], self.citas[1]
+        cancelada.estado = Cita.Estado.CANCELADA
+        cancelada.save()
+        movida.fecha = proximo_laborable((self.dia - timezone.localdate()).days + 1)
+        movida.save()
+
+        self.assertEqual(self.procesar(), (3, 0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_un_envio_que_falla_se_reintenta_sin_tumbar_el_lote(self):
+        recordatorios.programar_recordatorios(self.dia)
+        enviar = locmem.EmailBackend.send_messages
+
+        def fallar_a_carmen(backend, mensajes):
+            if mensajes[0].to == ["carmen@example.com"]:
+                raise ConnectionError("buzón lleno")
+            return enviar(backend, mensajes)
+
+        with mock.patch.object(locmem.EmailBackend, "send_messages", autospec=True, side_effect=fallar_a_carmen):
+            self.assertEqual(self.procesar(), (1, 1, 0))
+        self.assertEqual([m.to for m in mail.outbox], [["berta@example.com"]])
+        tarea = Tarea.objects.get(datos__cita_id=self.citas[1].pk)
+        self.assertEqual(
+            (tarea.estado, tarea.ultimo_error, tarea.intentos),
+            (Tarea.Estado.PENDIENTE, "ConnectionError: buzón lleno", 1),
+        )
+        self.assertAlmostEqual((tarea.disponible_en - timezone.now()).total_seconds(), tareas.ESPERA_BASE, delta=5)
+
+
+# --- Rendimiento -----------------------------------------------------------
+
+
+def medir(funcion, rondas, preparar=None):
+    """Tiempos en segundos de `rondas` llamadas; `preparar` va antes de cada una, sin medir."""
+    tiempos = []
+    for _ in range(rondas):
+        if preparar:
+            preparar()
+        inicio = reloj.perf_counter()
+        funcion()
+        tiempos.append(reloj.perf_counter() - inicio)
+    return tiempos
+
+
+def contar_consultas(funcion, preparar=None):
+    if preparar:
+        preparar()
+    with CaptureQueriesContext(connection) as consultas:
+        funcion()
+    return len(consultas)
+
+
+@skipUnless(os.environ.get("BENCHMARK"), "BENCHMARK=1 para medir")
+class RendimientoDisponibilidadTests(TestCase):
+    """Tiempos por escenario, al estilo de pytest-benchmark (en microsegundos).
+
+    `BENCHMARK_RONDAS` cambia el número de rondas (200 por defecto).
+    """
+
+    def test_rendimiento(self):
+        rondas = int(os.environ.get("BENCHMARK_RONDAS", 200))
+        cache.clear()
+        peluqueros, servicios, fechas = generar_agenda(random.Random(0), timezone.localdate(), 8, 30)
+        hoy = timezone.localdate()
+        futuras = [f for f in fechas if f >= hoy]
+        peluquero, fecha = peluqueros[0], futuras[3]
+        servicio = next(s for s in servicios if s.duracion_minutos == 45)
+        cita = Cita.objects.activas().filter(peluquero=peluquero, fecha=fecha).first()
+        consultas = [(p.pk, f, 45) for p in peluqueros for f in futuras]
+
+        def horas(**kwargs):
+            return lambda: get_horas_disponibles(peluquero=peluquero, fecha=fecha, servicio=servicio, **kwargs)
+
+        def agenda():
+            bloque = BloqueAgenda([p.pk for p in peluqueros], hoy, futuras[-1])
+            return [bloque.horas_disponibles(p.pk, f, 45) for p in peluqueros for f in futuras]
+
+        lote = lambda: mascaras_disponibles_lote(consultas)
+        escenarios = [
+            ("get_horas_disponibles (caché caliente)", horas(), None),
+            ("get_horas_disponibles (caché fría)", horas(), cache.clear),
+            ("get_horas_disponibles (excluyendo cita)", horas(exclude_cita_pk=cita.pk if cita else -1), None),
+            (f"BloqueAgenda {len(peluqueros)} peluqueros x {len(futuras)} días", agenda, None),
+            (f"mascaras_disponibles_lote {len(consultas)} (caché caliente)", lote, None),
+            (f"mascaras_disponibles_lote {len(consultas)} (caché fría)", lote, cache.clear),
+        ]
+
+        filas = []
+        for nombre, funcion, preparar in escenarios:
+            funcion()  # calentamiento
+            tiempos = [t * 1e6 for t in medir(funcion, rondas, preparar)]
+            media = statistics.fmean(tiempos)
+            filas.append(
+                (
+                    nombre,
+                    min(tiempos),
+                    max(tiempos),
+                    media,
+                    statistics.stdev(tiempos) if len(tiempos) > 1 else 0.0,
+                    statistics.median(tiempos),
+                    1e6 / media,
+                    len(tiempos),
+                    contar_consultas(funcion, preparar),
+                )
+            )
+
+        ancho = max(len(f[0]) for f in filas)
+        cabecera = ("Min", "Max", "Mean", "StdDev", "Median", "OPS", "Rounds", "Queries")
+        lineas = [f"{'Name (time in us)':<{ancho}}" + "".join(f"{c:>12}" for c in cabecera)]
+        for nombre, *valores in filas:
+            numeros = "".join(f"{v:>12.1f}" for v in valores[:6])
+            lineas.append(f"{nombre:<{ancho}}{numeros}{valores[6]:>12}{valores[7]:>12}")
+        sys.stderr.write("\n" + "\n".join(lineas) + "\n")
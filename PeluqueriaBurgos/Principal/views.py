@@ -1,11 +1,46 @@
+import json
+from datetime import date, timedelta
+
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.utils.dateparse import parse_date
-from django.views.decorators.http import require_GET
-
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_time
+from django.views.decorators.cache import cache_page
+from django.views.decorators.http import require_GET, require_POST
+
+from .archivo import historial_de_cliente
+from .busqueda import backend as busqueda
+from .cambios import cambios_desde
+from .catalogo import catalogo_reserva, datos_reserva
+from .clientes import cliente_id_de
+from .disponibilidad import (
+    APERTURA,
+    HORIZONTE_DIAS,
+    PASO,
+    BloqueAgenda,
+    buscar_proximas_horas,
+    horas_de_mascara,
+    mascaras_disponibles_lote,
+)
 from .forms import CitaForm
-from .models import Cita, Cliente, Peluqueros, Servicio, get_horas_disponibles
+from .limites import limitar
+from .models import Cambio, Cita, Cliente, Peluqueros, Servicio, _servicio_duracion_minutos, get_mascara_disponible
+from .retenciones import DURACION_RETENCION, liberar, retener, retenida_por_otro, titular_de
+
+MAX_CONSULTAS_LOTE = 200
+
+# Formato compacto de disponibilidad: una máscara de bits por día (bit i =
+# APERTURA + i*PASO minutos) en vez de la lista de horas "HH:MM".
+TIPO_MASCARA = "application/vnd.peluqueria.mascara+json"
+
+
+def _formato_mascara(request):
+    """True si se pide el formato compacto (?format=mascara o cabecera Accept)."""
+    if "format" in request.GET:
+        return request.GET["format"] == "mascara"
+    return TIPO_MASCARA in request.headers.get("Accept", "")
 
 
 @login_required
@@ -14,21 +49,24 @@ def principal(request):
     return render(request, "principal.html")
 
 
-def _get_or_create_cliente_for_user(user):
-    """Obtiene (o crea) el Cliente asociado al usuario autenticado.
+def _contexto_formulario(form, titulo):
+    """Contexto del formulario de cita con los datos de arranque del JS."""
+    return {"form": form, "titulo": titulo, "reserva_inicial": datos_reserva()}
 
-    Así el proyecto funciona sin tener que dar de alta el Cliente manualmente
-    en el admin cada vez.
-    """
-    cliente, _ = Cliente.objects.get_or_create(
-        user=user,
-        defaults={
-            "nombre": user.first_name or user.username,
-            "apellido": user.last_name or "",
-            "email": user.email or "",
-        },
-    )
-    return cliente
+
+def _respeta_retenciones(request, form):
+    """False (con el error en el formulario) si otro cliente retiene esa hora."""
+    datos = form.cleaned_data
+    if retenida_por_otro(
+        titular_de(request.user),
+        datos["peluquero"].pk,
+        datos["fecha"],
+        datos["hora"],
+        _servicio_duracion_minutos(datos["servicio"]),
+    ):
+        form.add_error("hora", "Otro cliente está reservando esa hora ahora mismo. Elige otra.")
+        return False
+    return True
 
 
 @login_required
@@ -42,32 +80,46 @@ def reservas(request):
 
 @login_required
 def mis_citas(request):
-    """Listado de citas del cliente autenticado."""
-    cliente = _get_or_create_cliente_for_user(request.user)
-    citas = Cita.objects.filter(cliente=cliente).order_by("-fecha", "-hora")
-    return render(request, "citas/mis_citas.html", {"citas": citas})
+    """Listado de citas del cliente autenticado.
+
+    Con ?historial=1 añade las citas antiguas archivadas (CitaHistorica).
+    """
+    cliente_id = cliente_id_de(request)
+    citas = (
+        Cita.objects.filter(cliente_id=cliente_id)
+        .select_related("servicio", "peluquero")
+        .order_by("-fecha", "-hora")
+    )
+
+    historial = request.GET.get("historial") == "1"
+    if historial:
+        citas = sorted(
+            [*citas, *historial_de_cliente(cliente_id)],
+            key=lambda c: (c.fecha, c.hora),
+            reverse=True,
+        )
+    return render(request, "citas/mis_citas.html", {"citas": citas, "historial": historial})
 
 
 @login_required
 def cita_create(request):
     """Crear una nueva cita para el cliente autenticado."""
-    cliente = _get_or_create_cliente_for_user(request.user)
-
     if request.method == "GET":
-        form = CitaForm()
-        return render(request, "citas/cita_form.html", {"form": form, "titulo": "Nueva cita"})
+        form = CitaForm(titular=titular_de(request.user))
+        return render(request, "citas/cita_form.html", _contexto_formulario(form, "Nueva cita"))
 
     if request.method == "POST":
-        form = CitaForm(data=request.POST)
-        if form.is_valid():
+        form = CitaForm(data=request.POST, titular=titular_de(request.user))
+        if form.is_valid() and _respeta_retenciones(request, form):
             cita = form.save(commit=False)
-            cita.cliente = cliente
+            cita.cliente_id = cliente_id_de(request)
             # Aplicar reglas de negocio del modelo (clean)
             cita.full_clean()
             cita.save()
+            liberar(titular_de(request.user))
             return redirect("mis_citas")
 
-        return render(request, "citas/cita_form.html", {"form": form, "titulo": "Nueva cita"})
+        return render(request, "citas/cita_form.html", _contexto_formulario(form, "Nueva cita"))
 
 
 @login_required
@@ -76,23 +128,23 @@ def cita_update(request, pk=None):
 
     Solo se permite acceder si la cita pertenece al cliente.
     """
-    cliente = _get_or_create_cliente_for_user(request.user)
-    cita = get_object_or_404(Cita, pk=pk, cliente=cliente)
+    cita = get_object_or_404(Cita, pk=pk, cliente_id=cliente_id_de(request))
 
     if request.method == "GET":
-        form = CitaForm(instance=cita)
-        return render(request, "citas/cita_form.html", {"form": form, "titulo": "Editar cita"})
+        form = CitaForm(instance=cita, titular=titular_de(request.user))
+        return render(request, "citas/cita_form.html", _contexto_formulario(form, "Editar cita"))
 
     if request.method == "POST":
-        form = CitaForm(data=request.POST, instance=cita)
-        if form.is_valid():
+        form = CitaForm(data=request.POST, instance=cita, titular=titular_de(request.user))
+        if form.is_valid() and _respeta_retenciones(request, form):
             cita = form.save(commit=False)
             # cliente ya está asignado y filtrado por seguridad
             cita.full_clean()
             cita.save()
+            liberar(titular_de(request.user))
             return redirect("mis_citas")
 
-        return render(request, "citas/cita_form.html", {"form": form, "titulo": "Editar cita"})
+        return render(request, "citas/cita_form.html", _contexto_formulario(form, "Editar cita"))
 
 
 @login_required
@@ -101,14 +153,14 @@ def cita_cancelar(request, pk=None):
 
     No se borra de la BD, solo se cambia el estado.
     """
-    cliente = _get_or_create_cliente_for_user(request.user)
-    cita = get_object_or_404(Cita, pk=pk, cliente=cliente)
+    cita = get_object_or_404(Cita, pk=pk, cliente_id=cliente_id_de(request))
     cita.estado = Cita.Estado.CANCELADA
     cita.save()
     return redirect("mis_citas")
 
 
 @login_required
+@limitar("api")
 @require_GET
 def api_peluqueros_por_servicio(request):
     """Devuelve peluqueros que realizan un servicio (JSON)."""
@@ -135,6 +187,22 @@ def api_peluqueros_por_servicio(request):
 
 
 @login_required
+@limitar("api")
+@require_GET
+def api_reserva_inicial(request):
+    """Datos de arranque del formulario de reserva (JSON).
+
+    Servicios activos, peluqueros por servicio y próximos días con hueco
+    de cada servicio y peluquero, en una sola petición: el formulario filtra
+    en el navegador sin volver a pedirlos.
+    """
+    response = JsonResponse(datos_reserva())
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+
+@login_required
+@limitar("api")
 @require_GET
 def api_horas_disponibles(request):
     """Devuelve horas disponibles (JSON) para un servicio + peluquero + fecha."""
@@ -153,10 +221,449 @@ def api_horas_disponibles(request):
     if not servicio or not peluquero:
         return JsonResponse({"error": "servicio/peluquero no encontrado"}, status=404)
 
-    horas = get_horas_disponibles(
+    mascara = get_mascara_disponible(
         peluquero=peluquero,
         fecha=fecha,
         servicio=servicio,
+        titular=titular_de(request.user),
     )
 
-    return JsonResponse({"horas": [h.strftime("%H:%M") for h in horas]})
+    if _formato_mascara(request):
+        response = JsonResponse(
+            {"formato": "mascara", "apertura": APERTURA.strftime("%H:%M"), "paso": PASO, "mascara": mascara}
+        )
+    else:
+        response = JsonResponse({"horas": [h.strftime("%H:%M") for h in horas_de_mascara(mascara)]})
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+@login_required
+@limitar("api")
+@require_GET
+def api_proxima_cita(request):
+    """Devuelve los primeros huecos libres para un servicio (JSON).
+
+    Si se indica peluquero_id busca solo en su agenda; si no, en la de
+    todos los peluqueros que realizan el servicio.
+    """
+    try:
+        servicio_id = int(request.GET.get("servicio_id"))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "servicio_id inválido"}, status=400)
+
+    try:
+        limite = min(max(int(request.GET.get("limite", 5)), 1), 20)
+    except ValueError:
+        return JsonResponse({"error": "limite inválido"}, status=400)
+
+    servicio = Servicio.objects.filter(pk=servicio_id).first()
+    if not servicio:
+        return JsonResponse({"error": "servicio no encontrado"}, status=404)
+
+    peluquero = None
+    if request.GET.get("peluquero_id"):
+        try:
+            peluquero = Peluqueros.objects.filter(pk=int(request.GET["peluquero_id"])).first()
+        except ValueError:
+            return JsonResponse({"error": "peluquero_id inválido"}, status=400)
+        if not peluquero:
+            return JsonResponse({"error": "peluquero no encontrado"}, status=404)
+
+    huecos = buscar_proximas_horas(servicio=servicio, peluquero=peluquero, limite=limite)
+
+    return JsonResponse(
+        {
+            "huecos": [
+                {
+                    "fecha": fecha.isoformat(),
+                    "hora": hora.strftime("%H:%M"),
+                    "peluquero_id": p.id,
+                    "peluquero": f"{p.nombre} {p.apellido}".strip(),
+                }
+                for fecha, p, hora in huecos
+            ]
+        }
+    )
+
+
+@login_required
+@limitar("api")
+@require_POST
+def api_horas_disponibles_lote(request):
+    """Horas disponibles para muchos (peluquero, fecha, servicio) a la vez (JSON).
+
+    Recibe {"consultas": [{"peluquero_id": .., "fecha": "AAAA-MM-DD",
+    "servicio_id": ..}, ...]} y devuelve un resultado por consulta, en el
+    mismo orden, calculados con un número fijo de consultas a la BD.
+    """
+    try:
+        consultas = json.loads(request.body)["consultas"]
+        if not isinstance(consultas, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "cuerpo JSON inválido"}, status=400)
+
+    if len(consultas) > MAX_CONSULTAS_LOTE:
+        return JsonResponse(
+            {"error": f"máximo {MAX_CONSULTAS_LOTE} consultas por petición"},
+            status=400,
+        )
+
+    leidas = []
+    for consulta in consultas:
+        try:
+            leidas.append(
+                (
+                    int(consulta["peluquero_id"]),
+                    parse_date(consulta["fecha"]),
+                    int(consulta["servicio_id"]),
+                )
+            )
+        except (KeyError, TypeError, ValueError):
+            leidas.append(None)
+
+    servicios = Servicio.objects.in_bulk({c[2] for c in leidas if c})
+    peluquero_ids = set(
+        Peluqueros.objects.filter(pk__in={c[0] for c in leidas if c}).values_list("pk", flat=True)
+    )
+
+    validas = []
+    resultados = []
+    for consulta, leida in zip(consultas, leidas):
+        if not leida or not leida[1]:
+            resultados.append({"error": "consulta inválida"})
+            continue
+        peluquero_id, fecha, servicio_id = leida
+        resultado = {
+            "peluquero_id": peluquero_id,
+            "fecha": fecha.isoformat(),
+            "servicio_id": servicio_id,
+        }
+        if servicio_id not in servicios or peluquero_id not in peluquero_ids:
+            resultado["error"] = "servicio/peluquero no encontrado"
+        else:
+            validas.append((resultado, (peluquero_id, fecha, _servicio_duracion_minutos(servicios[servicio_id]))))
+        resultados.append(resultado)
+
+    mascaras = mascaras_disponibles_lote((c for _, c in validas), titular=titular_de(request.user))
+    compacto = _formato_mascara(request)
+    for (resultado, _), mascara in zip(validas, mascaras):
+        if compacto:
+            resultado["mascara"] = mascara
+        else:
+            resultado["horas"] = [h.strftime("%H:%M") for h in horas_de_mascara(mascara)]
+
+    datos = {"resultados": resultados}
+    if compacto:
+        datos.update({"formato": "mascara", "apertura": APERTURA.strftime("%H:%M"), "paso": PASO})
+    response = JsonResponse(datos)
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+@login_required
+@limitar("api")
+@require_POST
+def api_retener_hora(request):
+    """Retiene unos minutos una hora mientras el cliente confirma la cita (JSON).
+
+    Recibe {"peluquero_id", "fecha", "hora", "servicio_id"}. Responde 409 si
+    la hora ya no está libre o la retiene otro cliente. Solo usa la caché.
+    """
+    try:
+        datos = json.loads(request.body)
+        peluquero_id = int(datos["peluquero_id"])
+        servicio_id = int(datos["servicio_id"])
+        fecha = parse_date(datos["fecha"])
+        hora = parse_time(datos["hora"])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "cuerpo JSON inválido"}, status=400)
+    if not fecha or not hora:
+        return JsonResponse({"error": "fecha/hora inválida"}, status=400)
+
+    servicio = Servicio.objects.filter(pk=servicio_id).first()
+    peluquero = Peluqueros.objects.filter(pk=peluquero_id).first()
+    if not servicio or not peluquero:
+        return JsonResponse({"error": "servicio/peluquero no encontrado"}, status=404)
+
+    titular = titular_de(request.user)
+    libres = horas_de_mascara(
+        get_mascara_disponible(peluquero=peluquero, fecha=fecha, servicio=servicio, titular=titular)
+    )
+    if hora not in libres or not retener(
+        titular, peluquero.pk, fecha, hora, _servicio_duracion_minutos(servicio)
+    ):
+        return JsonResponse({"error": "la hora ya no está disponible"}, status=409)
+
+    return JsonResponse({"retenida": True, "segundos": DURACION_RETENCION})
+
+
+@login_required
+@limitar("api")
+@require_POST
+def api_liberar_hora(request):
+    """Suelta la hora retenida por el cliente, si tiene alguna (JSON)."""
+    liberar(titular_de(request.user))
+    return JsonResponse({"liberada": True})
+
+
+@login_required
+@limitar("api")
+@require_GET
+def api_recepcion_buscar(request):
+    """Búsqueda rápida de clientes para recepción (solo personal, JSON).
+
+    Busca por nombre, apellidos, email o teléfono (sin acentos, por prefijo)
+    y devuelve cada cliente con su próxima cita pendiente.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({"error": "solo para el personal"}, status=403)
+
+    texto = (request.GET.get("q") or "").strip()
+    try:
+        limite = min(max(int(request.GET.get("limite", 20)), 1), 50)
+    except ValueError:
+        return JsonResponse({"error": "limite inválido"}, status=400)
+    if not texto:
+        return JsonResponse({"clientes": []})
+
+    ids = busqueda().buscar(texto, limite)
+    encontrados = Cliente.objects.in_bulk(ids)
+
+    proximas = {}
+    for cita in (
+        Cita.objects.filter(cliente_id__in=ids, estado=Cita.Estado.PENDIENTE, fecha__gte=timezone.localdate())
+        .select_related("peluquero", "servicio")
+        .order_by("cliente_id", "fecha", "hora")
+    ):
+        proximas.setdefault(cita.cliente_id, cita)
+
+    clientes = []
+    for pk in ids:
+        cliente = encontrados.get(pk)
+        if cliente is None:
+            continue
+        cita = proximas.get(pk)
+        clientes.append(
+            {
+                "id": cliente.pk,
+                "nombre": cliente.nombre,
+                "apellido": cliente.apellido,
+                "telefono": cliente.telefono,
+                "email": cliente.email,
+                "proxima_cita": (
+                    {
+                        "id": cita.pk,
+                        "fecha": cita.fecha.isoformat(),
+                        "hora": cita.hora.strftime("%H:%M"),
+                        "peluquero": str(cita.peluquero),
+                        "servicio": cita.servicio.nombre if cita.servicio else None,
+                    }
+                    if cita
+                    else None
+                ),
+            }
+        )
+    return JsonResponse({"clientes": clientes})
+
+
+MAX_CAMBIOS = 500
+
+
+@login_required
+@limitar("api")
+@require_GET
+def api_cambios(request):
+    """Cambios de citas, turnos y horarios posteriores a un cursor (solo personal, JSON).
+
+    `after` es el cursor devuelto en la respuesta anterior (0 la primera vez);
+    mientras `hay_mas` sea true se pide la página siguiente con `siguiente`.
+    Opcional: `modelo` (CITA, TURNO, HORARIO; varios separados por comas).
+    Fuera de SQLite los cambios se sirven con unos segundos de retraso
+    (ver MARGEN_VISIBILIDAD en cambios).
+    """
+    if not request.user.is_staff:
+        return JsonResponse({"error": "solo para el personal"}, status=403)
+
+    try:
+        cursor = max(int(request.GET.get("after", 0)), 0)
+        limite = min(max(int(request.GET.get("limite", 100)), 1), MAX_CAMBIOS)
+    except ValueError:
+        return JsonResponse({"error": "after/limite inválido"}, status=400)
+
+    modelos = [m for m in request.GET.get("modelo", "").upper().split(",") if m]
+    if any(m not in Cambio.Modelo.values for m in modelos):
+        return JsonResponse({"error": "modelo inválido"}, status=400)
+
+    cambios = cambios_desde(cursor, limite + 1, modelos)
+    hay_mas = len(cambios) > limite
+    cambios = cambios[:limite]
+    return JsonResponse(
+        {
+            "cambios": [
+                {
+                    "cursor": c.pk,
+                    "modelo": c.modelo,
+                    "id": c.objeto_id,
+                    "accion": c.accion,
+                    "fecha": c.creado_en.isoformat(),
+                    "datos": c.datos,
+                }
+                for c in cambios
+            ],
+            "siguiente": cambios[-1].pk if cambios else cursor,
+            "hay_mas": hay_mas,
+        }
+    )
+
+
+# --- API pública ---------------------------------------------------------
+#
+# Solo lectura y sin sesión: estas vistas no tocan request.user ni
+# request.session, así que la respuesta es la misma para todos y un proxy
+# (o la caché por vista de Django) puede servirla sin llegar al ORM. Las
+# respuestas de horas caducan en segundos y la reserva se vuelve a validar
+# al guardar; además llevan Surrogate-Key para que una CDN pueda purgarlas
+# antes: al cambiar la agenda de un peluquero un día basta purgar
+# `peluquero-<id>-<AAAA-MM-DD>` (sus horas) y `peluquero-<id>-<AAAA-MM>`
+# (la densidad de ese mes).
+
+MAX_AGE_PUBLICA_CATALOGO = 300
+MAX_AGE_PUBLICA_HORAS = 30
+
+
+def _respuesta_publica(datos, max_age, claves=(), status=200):
+    response = JsonResponse(datos, status=status)
+    if status == 200:
+        patch_cache_control(response, public=True, max_age=max_age)
+        response["Surrogate-Control"] = f"max-age={max_age}"
+        if claves:
+            response["Surrogate-Key"] = " ".join(claves)
+    return response
+
+
+def _claves_agenda(peluquero_id, fecha=None, mes=None):
+    """Surrogate keys de la agenda de un peluquero: entera y de un día o de un mes (AAAA-MM)."""
+    claves = [f"peluquero-{peluquero_id}"]
+    if fecha:
+        claves += [f"dia-{fecha.isoformat()}", f"peluquero-{peluquero_id}-{fecha.isoformat()}"]
+    if mes:
+        claves += [f"mes-{mes}", f"peluquero-{peluquero_id}-{mes}"]
+    return claves
+
+
+def _servicio_publico(request, catalogo):
+    """Servicio activo pedido en ?servicio_id= (dict del catálogo) o None."""
+    try:
+        servicio_id = int(request.GET.get("servicio_id"))
+    except (TypeError, ValueError):
+        return None
+    return next((s for s in catalogo["servicios"] if s["id"] == servicio_id), None)
+
+
+@require_GET
+@cache_page(MAX_AGE_PUBLICA_CATALOGO, key_prefix="api-publica")
+@limitar("api_publica", por_ip=True)
+def api_publica_peluqueros(request):
+    """Peluqueros que realizan un servicio activo (JSON público)."""
+    catalogo = catalogo_reserva()
+    servicio = _servicio_publico(request, catalogo)
+    if not servicio:
+        return _respuesta_publica({"error": "servicio no encontrado"}, 0, status=404)
+
+    ids = catalogo["peluqueros_por_servicio"][str(servicio["id"])]
+    return _respuesta_publica(
+        {
+            "servicio": servicio,
+            "peluqueros": [{"id": pid, "nombre": catalogo["peluqueros"][str(pid)]} for pid in ids],
+        },
+        MAX_AGE_PUBLICA_CATALOGO,
+        ["catalogo", f"servicio-{servicio['id']}"],
+    )
+
+
+@require_GET
+@cache_page(MAX_AGE_PUBLICA_HORAS, key_prefix="api-publica")
+@limitar("api_publica", por_ip=True)
+def api_publica_horas(request):
+    """Horas libres de un peluquero un día para un servicio (JSON público).
+
+    Con ?format=mascara devuelve la máscara de bits en vez de las horas.
+    Solo acepta fechas dentro del horizonte de reserva.
+    """
+    catalogo = catalogo_reserva()
+    servicio = _servicio_publico(request, catalogo)
+    try:
+        peluquero_id = int(request.GET.get("peluquero_id"))
+    except (TypeError, ValueError):
+        peluquero_id = None
+    if not servicio or peluquero_id not in catalogo["peluqueros_por_servicio"][str(servicio["id"])]:
+        return _respuesta_publica({"error": "servicio/peluquero no encontrado"}, 0, status=404)
+
+    hoy = timezone.localdate()
+    fecha = parse_date(request.GET.get("fecha") or "")
+    if not fecha or not hoy <= fecha < hoy + timedelta(days=HORIZONTE_DIAS):
+        return _respuesta_publica({"error": "fecha inválida o fuera de plazo"}, 0, status=400)
+
+    (mascara,) = mascaras_disponibles_lote([(peluquero_id, fecha, servicio["duracion_minutos"] or 30)])
+    if request.GET.get("format") == "mascara":
+        datos = {"formato": "mascara", "apertura": APERTURA.strftime("%H:%M"), "paso": PASO, "mascara": mascara}
+    else:
+        datos = {"horas": [h.strftime("%H:%M") for h in horas_de_mascara(mascara)]}
+    return _respuesta_publica(datos, MAX_AGE_PUBLICA_HORAS, _claves_agenda(peluquero_id, fecha=fecha))
+
+
+@require_GET
+@cache_page(MAX_AGE_PUBLICA_HORAS, key_prefix="api-publica")
+@limitar("api_publica", por_ip=True)
+def api_publica_densidad(request):
+    """Huecos libres por día de un mes para un servicio (JSON público).
+
+    Suma los de todos los peluqueros que lo realizan, o solo los del
+    indicado en ?peluquero_id=. Solo acepta meses que toquen el horizonte
+    de reserva, y los días fuera de él no aparecen.
+    """
+    catalogo = catalogo_reserva()
+    servicio = _servicio_publico(request, catalogo)
+    if not servicio:
+        return _respuesta_publica({"error": "servicio no encontrado"}, 0, status=404)
+
+    ids = catalogo["peluqueros_por_servicio"][str(servicio["id"])]
+    if request.GET.get("peluquero_id"):
+        try:
+            peluquero_id = int(request.GET["peluquero_id"])
+        except ValueError:
+            peluquero_id = None
+        if peluquero_id not in ids:
+            return _respuesta_publica({"error": "peluquero no encontrado"}, 0, status=404)
+        ids = [peluquero_id]
+
+    try:
+        anio, mes = map(int, request.GET.get("mes", "").split("-"))
+        primero = date(anio, mes, 1)
+    except ValueError:
+        return _respuesta_publica({"error": "mes inválido (AAAA-MM)"}, 0, status=400)
+
+    hoy = timezone.localdate()
+    if not hoy.replace(day=1) <= primero < hoy + timedelta(days=HORIZONTE_DIAS):
+        return _respuesta_publica({"error": "mes fuera de plazo"}, 0, status=400)
+    siguiente = (primero + timedelta(days=31)).replace(day=1)
+
+    desde = max(primero, hoy)
+    hasta = min(siguiente, hoy + timedelta(days=HORIZONTE_DIAS)) - timedelta(days=1)
+
+    dias = {}
+    if ids and desde <= hasta:
+        duracion = servicio["duracion_minutos"] or 30
+        bloque = BloqueAgenda(ids, desde, hasta)
+        fecha = desde
+        while fecha <= hasta:
+            dias[fecha.isoformat()] = sum(
+                bloque.mascara_disponible(pid, fecha, duracion).bit_count() for pid in ids
+            )
+            fecha += timedelta(days=1)
+
+    mes_iso = f"{primero:%Y-%m}"
+    claves = list(dict.fromkeys(clave for pid in ids for clave in _claves_agenda(pid, mes=mes_iso)))
+    return _respuesta_publica({"mes": mes_iso, "dias": dias}, MAX_AGE_PUBLICA_HORAS, claves)